@@ -1,31 +1,90 @@
+import os
+import queue
+import threading
+import time
 import tkinter as tk
-from tkinter import messagebox
+from tkinter import messagebox, ttk
 from datetime import date # for working with dates
-from data_layer import *
-from business_model import *  # Importing everything from business_model
+from booking_engine import BookingEngine
+from kiosk_server import KioskClient
+from virtual_table import Column, VirtualTable
 
 class AdventureLandApp:
-    def __init__(self, root):
+    def __init__(self, root, fast_boot=True):
+        self.started = time.perf_counter()
+        self.timings = {}  # Startup step -> seconds, printed once the data is ready
         self.root = root
         self.root.title("Adventure Land Theme Park")
         self.root.geometry("1000x800")
-        self.logged_in_user = None
-        self.logged_in_admin = None
-        self.data_layer = DataLayer()  # Use DataLayer for persistence
-        self.data = self.data_layer.load_all()  # Load all entities
-        self.business_model = self  # Use the current class to interact with the business model methods
+        self.session = None  # Session token of the logged-in customer or admin
+        self.ready = False  # Set once the booking engine has loaded the data
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+        # The business rules run in a booking engine: a local one over the data directory (storage engine picked with
+        # DATA_LAYER_BACKEND), or a kiosk server's when ADVENTURE_LAND_SERVER=host:port is set; both have the same methods
+        server = os.environ.get("ADVENTURE_LAND_SERVER")
+        self.business_model = KioskClient.from_address(server) if server else BookingEngine()
         self.fix_checkout_cart()  # Call the fix_checkout_cart method
-        self.create_login_page()
-        self.data_layer.initialize_files()
+        if fast_boot:
+            # Draw the login page straight away and load the entities on a background thread
+            self.loading_queue = queue.Queue()
+            self.create_login_page()
+            self.root.update_idletasks()
+            self.timings["first paint"] = time.perf_counter() - self.started
+            threading.Thread(target=self.load_in_background, name="startup-loader", daemon=True).start()
+            self.root.after(50, self.poll_loading)
+        else:
+            self.load_data()
+            self.finish_loading()
+            self.create_login_page()
+            self.root.update_idletasks()
+            self.timings["first paint"] = time.perf_counter() - self.started
+            self.print_startup_timings()
+    def load_data(self, progress=None):
+        """Load the entities and seed the catalog (nothing to do when connected to a server), timing each step."""
+        self.business_model.start(progress=progress)
+        self.timings.update(self.business_model.timings)
+    def load_in_background(self):
+        # Tk is not thread-safe, so the loader only posts messages for poll_loading to apply
+        try:
+            self.load_data(progress=lambda fraction, message: self.loading_queue.put(("progress", fraction, message)))
+            self.loading_queue.put(("done",))
+        except Exception as e:
+            self.loading_queue.put(("error", e))
+    def poll_loading(self):
+        try:
+            while True:
+                message = self.loading_queue.get_nowait()
+                if message[0] == "progress":
+                    if self.progress_bar.winfo_exists():
+                        self.progress_bar["value"] = message[1] * 100
+                        self.progress_label.config(text=f"{message[2]}...")
+                elif message[0] == "done":
+                    self.finish_loading()
+                    self.print_startup_timings()
+                    return
+                else:
+                    self.progress_label.config(text="Loading failed.")
+                    messagebox.showerror("Error", f"The data could not be loaded: {message[1]}")
+                    return
+        except queue.Empty:
+            pass
+        self.root.after(50, self.poll_loading)
+    def finish_loading(self):
+        self.ready = True
+        self.timings["ready"] = time.perf_counter() - self.started
+        if hasattr(self, "progress_bar") and self.progress_bar.winfo_exists():
+            self.progress_bar.destroy()
+            self.progress_label.destroy()
+            for button in self.login_buttons:
+                button.config(state="normal")
+    def print_startup_timings(self):
+        print("Startup: " + ", ".join(f"{step} {seconds:.3f}s" for step, seconds in self.timings.items()))
     def fix_checkout_cart(self):
         def checkout_cart():
-            current_customer = self.get_logged_in_customer(self.logged_in_user.get_username())
-            if not current_customer:
+            if not self.session:
                 messagebox.showerror("Error", "No customer is logged in.")
                 return
-            cart = current_customer.get_cart()
-            items = cart.get_cart_items()
-            if not items:
+            if not self.business_model.view_cart(self.session)["items"]:
                 messagebox.showerror("Error", "Your cart is empty.")
                 return
 
@@ -65,55 +124,19 @@ class AdventureLandApp:
             ccv_entry.pack(pady=5)
 
             def process_payment():
-                card_number = card_number_entry.get()
-                expire_date = expire_date_entry.get()
-                ccv = ccv_entry.get()
-                amount = sum(ticket.get_price() for ticket in items)
-
-                # Validate card number
-                if not card_number.isdigit() or len(card_number) < 12:
-                    messagebox.showerror("Error", "Invalid card number. Please enter a valid card number.")
-                    return
-
-                # Validate expiration date
-                if not expire_date or len(expire_date) != 5 or '/' not in expire_date:
-                    messagebox.showerror("Error", "Invalid expiration date. Please use MM/YY format.")
-                    return
-
-                # Validate CCV
-                if not ccv.isdigit() or len(ccv) != 3:
-                    messagebox.showerror("Error", "Invalid CCV. Please enter a 3-digit CCV.")
+                payment_type = payment_method.get()
+                try:
+                    # Validates the card details, records the order and clears the cart
+                    order = self.business_model.checkout(self.session, payment_type, card_number_entry.get(), expire_date_entry.get(), ccv_entry.get())
+                except ValueError as e:
+                    messagebox.showerror("Error", str(e))
                     return
 
-                # Handle Payment Logic
-                payment_type = payment_method.get()
-                if payment_type == "Debit Card":
-                    # Additional Debit Card validation logic (if any) can go here
-                    if not card_number.startswith("4"):  # Example: Only accept cards starting with '4' for Debit
-                        messagebox.showerror("Error", "Invalid Debit Card number.")
-                        return
-
-                # Create Payment and Order
-                payment = Payment(payment_method=payment_type, amount=amount)
-                new_order = Order(
-                    purchase_date=date.today(),
-                    status=Status.Paid,
-                    tickets=items,
-                    payment=payment
-                )
-
-                # Save to customer's history and data layer
-                current_customer.add_order_to_history(new_order)
-                self.data["orders"].append(new_order)
-                self.data_layer.save_customers(self.data["customers"])
-                self.data_layer.save_orders(self.data["orders"])
-
-                # Clear the cart and close the window
-                cart.clear_cart()
+                # Close the window
                 self.payment_window.destroy()
                 self.payment_window = None
                 messagebox.showinfo("Success",
-                                    f"Payment completed successfully using {payment_type}!\nTotal Price: {new_order.get_total_price():.2f} AED.")
+                                    f"Payment completed successfully using {payment_type}!\nTotal Price: {order['total_price']:.2f} AED.")
                 self.show_home_page("customer")
 
             # Payment Buttons
@@ -125,6 +148,15 @@ class AdventureLandApp:
         # Update the app's checkout_cart method
         self.checkout_cart = checkout_cart
 
+    def close(self):
+        try:
+            if self.session:
+                self.business_model.logout(self.session)
+            self.business_model.close()  # Writes back changed accounts and waits for the queued writes
+        except Exception as e:
+            messagebox.showerror("Error", f"Some changes could not be saved: {e}")
+        self.root.destroy()
+
     def show_home_page(self, user_type):
         # Check if the user type is valid and redirect appropriately
         if user_type == "customer":
@@ -137,6 +169,9 @@ class AdventureLandApp:
 
 
     def create_login_page(self):
+        if self.session:
+            self.business_model.logout(self.session)
+            self.session = None
 
         # Set a new optimized window size
         self.root.geometry("380x400")
@@ -159,25 +194,26 @@ class AdventureLandApp:
         def validate_login():
             username = username_entry.get()
             password = password_entry.get()
-            if user_type.get() == "customer":
-                for customer in self.data["customers"]:
-                    if customer.get_username() == username and customer.validate_password(password):
-                        self.logged_in_user = customer
-                        messagebox.showinfo("Login Success", "Welcome Customer!")
-                        self.show_home_page("customer")
-                        return
-                messagebox.showerror("Login Failed", "Invalid username or password for customer.")
-            elif user_type.get() == "admin":
-                for admin in self.data["admins"]:
-                    if admin.get_admin_id() == username and admin.validate_password(password):
-                        self.logged_in_admin = admin
-                        messagebox.showinfo("Login Success", "Welcome Admin!")
-                        self.show_home_page("admin")
-                        return
-                messagebox.showerror("Login Failed", "Invalid username or password for admin.")
-        # Buttons
-        tk.Button(self.root, text="Log In", command=validate_login, font=("Arial", 12), width=15).grid(row=4, column=1, pady=20, ipadx=5, ipady=5)
-        tk.Button(self.root, text="Sign Up", command=self.create_signup_page, font=("Arial", 12), width=15).grid(row=5, column=1, pady=5, ipadx=5, ipady=5)
+            try:
+                self.session = self.business_model.login(username, password, user_type.get())["token"]
+            except ValueError as e:
+                messagebox.showerror("Login Failed", str(e))
+                return
+            messagebox.showinfo("Login Success", "Welcome Customer!" if user_type.get() == "customer" else "Welcome Admin!")
+            self.show_home_page(user_type.get())
+        # Buttons (disabled until the data has loaded)
+        state = "normal" if self.ready else "disabled"
+        login_button = tk.Button(self.root, text="Log In", command=validate_login, font=("Arial", 12), width=15, state=state)
+        login_button.grid(row=4, column=1, pady=20, ipadx=5, ipady=5)
+        signup_button = tk.Button(self.root, text="Sign Up", command=self.create_signup_page, font=("Arial", 12), width=15, state=state)
+        signup_button.grid(row=5, column=1, pady=5, ipadx=5, ipady=5)
+        self.login_buttons = [login_button, signup_button]
+        if not self.ready:
+            # Loading progress
+            self.progress_bar = ttk.Progressbar(self.root, mode="determinate", maximum=100, length=200)
+            self.progress_bar.grid(row=6, column=0, columnspan=3, pady=10)
+            self.progress_label = tk.Label(self.root, text="Loading data...", font=("Arial", 10), fg="gray")
+            self.progress_label.grid(row=7, column=0, columnspan=3)
     def create_signup_page(self):
         # Set a new optimized window size
         self.root.geometry("600x450")
@@ -203,36 +239,17 @@ class AdventureLandApp:
             username = username_entry.get()
             password = password_entry.get()
             email = email_entry.get()
-            if user_type.get() == "customer":
-                try:
-                    # Create a new CustomerAccount and validate it
-                    customer = CustomerAccount(username=username, password=password, email=email, purchase_date=date.today(), tickets=[])
-                    customer.validate_account_creation()  # Business Model
-                    self.data["customers"].append(customer)  # Add the customer to the in-memory data
-                    self.data_layer.save_customers(self.data["customers"])  # Save updated customers list
-                    messagebox.showinfo("Sign Up Successful", "Customer account created successfully!")
-                    self.create_login_page()
-                except ValueError as e:
-                    messagebox.showerror("Sign Up Failed", str(e))
-            elif user_type.get() == "admin":
-                try:
-                    # Create a new Admin account and validate it
-                    admin = Admin(admin_id=username, password=password, orders=[])
-                    admin.validate_admin_creation()  # Business Model
-                    self.data["admins"].append(admin)  # Add the admin to the in-memory data
-                    self.data_layer.save_admins(self.data["admins"])  # Save updated admins list
-                    messagebox.showinfo("Sign Up Successful", "Admin account created successfully!")
-                    self.create_login_page()
-                except ValueError as e:
-                    messagebox.showerror("Sign Up Failed", str(e))
+            try:
+                # Validates the account and rejects a username, email or admin ID that is already taken
+                self.business_model.signup(username, password, email, user_type.get())
+            except ValueError as e:
+                messagebox.showerror("Sign Up Failed", str(e))
+                return
+            messagebox.showinfo("Sign Up Successful", f"{'Customer' if user_type.get() == 'customer' else 'Admin'} account created successfully!")
+            self.create_login_page()
         # Buttons
         tk.Button(self.root, text="Sign Up", command=register_account, font=("Arial", 12), width=15).grid(row=5, column=1, pady=20, ipadx=5, ipady=5)
         tk.Button(self.root, text="Back to Login", command=self.create_login_page, font=("Arial", 12), width=15).grid(row=6, column=1, pady=10, ipadx=5, ipady=5)
-    def get_logged_in_customer(self, username):
-        for customer in self.data["customers"]:
-            if customer.get_username() == username:
-                return customer
-        return None  # Return None if no matching customer is found
     def create_customer_home(self):
         self.root.geometry("500x500")  # Adjust the window size
         # Clear the window
@@ -259,60 +276,34 @@ class AdventureLandApp:
         tk.Button(self.root, text="Back to Home", command=lambda: self.show_home_page("customer"), font=("Arial", 14), width=15, height=1).pack(pady=10)
 
     def purchase_tickets(self):
-        self.root.geometry("1000x500")  # Adjust window size to fit ticket details
+        self.root.geometry("1100x500")  # Adjust window size to fit ticket details
 
         # Clear the current window
         for widget in self.root.winfo_children():
             widget.destroy()
 
-        # Update ticket_data from the DataLayer
-        self.data["tickets"] = self.data_layer.load_tickets()
-
-        # Debugging: Check if tickets are loaded
-        print("Loaded Tickets:", self.data["tickets"])
-
-        if not self.data["tickets"]:
-            print("No tickets found. Initializing default tickets.")
-            messagebox.showwarning("Warning", "No tickets found. Initializing default tickets.")
-            self.data_layer.initialize_files()
-            self.data["tickets"] = self.data_layer.load_tickets()
-            print("Reloaded Tickets:", self.data["tickets"])
-
-        # Validate loaded tickets
-        if not self.data["tickets"]:
+        # The current catalog, with the discounts admins saved
+        ticket_details = self.business_model.catalog()
+        if not ticket_details:
             messagebox.showerror("Error", "Tickets could not be loaded. Please check the data layer.")
             return
 
-        # Prepare ticket details
-        ticket_details = [
-            {
-                "ticket_type": ticket.get_ticket_type(),
-                "description": ticket.get_description(),
-                "price": ticket.get_price(),
-                "validity": ticket.get_validity(),
-                "limitations": ticket.get_limitations(),
-                "discount": ticket.get_discount(),
-            }
-            for ticket in self.data["tickets"]
-        ]
-
         # Title
-        tk.Label(self.root, text="Purchase Tickets", font=("Arial", 18, "bold")).grid(row=0, column=0, columnspan=7,
+        tk.Label(self.root, text="Purchase Tickets", font=("Arial", 18, "bold")).grid(row=0, column=0, columnspan=8,
                                                                                       pady=20)
 
         # Column headers
-        headers = ["Ticket Type", "Description", "Price (AED)", "Validity", "Discount", "Limitations", "Action"]
+        headers = ["Ticket Type", "Description", "Price (AED)", "Validity", "Discount", "Limitations", "Quantity", "Action"]
         for col_index, header in enumerate(headers):
             tk.Label(self.root, text=header, font=("Arial", 12, "bold"), anchor="center").grid(row=1, column=col_index,
                                                                                                padx=10, pady=5)
 
         # Display ticket details
         for row_index, ticket in enumerate(ticket_details, start=2):
-            discounted_price = ticket["price"] * (1 - ticket["discount"] / 100)
             details = [
                 ticket["ticket_type"],
                 ticket["description"],
-                f"{discounted_price:.2f}",
+                f"{ticket['discounted_price']:.2f}",
                 ticket["validity"],
                 f"{ticket['discount']}%",
                 ticket["limitations"],
@@ -322,13 +313,17 @@ class AdventureLandApp:
                     self.root, text=detail, font=("Arial", 10), wraplength=150, justify="left"
                 ).grid(row=row_index, column=col_index, padx=5, pady=5)
 
+            # How many to add at once, e.g. a whole group
+            quantity = tk.Spinbox(self.root, from_=1, to=1000, width=5, font=("Arial", 10))
+            quantity.grid(row=row_index, column=len(details), padx=5, pady=5)
+
             # Add 'Add to Cart' button
             tk.Button(
                 self.root,
                 text="Add to Cart",
                 font=("Arial", 10),
-                command=lambda t=ticket: self.add_to_cart(t),
-            ).grid(row=row_index, column=len(details), padx=10, pady=5)
+                command=lambda t=ticket, q=quantity: self.add_to_cart(t["ticket_type"], q.get()),
+            ).grid(row=row_index, column=len(details) + 1, padx=10, pady=5)
 
         # Back Button
         tk.Button(
@@ -354,31 +349,29 @@ class AdventureLandApp:
         # Back to Home Button
         tk.Button(self.root,text="Back to Home",command=lambda: self.show_home_page("customer")).grid(row=4, column=1, pady=10)
     def delete_account(self):
-        current_customer = self.logged_in_user
-        if not current_customer:
+        if not self.session:
             messagebox.showerror("Error", "No customer is logged in.")
             return
         # Confirmation dialog
         confirm = messagebox.askyesno("Delete Account","Are you sure you want to delete your account? This action cannot be undone.")
         if confirm:
-            self.data["customers"].remove(current_customer)  # Remove the account from the list
-            self.logged_in_user = None  # Log the user out
+            self.business_model.delete_account(self.session)
+            self.session = None  # Log the user out
             messagebox.showinfo("Account Deleted", "Your account has been deleted successfully.")
             self.create_login_page()  # Redirect to the login page
     def view_cart(self):
-        self.root.geometry("450x500")  # Adjust window size for cart details
+        self.root.geometry("600x500")  # Adjust window size for cart details
         # Clear the current window
         for widget in self.root.winfo_children():
             widget.destroy()
         # Title
         tk.Label(self.root, text="Your Cart", font=("Arial", 18, "bold"), anchor="center").grid(row=0, column=0, columnspan=4, pady=20)
-        # Get the logged-in customer and their cart
-        current_customer = self.business_model.get_logged_in_customer(self.logged_in_user.get_username())
-        if not current_customer:
+        # Get the logged-in customer's cart
+        if not self.session:
             messagebox.showerror("Error", "No customer is logged in.")
             return
-        cart = current_customer.get_cart()
-        items = cart.get_cart_items()
+        cart = self.business_model.view_cart(self.session)
+        items = list(enumerate(cart["items"]))  # (position, line) so a selected line can be removed
 
         # Define total_row early
         total_row = 1  # Default row for empty cart
@@ -388,59 +381,49 @@ class AdventureLandApp:
             tk.Label(self.root, text="Your cart is empty.", font=("Arial", 14), anchor="center").grid(row=1, column=0, columnspan=4, pady=20)
             total_row = 2  # Adjust for the "Back to Home" button when the cart is empty
         else:
-            # Column Headers
-            headers = ["Ticket Type", "Price (AED)", "Action"]
-            for col, header in enumerate(headers):
-                tk.Label(self.root, text=header, font=("Arial", 12, "bold"), anchor="center").grid(row=1, column=col, padx=10, pady=10)
-            # cart items
-            for row, ticket in enumerate(items, start=2):
-                # Display ticket type and price
-                tk.Label(self.root, text=ticket.get_ticket_type(), font=("Arial", 11)).grid(row=row, column=0, padx=5, pady=5)
-                tk.Label(self.root, text=f"{ticket.get_price():.2f}", font=("Arial", 11)).grid(row=row, column=1, padx=5, pady=5)
-                # Add 'Remove' button with correct ticket binding
-                def make_remove_command(t):
-                    return lambda: self.remove_ticket_from_cart(t)
-
-                tk.Button(self.root, text="Remove", font=("Arial", 10), command=make_remove_command(ticket)).grid(row=row, column=2, padx=5, pady=5)
+            # Cart items (only the visible rows are rendered)
+            columns = [Column("Ticket Type", lambda line: line[1]["ticket_type"], lambda line: line[1]["ticket_type"], width=200),
+                       Column("Quantity", lambda line: line[1]["quantity"], lambda line: line[1]["quantity"], width=80, anchor="e"),
+                       Column("Unit Price (AED)", lambda line: f"{line[1]['price']:.2f}", lambda line: line[1]["price"], width=120, anchor="e"),
+                       Column("Line Total (AED)", lambda line: f"{line[1]['line_total']:.2f}", lambda line: line[1]["line_total"], width=120, anchor="e")]
+            table = VirtualTable(self.root, columns, items, height=10)
+            table.grid(row=1, column=0, columnspan=3, padx=10, pady=10, sticky="ew")
+            def remove_selected(quantity=None):
+                line = table.selected_item()
+                if line is None:
+                    messagebox.showerror("Error", "Select a ticket to remove.")
+                    return
+                self.remove_ticket_from_cart(line[0], quantity)
+            tk.Button(self.root, text="Remove One", font=("Arial", 10), command=lambda: remove_selected(1)).grid(row=2, column=0, pady=5)
+            tk.Button(self.root, text="Remove Selected", font=("Arial", 10), command=remove_selected).grid(row=2, column=1, pady=5)
             # Total Price
-            total_row = len(items) + 2  # Set total_row for buttons
-            tk.Label(self.root, text=f"Total: {cart.calculate_cart_total():.2f} AED", font=("Arial", 14, "bold")).grid(row=total_row, column=0, columnspan=3, pady=20)
+            total_row = 3  # Set total_row for buttons
+            tk.Label(self.root, text=f"Total: {cart['total']:.2f} AED", font=("Arial", 14, "bold")).grid(row=total_row, column=0, columnspan=3, pady=20)
             # Checkout and Clear Cart Buttons
             tk.Button(self.root, text="Checkout", font=("Arial", 14), command=self.checkout_cart, width=15).grid(row=total_row + 1, column=1, pady=10)
-            tk.Button(self.root, text="Clear Cart", font=("Arial", 14), command=lambda: self.clear_cart(cart), width=15).grid(row=total_row + 2, column=1, pady=10)
+            tk.Button(self.root, text="Clear Cart", font=("Arial", 14), command=self.clear_cart, width=15).grid(row=total_row + 2, column=1, pady=10)
         # Back to Home Button
         tk.Button(self.root, text="Back to Home", font=("Arial", 14), command=lambda: self.show_home_page("customer"), width=15).grid(row=total_row + 3, column=1, pady=20)
-    def add_to_cart(self, ticket_info):
-        # Fetch the updated discount dynamically
-        ticket_type = ticket_info["ticket_type"]
-        updated_discount = next(
-            (ticket.get_discount() for ticket in self.data["tickets"] if ticket.get_ticket_type() == ticket_type), 0)
-
-        # Adjust the price based on the discount
-        discounted_price = ticket_info["price"] * (1 - updated_discount / 100)
-        new_ticket = Ticket(
-            ticket_type=ticket_info["ticket_type"],
-            description=ticket_info["description"],
-            price=discounted_price,
-            validity=ticket_info["validity"],
-            limitations=ticket_info["limitations"],
-            discount=updated_discount
-        )
-
-        current_customer = self.logged_in_user
-        if not current_customer:
+    def add_to_cart(self, ticket_type, quantity="1"):
+        if not self.session:
             messagebox.showerror("Error", "No customer is logged in.")
             return
-
-        current_customer.get_cart().add_to_cart(new_ticket)
-        messagebox.showinfo("Success", f"{ticket_info['ticket_type']} has been added to your cart!")
-    def remove_ticket_from_cart(self, ticket):
-        current_customer = self.logged_in_user
-        cart = current_customer.get_cart()
-        cart.remove_from_cart(ticket)
+        if not str(quantity).strip().isdigit() or int(quantity) < 1:
+            messagebox.showerror("Error", "Enter how many tickets to add.")
+            return
+        try:
+            # The engine prices the line with the ticket's current discount and promotions
+            cart = self.business_model.add_to_cart(self.session, ticket_type, int(quantity))
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        added = f"{int(quantity)} x {ticket_type} have" if int(quantity) > 1 else f"{ticket_type} has"
+        messagebox.showinfo("Success", f"{added} been added to your cart! ({cart['tickets']} tickets, {cart['total']:.2f} AED)")
+    def remove_ticket_from_cart(self, position, quantity=None):
+        self.business_model.remove_from_cart(self.session, position, quantity)
         self.view_cart()
-    def clear_cart(self, cart):
-        cart.clear_cart()
+    def clear_cart(self):
+        self.business_model.clear_cart(self.session)
         self.view_cart()
     def view_order_history(self):
         self.root.geometry("1020x500")  # Adjust window size
@@ -450,46 +433,37 @@ class AdventureLandApp:
         # Title
         tk.Label(self.root, text="Order History", font=("Arial", 20, "bold"), anchor="center").grid(row=0, column=0, columnspan=4, pady=20)
         # Get the logged-in customer
-        current_customer = self.logged_in_user
-        if not current_customer:
+        if not self.session:
             messagebox.showerror("Error", "No customer is logged in.")
             return
         # Retrieve the purchase history
-        history = current_customer.get_purchase_history()
+        history = self.business_model.order_history(self.session)
         if not history:
             # No orders found message
             tk.Label(self.root, text="You have no orders yet.", font=("Arial", 14, "italic"), fg="gray").grid(row=1, column=0, columnspan=4, pady=20)
             tk.Button(self.root, text="Back to Home", font=("Arial", 14), command=lambda: self.show_home_page("customer"), width=20).grid(row=2, column=1, pady=20)
             return
-        # Column Headers
-        headers = ["Order ID", "Date", "Total Price (AED)", "Tickets"]
-        for col, header in enumerate(headers):
-            tk.Label(self.root, text=header, font=("Arial", 14, "bold"), anchor="center", bg="#f0f0f0", relief="groove", width=20).grid(row=1, column=col, padx=5, pady=10)
-        # Display orders
-        row_index = 2
-        for order in history:
-            tk.Label(self.root, text=order.get_order_id(), font=("Arial", 12)).grid(row=row_index, column=0, padx=10, pady=5, sticky="w")
-            tk.Label(self.root, text=order.get_purchase_date(), font=("Arial", 12)).grid(row=row_index, column=1, padx=10, pady=5, sticky="w")
-            tk.Label(self.root, text=f"{order.get_total_price():.2f} AED", font=("Arial", 12)).grid(row=row_index, column=2, padx=10, pady=5, sticky="w")
-            # Ticket details
-            tickets_info = "\n".join(
-                [f"{ticket.get_ticket_type()} - {ticket.get_price():.2f} AED" for ticket in order.get_tickets()])
-            tk.Label(self.root, text=tickets_info, font=("Arial", 12), anchor="w", justify="left", wraplength=300).grid(row=row_index, column=3, padx=10, pady=5, sticky="w")
-            row_index += 1
+        # Orders (only the visible rows are rendered; click a heading to sort)
+        columns = [Column("Order ID", lambda order: order["order_id"], lambda order: order["order_id"], width=90, anchor="e"),
+                   Column("Date", lambda order: order["purchase_date"], lambda order: order["purchase_date"], width=110),
+                   Column("Total Price (AED)", lambda order: f"{order['total_price']:.2f} AED", lambda order: order["total_price"], width=140, anchor="e"),
+                   Column("Tickets", lambda order: ", ".join(f"{ticket['quantity']} x {ticket['ticket_type']} - {ticket['price']:.2f} AED" for ticket in order["tickets"]), width=600)]
+        VirtualTable(self.root, columns, history, height=15).grid(row=1, column=0, columnspan=4, padx=10, pady=10, sticky="ew")
         # Back to Home Button
-        tk.Button(self.root, text="Back to Home", font=("Arial", 16, "bold"), command=lambda: self.show_home_page("customer"), width=25).grid(row=row_index, column=0, columnspan=4, pady=30)
+        tk.Button(self.root, text="Back to Home", font=("Arial", 16, "bold"), command=lambda: self.show_home_page("customer"), width=25).grid(row=2, column=0, columnspan=4, pady=30)
     def view_account_information(self):
         for widget in self.root.winfo_children():
             widget.destroy()
 
         tk.Label(self.root, text="Account Information").grid(row=0, column=1, pady=10)
-        current_customer = self.business_model.get_logged_in_customer(self.logged_in_user.get_username())
-        if current_customer:
+        purchase_history = []
+        if self.session:
+            account = self.business_model.account(self.session)
             # Display username and email
-            tk.Label(self.root, text=f"Username: {current_customer.get_username()}").grid(row=1,column=1,pady=5)
-            tk.Label(self.root, text=f"Email: {current_customer.get_email()}").grid(row=2, column=1,pady=5)
+            tk.Label(self.root, text=f"Username: {account['username']}").grid(row=1,column=1,pady=5)
+            tk.Label(self.root, text=f"Email: {account['email']}").grid(row=2, column=1,pady=5)
             # Display purchase history
-            purchase_history = current_customer.view_purchase_history()
+            purchase_history = self.business_model.order_history(self.session)
             if not purchase_history:
                 tk.Label(self.root, text="No purchase history found.").grid(row=3, column=1, pady=5)
             else:
@@ -516,8 +490,7 @@ class AdventureLandApp:
         new_email_entry.grid(row=3, column=1, pady=5)
 
         def update_account():
-            current_customer = self.business_model.get_logged_in_customer(self.logged_in_user.get_username())
-            if not current_customer:
+            if not self.session:
                 messagebox.showerror("Error", "No customer is logged in.")
                 return
             new_username = new_username_entry.get()
@@ -525,8 +498,8 @@ class AdventureLandApp:
             new_email = new_email_entry.get()
 
             try:
-                # Update customer account using the business model
-                current_customer.modify_account(username=new_username if new_username else None,password=new_password if new_password else None,email=new_email if new_email else None,)
+                # Update customer account using the business model (empty fields are left unchanged)
+                self.business_model.update_account(self.session, username=new_username, password=new_password, email=new_email)
                 messagebox.showinfo("Success", "Account information updated successfully!")
                 self.create_customer_account_settings()  # Return to the account settings page
             except ValueError as e:
@@ -555,54 +528,31 @@ class AdventureLandApp:
         for widget in self.root.winfo_children():
             widget.destroy()
         tk.Label(self.root, text="Daily Ticket Sales", font=("Arial", 16)).grid(row=0, column=1, pady=10)
-        # Retrieve all orders from all customers
-        all_orders = []
-        for customer in self.data["customers"]:
-            customer_orders = customer.get_purchase_history()
-            all_orders.extend(customer_orders)
-        if not all_orders:
+        # Read the maintained daily aggregate instead of walking every purchase history
+        daily_sales = self.business_model.daily_sales(self.session)
+        if not daily_sales:
             tk.Label(self.root, text="No ticket sales found.").grid(row=1, column=1, pady=10)
             last_row = 2  # Next row for the button
         else:
-            # Calculate ticket sales details per day
-            daily_sales = {}
-            for order in all_orders:
-                if order.get_status() == Status.Paid:  # Only count paid orders
-                    purchase_date = order.get_purchase_date()
-                    if purchase_date not in daily_sales:
-                        daily_sales[purchase_date] = {"ticket_count": 0, "ticket_types": {}, "total_price": 0.0}
-
-                    # Aggregate ticket count, types, and total price
-                    daily_sales[purchase_date]["ticket_count"] += len(order.get_tickets())
-                    daily_sales[purchase_date]["total_price"] += order.get_total_price()
-                    for ticket in order.get_tickets():
-                        ticket_type = ticket.get_ticket_type()
-                        if ticket_type not in daily_sales[purchase_date]["ticket_types"]:
-                            daily_sales[purchase_date]["ticket_types"][ticket_type] = 0
-                        daily_sales[purchase_date]["ticket_types"][ticket_type] += 1
-
-            # Display column headers
-            tk.Label(self.root, text="Date", font=("Arial", 12, "bold")).grid(row=1, column=0, padx=10, pady=5)
-            tk.Label(self.root, text="Tickets Sold", font=("Arial", 12, "bold")).grid(row=1, column=1, padx=10, pady=5)
-            tk.Label(self.root, text="Ticket Types", font=("Arial", 12, "bold")).grid(row=1, column=2, padx=10, pady=5)
-            tk.Label(self.root, text="Total Price (AED)", font=("Arial", 12, "bold")).grid(row=1, column=3, padx=10,pady=5)
-
-            # Display daily ticket sales data
-            row_index = 2
-            for date in daily_sales:
-                data = daily_sales[date]
-                ticket_types = ""
-                for ticket_type, count in data["ticket_types"].items():
-                    ticket_types += f"{ticket_type} ({count}), "
-                ticket_types = ticket_types.rstrip(", ")  # Remove the trailing comma and space
-                tk.Label(self.root, text=str(date)).grid(row=row_index, column=0, padx=10, pady=5, sticky="w")
-                tk.Label(self.root, text=str(data["ticket_count"])).grid(row=row_index, column=1, padx=10, pady=5,sticky="w")
-                tk.Label(self.root, text=ticket_types).grid(row=row_index, column=2, padx=10, pady=5, sticky="w")
-                tk.Label(self.root, text=f"{data['total_price']:.2f}").grid(row=row_index, column=3, padx=10, pady=5,sticky="w")
-                row_index += 1  # Increment the row index for the next set of data
-            last_row = row_index  # Track the last row used
+            # One row per day (only the visible rows are rendered; click a heading to sort)
+            def format_types(day):
+                return ", ".join(f"{ticket_type} ({count})" for ticket_type, count in day["ticket_types"].items())
+            columns = [Column("Date", lambda day: str(day["purchase_date"]), lambda day: day["purchase_date"], width=110),
+                       Column("Tickets Sold", lambda day: day["ticket_count"], lambda day: day["ticket_count"], width=100, anchor="e"),
+                       Column("Ticket Types", format_types, width=750),
+                       Column("Total Price (AED)", lambda day: f"{day['total_price']:.2f}", lambda day: day["total_price"], width=140, anchor="e")]
+            VirtualTable(self.root, columns, daily_sales, height=15).grid(row=1, column=0, columnspan=4, padx=10, pady=10, sticky="ew")
+            last_row = 2  # Next row for the buttons
+        # Rebuild Button (recomputes the aggregate from the raw orders to verify it)
+        tk.Button(self.root, text="Rebuild From Orders", command=self.rebuild_ticket_sales).grid(row=last_row, column=2, pady=10)
         # Back to Home Button
         tk.Button(self.root, text="Back to Home", command=lambda: self.show_home_page("admin")).grid(row=last_row, column=1, pady=10)
+    def rebuild_ticket_sales(self):
+        if self.business_model.rebuild_sales(self.session):
+            messagebox.showinfo("Sales Verified", "The daily sales aggregate matches the orders.")
+        else:
+            messagebox.showwarning("Sales Rebuilt", "The daily sales aggregate differed from the orders and has been rebuilt.")
+        self.display_ticket_sales()
     def modify_discounts(self):
         self.root.geometry("500x500")  # Adjust window size
         # Clear the current window
@@ -614,27 +564,27 @@ class AdventureLandApp:
         discount_entries = {}
         row_index = 1  # Initialize row index
 
-        for ticket in self.data["tickets"]:  # Iterate through tickets without enumerate
-            tk.Label(self.root, text=f"{ticket.get_ticket_type()}").grid(row=row_index, column=0, sticky="w", pady=5, padx=10)
-            tk.Label(self.root, text=f"Current Discount: {ticket.get_discount()}%").grid(row=row_index, column=1, sticky="w", pady=5)
+        for ticket in self.business_model.catalog():  # Iterate through tickets without enumerate
+            tk.Label(self.root, text=f"{ticket['ticket_type']}").grid(row=row_index, column=0, sticky="w", pady=5, padx=10)
+            tk.Label(self.root, text=f"Current Discount: {ticket['discount']}%").grid(row=row_index, column=1, sticky="w", pady=5)
             discount_entry = tk.Entry(self.root, width=10)
-            discount_entry.insert(0, str(ticket.get_discount()))  # Fill with the current discount
+            discount_entry.insert(0, str(ticket["discount"]))  # Fill with the current discount
             discount_entry.grid(row=row_index, column=2, pady=5, padx=10)
-            discount_entries[ticket.get_ticket_type()] = discount_entry
+            discount_entries[ticket["ticket_type"]] = discount_entry
             row_index += 1  # Increment row index for the next ticket
 
         def save_discounts():
-            # Iterate over discount entries and update the tickets
-            for ticket in self.data["tickets"]:
-                if ticket.get_ticket_type() in discount_entries:
-                    new_discount = discount_entries[ticket.get_ticket_type()].get()
-                    if not new_discount.isdigit() or int(new_discount) < 0 or int(new_discount) > 100:
-                        messagebox.showerror("Error", f"Invalid discount value for {ticket.get_ticket_type()}. Enter 0-100.")
-                        return
-                    ticket.set_discount(int(new_discount))  # Update discount for the ticket
-
-            # Save updated tickets to the data layer
-            self.data_layer.save_tickets(self.data["tickets"])
+            # Validate every entry before anything is changed
+            discounts = {}
+            for ticket_type, discount_entry in discount_entries.items():
+                new_discount = discount_entry.get()
+                if not new_discount.isdigit() or int(new_discount) < 0 or int(new_discount) > 100:
+                    messagebox.showerror("Error", f"Invalid discount value for {ticket_type}. Enter 0-100.")
+                    return
+                discounts[ticket_type] = int(new_discount)
+
+            # Only the changed tickets are saved
+            self.business_model.set_discounts(self.session, discounts)
             messagebox.showinfo("Success", "Discounts updated successfully!")
 
         tk.Button(self.root, text="Save Discounts", command=save_discounts).grid(row=row_index + 1, column=1, pady=20)
@@ -658,12 +608,12 @@ class AdventureLandApp:
             widget.destroy()
         tk.Label(self.root, text="Admin Account Information").grid(row=0, column=1, pady=10)
 
-        current_admin = self.logged_in_admin  # Retrieve logged-in admin
-        if current_admin:
+        if self.session:
+            current_admin = self.business_model.account(self.session)  # Retrieve logged-in admin
             # Display admin details
-            tk.Label(self.root, text=f"Admin ID: {current_admin.get_admin_id()}").grid(row=1, column=1, pady=5)
-            tk.Label(self.root, text=f"Password: {current_admin.get_password()}").grid(row=2, column=1, pady=5)
-            tk.Label(self.root, text=f"Email: {current_admin.get_email()}").grid(row=3, column=1, pady=5)
+            tk.Label(self.root, text=f"Admin ID: {current_admin['username']}").grid(row=1, column=1, pady=5)
+            tk.Label(self.root, text=f"Password: {current_admin['password']}").grid(row=2, column=1, pady=5)
+            tk.Label(self.root, text=f"Email: {current_admin['email']}").grid(row=3, column=1, pady=5)
         else:
             tk.Label(self.root, text="No admin account is logged in.").grid(row=1, column=1, pady=10)
 
@@ -689,16 +639,15 @@ class AdventureLandApp:
             new_username = new_username_entry.get()
             new_password = new_password_entry.get()
             new_email = new_email_entry.get()
-            logged_in_admin = self.logged_in_admin
-            if not logged_in_admin:
+            if not self.session:
                 messagebox.showerror("Error", "No admin is currently logged in.")
                 return
-            if new_username:
-                logged_in_admin.set_admin_id(new_username)
-            if new_password:
-                logged_in_admin.set_password(new_password)
-            if new_email:
-                logged_in_admin.set_email(new_email)
+            try:
+                # Empty fields are left unchanged
+                self.business_model.update_account(self.session, username=new_username, password=new_password, email=new_email)
+            except ValueError as e:
+                messagebox.showerror("Error", str(e))
+                return
             messagebox.showinfo("Success", "Admin account information updated successfully!")
             self.view_admin_account_information()  # Redirect to view updated information
         # Update Button
@@ -0,0 +1,203 @@
+"""
+Columnar analytics over order lines.
+
+OrderLineColumns flattens orders into one NumPy array per field (date ordinal, ticket-type code,
+gross price, discount and order id), one row per ticket sold (a line item of quantity n is n rows),
+so admin reports can group, filter and sum with vectorized operations instead of looping over
+Order.get_tickets() in Python.
+
+NumPy is an optional dependency: the rest of the application runs without it, and building the
+columns raises an ImportError that says so.
+"""
+from datetime import date
+from business_model import Status
+from order_file import NO_TICKET
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - depends on the environment
+    np = None
+
+
+def require_numpy():
+    if np is None:
+        raise ImportError("The analytics engine needs NumPy. Install it with 'pip install numpy'.")
+
+
+class OrderLineColumns:
+    """One row per ticket of a paid order, stored column by column."""
+    def __init__(self, date_ordinals, type_codes, gross_prices, discounts, order_ids, ticket_types):
+        require_numpy()
+        self.date_ordinals = np.asarray(date_ordinals, dtype=np.int32)
+        self.type_codes = np.asarray(type_codes, dtype=np.int16)
+        self.gross_prices = np.asarray(gross_prices, dtype=np.float64)
+        self.discounts = np.asarray(discounts, dtype=np.float64)  # Amount taken off the gross price
+        self.order_ids = np.asarray(order_ids, dtype=np.int64)
+        self.ticket_types = list(ticket_types)  # type code -> ticket type name
+
+    # Builders
+    @classmethod
+    def from_orders(cls, orders, paid_only=True):
+        """Build the columns from Order objects (e.g. the OrderStore)."""
+        columns = _ColumnBuilder()
+        for order in orders:
+            if paid_only and order.get_status() != Status.Paid:
+                continue
+            ordinal, order_id = order.get_purchase_date().toordinal(), order.get_order_id()
+            for ticket in order.get_tickets():
+                columns.add(ordinal, ticket.get_ticket_type(), ticket.get_price(), ticket.get_discount(), order_id, ticket.get_quantity())
+        return columns.build(cls)
+
+    @classmethod
+    def from_records(cls, records, paid_only=True):
+        """Build the columns straight from raw order records, skipping the Order objects."""
+        columns = _ColumnBuilder()
+        for record in records:
+            if paid_only and record["status"] != Status.Paid.name:
+                continue
+            ordinal, order_id = record["purchase_date"].toordinal(), record.get("order_id") or 0
+            for ticket in record["tickets"]:
+                columns.add(ordinal, ticket["ticket_type"], ticket["price"], ticket.get("discount", 0), order_id, ticket.get("quantity", 1))
+        return columns.build(cls)
+
+    @classmethod
+    def from_order_file(cls, order_file, paid_only=True):
+        """Build the columns straight from the memory-mapped order lines of an OrderLineFile."""
+        require_numpy()
+        fields = [("order_id", "<u8"), ("customer", "<u4"), ("date", "<i4"), ("type", "<u2"), ("status", "u1"),
+                  ("pad", "u1"), ("price", "<f8"), ("discount", "<f8"), ("total", "<f8")]
+        with order_file.lines() as (view, version):
+            # Layout 1 lines are one ticket each; later layouts add the line's quantity
+            dtype = np.dtype(fields if version == 1 else fields + [("quantity", "<u4")])
+            lines = np.frombuffer(view, dtype=dtype)  # Zero-copy over the mapping
+            selected = lines["type"] != NO_TICKET
+            if paid_only:
+                selected &= lines["status"] == Status.Paid.value
+            lines = lines[selected]  # Fancy indexing copies, so nothing refers to the mapping afterwards
+        if version != 1:
+            lines = np.repeat(lines, lines["quantity"])
+        percent = lines["discount"]
+        discounted = (percent > 0) & (percent < 100)
+        gross = np.where(discounted, lines["price"] / np.where(discounted, 1 - percent / 100, 1), lines["price"])
+        # Dictionary codes are per (type, description, ...) entry, so entries of the same type share one column code
+        names = order_file.ticket_types()
+        ticket_types = list(dict.fromkeys(names))
+        codes = np.array([ticket_types.index(name) for name in names] or [0], dtype=np.int16)[lines["type"]]
+        return cls(lines["date"], codes, gross, gross - lines["price"], lines["order_id"], ticket_types)
+
+    def __len__(self):
+        return len(self.order_ids)
+
+    # Derived Columns
+    @property
+    def net_prices(self):
+        return self.gross_prices - self.discounts
+
+    def type_code(self, ticket_type):
+        return self.ticket_types.index(ticket_type) if ticket_type in self.ticket_types else -1
+
+    # Filtering
+    def mask(self, start=None, end=None, ticket_types=None, discounted=None):
+        """Boolean row mask for a date range (inclusive), a set of ticket types and/or discounted lines."""
+        selected = np.ones(len(self), dtype=bool)
+        if start is not None:
+            selected &= self.date_ordinals >= start.toordinal()
+        if end is not None:
+            selected &= self.date_ordinals <= end.toordinal()
+        if ticket_types is not None:
+            selected &= np.isin(self.type_codes, [self.type_code(ticket_type) for ticket_type in ticket_types])
+        if discounted is not None:
+            selected &= (self.discounts > 0) == discounted
+        return selected
+
+    def filter(self, mask=None, **conditions):
+        """Return the rows selected by a mask or by the conditions accepted by mask()."""
+        if mask is None:
+            mask = self.mask(**conditions)
+        return OrderLineColumns(self.date_ordinals[mask], self.type_codes[mask], self.gross_prices[mask],
+                                self.discounts[mask], self.order_ids[mask], self.ticket_types)
+
+    # Aggregation
+    def sum(self, column="net_prices"):
+        return float(getattr(self, column).sum())
+
+    def group_sum(self, keys, values=None):
+        """Sum values (row counts when None) per distinct key, returning (unique keys, sums)."""
+        if not len(keys):
+            return keys[:0], np.zeros(0)
+        low, high = int(keys.min()), int(keys.max())
+        if high - low <= 4 * len(keys):
+            # Dense keys (days, order ids) are binned directly, which avoids sorting
+            sums = np.bincount(keys - low, weights=values)
+            present = np.flatnonzero(np.bincount(keys - low))
+            return present + low, sums[present]
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        return unique_keys, np.bincount(inverse, weights=values, minlength=len(unique_keys))
+
+    def revenue_by_type(self):
+        sums = np.bincount(self.type_codes, weights=self.net_prices, minlength=len(self.ticket_types))
+        return {ticket_type: float(sums[code]) for code, ticket_type in enumerate(self.ticket_types) if sums[code]}
+
+    def tickets_by_type(self):
+        counts = np.bincount(self.type_codes, minlength=len(self.ticket_types))
+        return {ticket_type: int(counts[code]) for code, ticket_type in enumerate(self.ticket_types) if counts[code]}
+
+    def revenue_by_day(self):
+        days, sums = self.group_sum(self.date_ordinals, self.net_prices)
+        return {date.fromordinal(int(day)): float(total) for day, total in zip(days, sums)}
+
+    def revenue_by_type_by_week(self):
+        """Revenue keyed by (Monday of the week, ticket type)."""
+        if not len(self):
+            return {}
+        # date.toordinal() is 1 on Monday 0001-01-01, so (ordinal - 1) // 7 numbers the weeks from a Monday
+        weeks = (self.date_ordinals.astype(np.int64) - 1) // 7
+        first_week = weeks.min()
+        type_count = len(self.ticket_types)
+        keys = (weeks - first_week) * type_count + self.type_codes
+        sums = np.bincount(keys, weights=self.net_prices)
+        report = {}
+        for key in np.flatnonzero(sums):
+            week, code = divmod(int(key), type_count)
+            monday = date.fromordinal(int((first_week + week) * 7 + 1))
+            report[(monday, self.ticket_types[code])] = float(sums[key])
+        return report
+
+    def average_basket_size(self):
+        """Average number of tickets and average net value per order."""
+        if not len(self):
+            return {"tickets": 0.0, "value": 0.0}
+        order_count = len(self.group_sum(self.order_ids)[0])
+        return {"tickets": len(self) / order_count, "value": self.sum() / order_count}
+
+    def discount_uptake(self):
+        """Share of tickets sold with a discount, overall and per ticket type."""
+        if not len(self):
+            return {"overall": 0.0, "by_type": {}}
+        discounted = (self.discounts > 0).astype(np.float64)
+        lines = np.bincount(self.type_codes, minlength=len(self.ticket_types))
+        taken = np.bincount(self.type_codes, weights=discounted, minlength=len(self.ticket_types))
+        by_type = {ticket_type: float(taken[code] / lines[code])
+                   for code, ticket_type in enumerate(self.ticket_types) if lines[code]}
+        return {"overall": float(discounted.mean()), "by_type": by_type}
+
+
+class _ColumnBuilder:
+    """Accumulates rows in Python lists and converts them to arrays once."""
+    def __init__(self):
+        self.date_ordinals, self.type_codes, self.gross_prices, self.discounts, self.order_ids = [], [], [], [], []
+        self.codes = {}
+
+    def add(self, ordinal, ticket_type, price, discount_percent, order_id, quantity=1):
+        code = self.codes.setdefault(ticket_type, len(self.codes))
+        # Line prices are stored after the discount was applied, so the gross price is recovered from it
+        gross = price / (1 - discount_percent / 100) if 0 < discount_percent < 100 else price
+        self.date_ordinals += [ordinal] * quantity
+        self.type_codes += [code] * quantity
+        self.gross_prices += [gross] * quantity
+        self.discounts += [gross - price] * quantity
+        self.order_ids += [order_id] * quantity
+
+    def build(self, columns_class):
+        return columns_class(self.date_ordinals, self.type_codes, self.gross_prices, self.discounts, self.order_ids,
+                             list(self.codes))
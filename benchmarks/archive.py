@@ -0,0 +1,87 @@
+"""
+Measure hot/cold tiering of the order history.
+
+Generates a synthetic dataset (benchmarks/dataset.py), then archives the orders older than --hot-days (counted back
+from the newest purchase date) and compares load_all before and after (time and traced memory), the bytes of the
+hot order file and the archive segments, and order history lookups that stay in the hot window against ones that
+page archived segments in.
+
+    python benchmarks/archive.py --customers 20000 --orders-per-customer 5 --hot-days 180
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import data_layer  # noqa: E402
+from dataset import generate, username  # noqa: E402
+
+
+def load(repeat):
+    """Best load_all time in seconds and the traced peak bytes of one more load."""
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        data_layer.DataLayer().load_all()
+        best = min(best, time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        data = data_layer.DataLayer().load_all()
+        return best, tracemalloc.get_traced_memory()[0], data
+    finally:
+        tracemalloc.stop()
+
+
+def lookups(data, names, start=None):
+    """Mean seconds per order history lookup of the given customers."""
+    begin = time.perf_counter()
+    for name in names:
+        data["customers"][name].get_purchase_history(start=start)
+    return (time.perf_counter() - begin) / len(names)
+
+
+def archive_bytes(layer):
+    return sum(segment["bytes"] for segment in layer.archive.segments())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--customers", type=int, default=20000)
+    parser.add_argument("--orders-per-customer", type=int, default=5)
+    parser.add_argument("--hot-days", type=int, default=180)
+    parser.add_argument("--lookups", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        data_layer.BASE_PATH = directory  # get_filepath reads it on every call
+        generate(directory, args.customers, args.orders_per_customer)
+        orders_path = data_layer.get_filepath("orders.pkl")
+        flat_bytes = os.path.getsize(orders_path)
+        flat_time, flat_memory, data = load(args.repeat)
+        cutoff = max(order.get_purchase_date() for order in data["orders"]) - timedelta(days=args.hot_days)
+        layer = data_layer.DataLayer()
+        data = layer.load_all()
+        start = time.perf_counter()
+        moved = layer.archive_orders(data, cutoff)
+        archive_time = time.perf_counter() - start
+        tiered_time, tiered_memory, data = load(args.repeat)
+        data["customers"] = {customer.get_username(): customer for customer in data["customers"]}
+        rng = random.Random(7)
+        names = [username(rng.randrange(args.customers)) for _ in range(args.lookups)]
+        recent, full = lookups(data, names, start=cutoff), lookups(data, names)
+        print(f"{moved} of {moved + len(data['orders'])} orders placed before {cutoff} archived in {archive_time:.2f} s "
+              f"({len(layer.archive.segments())} segments)")
+        print(f"{'':<16}{'load_all s':>11}{'traced MiB':>12}{'order bytes':>13}")
+        print(f"{'single tier':<16}{flat_time:>11.3f}{flat_memory / 2 ** 20:>12.1f}{flat_bytes:>13,}")
+        print(f"{'hot + archive':<16}{tiered_time:>11.3f}{tiered_memory / 2 ** 20:>12.1f}"
+              f"{os.path.getsize(orders_path) + archive_bytes(layer):>13,}")
+        print(f"History lookup: {recent * 1000:.3f} ms within the hot window, {full * 1000:.3f} ms over the whole history "
+              f"({data['orders'].get_archive().pages_in} segment reads for {len(names)} lookups)")
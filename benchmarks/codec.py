@@ -0,0 +1,74 @@
+"""
+Compare the compact record encoding of entity files with the pickled dicts it replaced.
+
+Generates a synthetic dataset (benchmarks/dataset.py), then for each entity reports the bytes on disk
+and the encode and decode throughput of record_codec against pickle.dumps/loads of the raw dicts.
+
+    python benchmarks/codec.py --customers 20000 --orders-per-customer 5
+"""
+import argparse
+import os
+import pickle
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import record_codec  # noqa: E402
+from data_layer import load_from_file  # noqa: E402
+from dataset import generate  # noqa: E402
+
+ENTITIES = ("customers", "orders", "admins", "tickets", "sales")
+
+
+def best_time(function, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def measure(records, entity, repeat=3):
+    pickled = pickle.dumps(records, protocol=pickle.HIGHEST_PROTOCOL)
+    encoded = record_codec.dumps(entity, records)
+    if record_codec.loads(encoded) != pickle.loads(pickled):
+        raise AssertionError(f"{entity} records do not survive the codec round trip")
+    return {
+        "records": len(records),
+        "pickle": {"bytes": len(pickled),
+                   "encode": best_time(lambda: pickle.dumps(records, protocol=pickle.HIGHEST_PROTOCOL), repeat),
+                   "decode": best_time(lambda: pickle.loads(pickled), repeat)},
+        "codec": {"bytes": len(encoded),
+                  "encode": best_time(lambda: record_codec.dumps(entity, records), repeat),
+                  "decode": best_time(lambda: record_codec.loads(encoded), repeat)},
+    }
+
+
+def normalized(records):
+    # Order lines saved before the codec have no discount; the codec fills the default in, so compare like with like
+    for record in records:
+        for field in ("tickets", "cart"):
+            for ticket in record.get(field, ()):
+                ticket.setdefault("discount", 0)
+    return records
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--customers", type=int, default=20000)
+    parser.add_argument("--orders-per-customer", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        generate(directory, args.customers, args.orders_per_customer)
+        results = {entity: measure(normalized(load_from_file(os.path.join(directory, f"{entity}.pkl"))), entity, args.repeat)
+                   for entity in ENTITIES}
+    print(f"{'entity':<10} {'records':>8} {'pickle KiB':>11} {'codec KiB':>10} {'size':>6}"
+          f" {'pickle enc/s':>13} {'codec enc/s':>12} {'pickle dec/s':>13} {'codec dec/s':>12}")
+    for entity, result in results.items():
+        count, plain, codec = result["records"], result["pickle"], result["codec"]
+        print(f"{entity:<10} {count:>8} {plain['bytes'] / 1024:>11.1f} {codec['bytes'] / 1024:>10.1f} {codec['bytes'] / plain['bytes']:>6.0%}"
+              f" {count / plain['encode']:>13,.0f} {count / codec['encode']:>12,.0f}"
+              f" {count / plain['decode']:>13,.0f} {count / codec['decode']:>12,.0f}")
@@ -0,0 +1,102 @@
+"""
+Deterministic synthetic dataset generator.
+
+Writes customers.pkl, orders.pkl, admins.pkl, tickets.pkl and sales.pkl in the format DataLayer
+writes (record_codec entity files, orders stored once with an order_id and a username), so the same
+seed always produces the same files. Ticket mixes follow what the park sells: mostly day passes and
+child tickets, a few annual memberships, and group tickets bought ten or more at a time.
+
+    python benchmarks/dataset.py /tmp/adventure_land --customers 20000 --orders-per-customer 5
+"""
+import argparse
+import hashlib
+import os
+import random
+import sys
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data_layer import save_to_file, ticket_data  # noqa: E402
+
+# Relative share of each ticket type in an order (Group Tickets come in blocks of 10+)
+TICKET_WEIGHTS = {"Single-Day Pass": 40, "Two-Day Pass": 15, "Annual Membership": 4, "Child Ticket": 26,
+                  "Group Ticket (10+)": 5, "VIP Experience Pass": 10}
+STATUS_WEIGHTS = {"Paid": 90, "Pending": 6, "Cancelled": 4}
+FIRST_DAY = date(2024, 1, 1)
+DAYS = 730
+
+
+def username(number):
+    return f"user{number:07d}"
+
+
+def order_tickets(rng, catalog, types, weights):
+    lines = {}  # One line item per ticket type, as the cart keeps them
+    for ticket_type in rng.choices(types, weights, k=rng.choices((1, 2, 3, 4), (45, 30, 15, 10))[0]):
+        ticket = catalog[ticket_type]
+        count = rng.randint(10, 15) if ticket_type == "Group Ticket (10+)" else 1
+        # Order lines keep the unit price paid, with the discount already applied (as checkout stores them)
+        line = lines.setdefault(ticket_type, {"ticket_type": ticket_type, "description": ticket["description"],
+                                              "price": round(ticket["price"] * (1 - ticket["discount"] / 100), 2),
+                                              "validity": ticket["validity"], "limitations": ticket["limitations"]})
+        line["quantity"] = line.get("quantity", 0) + count
+    for line in lines.values():
+        if line["quantity"] == 1:
+            del line["quantity"]  # Stored only when a line holds more than one ticket
+    return list(lines.values())
+
+
+def generate(directory, customers=1000, orders_per_customer=5, admins=3, seed=7):
+    """Write a dataset of customers * orders_per_customer orders into directory and return its counts."""
+    rng = random.Random(seed)
+    catalog = {ticket["ticket_type"]: ticket for ticket in ticket_data}
+    types, weights = list(TICKET_WEIGHTS), list(TICKET_WEIGHTS.values())
+    statuses, status_weights = list(STATUS_WEIGHTS), list(STATUS_WEIGHTS.values())
+    customer_records, orders, sales = [], [], {}
+    for number in range(customers):
+        name = username(number)
+        customer_records.append({"username": name, "password": f"pw{number}", "email": f"{name}@example.com",
+                                 "purchase_date": FIRST_DAY, "tickets": [], "cart": []})
+        for _ in range(orders_per_customer):
+            tickets = order_tickets(rng, catalog, types, weights)
+            order = {"order_id": len(orders) + 1, "username": name,
+                     "purchase_date": FIRST_DAY + timedelta(days=rng.randrange(DAYS)),
+                     "status": rng.choices(statuses, status_weights)[0],
+                     "total_price": round(sum(ticket["price"] * ticket.get("quantity", 1) for ticket in tickets), 2), "tickets": tickets}
+            orders.append(order)
+            if order["status"] == "Paid":
+                # Same rows SalesAggregate.get_days() produces, so the first load does not rebuild them
+                day = sales.setdefault(order["purchase_date"], {"purchase_date": order["purchase_date"], "ticket_count": 0,
+                                                                "ticket_types": {}, "total_price": 0.0})
+                day["ticket_count"] += sum(ticket.get("quantity", 1) for ticket in tickets)
+                day["total_price"] += order["total_price"]
+                for ticket in tickets:
+                    day["ticket_types"][ticket["ticket_type"]] = day["ticket_types"].get(ticket["ticket_type"], 0) + ticket.get("quantity", 1)
+    days = [dict(sales[day], total_price=round(sales[day]["total_price"], 2)) for day in sorted(sales)]
+    admin_records = [{"admin_id": f"admin{number}", "password": f"admin{number}", "email": f"admin{number}@example.com",
+                      "order_ids": []} for number in range(admins)]
+
+    os.makedirs(directory, exist_ok=True)
+    for name in ("data.log", "data.log.1", "data.log.ckpt", "data.versions", "customers.shards", "order_ids.lease", "orders.bin", "orders.dict", "adventure_land.db"):
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            os.remove(path)  # Left over from a previous dataset
+    save_to_file(customer_records, os.path.join(directory, "customers.pkl"), "customers")
+    save_to_file(orders, os.path.join(directory, "orders.pkl"), "orders")
+    save_to_file(admin_records, os.path.join(directory, "admins.pkl"), "admins")
+    save_to_file([dict(ticket) for ticket in ticket_data], os.path.join(directory, "tickets.pkl"), "tickets")
+    save_to_file(days, os.path.join(directory, "sales.pkl"), "sales")
+    # Marks the catalog as current so loading does not reseed it
+    save_to_file(hashlib.sha256(repr(ticket_data).encode()).hexdigest(), os.path.join(directory, "catalog.seed"))
+    return {"customers": customers, "orders": len(orders), "lines": sum(len(order["tickets"]) for order in orders)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("directory")
+    parser.add_argument("--customers", type=int, default=1000)
+    parser.add_argument("--orders-per-customer", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    counts = generate(args.directory, args.customers, args.orders_per_customer, seed=args.seed)
+    print(f"Wrote {counts['customers']} customers, {counts['orders']} orders ({counts['lines']} ticket lines) to {args.directory}")
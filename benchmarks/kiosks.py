@@ -0,0 +1,130 @@
+"""
+Load test for the kiosk server.
+
+Generates a dataset, starts kiosk_server.py on it in a separate process and drives it with many concurrent
+asyncio kiosks. Each kiosk logs in as its own customer and repeats a sale: browse the catalog, add tickets,
+view the cart, check out and open the order history. Reports requests and checkouts per second and the
+latency percentiles of each operation.
+
+    python benchmarks/kiosks.py --kiosks 100 --sales 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from dataset import generate, username  # noqa: E402
+from suite import percentile  # noqa: E402
+
+
+class Kiosk:
+    def __init__(self, reader, writer, latencies):
+        self.reader = reader
+        self.writer = writer
+        self.latencies = latencies  # op -> list of seconds, shared by every kiosk
+        self.next_id = 0
+
+    async def call(self, op, **args):
+        self.next_id += 1
+        start = time.perf_counter()
+        self.writer.write((json.dumps({"id": self.next_id, "op": op, "args": args}) + "\n").encode())
+        await self.writer.drain()
+        response = json.loads(await self.reader.readline())
+        self.latencies.setdefault(op, []).append(time.perf_counter() - start)
+        if not response["ok"]:
+            raise ValueError(f"{op}: {response['error']}")
+        return response["result"]
+
+
+async def run_kiosk(number, port, args, latencies, ticket_types):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    kiosk, rng = Kiosk(reader, writer, latencies), random.Random(number)
+    name = username(number)
+    token = (await kiosk.call("login", username=name, password=f"pw{number}"))["token"]
+    for _ in range(args.sales):
+        await kiosk.call("catalog")
+        for ticket_type in rng.choices(ticket_types, k=rng.randint(1, 3)):
+            await kiosk.call("add_to_cart", token=token, ticket_type=ticket_type)
+        await kiosk.call("view_cart", token=token)
+        await kiosk.call("checkout", token=token, payment_method="Credit Card", card_number="4111111111111111",
+                         expire_date="12/30", ccv="123")
+        await kiosk.call("order_history", token=token)
+    await kiosk.call("logout", token=token)
+    writer.close()
+    await writer.wait_closed()
+
+
+async def drive(port, args):
+    latencies = {}
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    ticket_types = [ticket["ticket_type"] for ticket in await Kiosk(reader, writer, {}).call("catalog")]
+    writer.close()
+    start = time.perf_counter()
+    await asyncio.gather(*(run_kiosk(number, port, args, latencies, ticket_types) for number in range(args.kiosks)))
+    return time.perf_counter() - start, latencies
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def wait_for_server(port, process, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("The kiosk server exited during startup.")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("The kiosk server did not start in time.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--kiosks", type=int, default=100)
+    parser.add_argument("--sales", type=int, default=20, help="Checkouts per kiosk")
+    parser.add_argument("--orders-per-customer", type=int, default=5)
+    parser.add_argument("--backend", default="pickle", choices=("pickle", "binary", "framed", "sqlite"))
+    parser.add_argument("--data-dir", help="Where to generate the dataset (a temporary directory by default)")
+    args = parser.parse_args()
+
+    directory = args.data_dir or tempfile.mkdtemp(prefix="adventure_land_kiosks_")
+    generate(directory, args.kiosks, args.orders_per_customer)
+    port = free_port()
+    environment = dict(os.environ, DATA_LAYER_PATH=directory, DATA_LAYER_BACKEND=args.backend)
+    if args.backend == "sqlite":
+        subprocess.run([sys.executable, "-c", "import data_layer as d; layer = d.DataLayer(backend='sqlite'); "
+                        "d.copy_backend(d.PickleBackend(layer.filepaths), layer.backend)"], cwd=ROOT, env=environment, check=True)
+    server = subprocess.Popen([sys.executable, os.path.join(ROOT, "kiosk_server.py"), "--port", str(port)], cwd=ROOT,
+                              env=environment, stdout=subprocess.DEVNULL)
+    try:
+        wait_for_server(port, server)
+        elapsed, latencies = asyncio.run(drive(port, args))
+    finally:
+        server.terminate()
+        server.wait()
+
+    requests = sum(len(samples) for samples in latencies.values())
+    checkouts = len(latencies.get("checkout", []))
+    print(f"{args.kiosks} kiosks, {checkouts} checkouts, {requests} requests in {elapsed:.2f}s")
+    print(f"Throughput: {requests / elapsed:.0f} requests/s, {checkouts / elapsed:.0f} checkouts/s")
+    print(f"{'operation':<16}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for op, samples in sorted(latencies.items()):
+        print(f"{op:<16}{len(samples):>8}{percentile(samples, 0.5) * 1000:>10.2f}{percentile(samples, 0.95) * 1000:>10.2f}"
+              f"{percentile(samples, 0.99) * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
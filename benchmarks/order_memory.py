@@ -0,0 +1,65 @@
+"""
+Measure the resident memory cost of loaded orders.
+
+Builds a synthetic set of paid orders through DataLayer.order_from_raw (the same path load_orders
+and load_customers use) and reports the growth in resident set size per order.
+
+    python benchmarks/order_memory.py --orders 1000000
+"""
+import argparse
+import gc
+import os
+import pickle
+import random
+import sys
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data_layer import DataLayer, MemoryBackend, ticket_data  # noqa: E402
+
+CHUNK_SIZE = 10000  # Orders unpickled together, like one entity file
+
+
+def resident_bytes():
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def raw_order_chunk(rng, count):
+    start = date(2024, 1, 1)
+    chunk = []
+    for _ in range(count):
+        tickets = []
+        for ticket in rng.choices(ticket_data, k=rng.randint(1, 4)):
+            tickets.append({"ticket_type": ticket["ticket_type"], "description": ticket["description"],
+                            "price": ticket["price"] * (1 - ticket["discount"] / 100),
+                            "validity": ticket["validity"], "limitations": ticket["limitations"]})
+        chunk.append({"purchase_date": start + timedelta(days=rng.randrange(730)), "status": "Paid",
+                      "total_price": sum(ticket["price"] for ticket in tickets), "tickets": tickets})
+    # Round-trip through pickle so every chunk carries its own string copies, as a loaded file does
+    return pickle.loads(pickle.dumps(chunk))
+
+
+def measure(order_count, seed=7):
+    rng = random.Random(seed)
+    data_layer = DataLayer(backend=MemoryBackend())
+    gc.collect()
+    before = resident_bytes()
+    orders = []
+    lines = 0
+    for offset in range(0, order_count, CHUNK_SIZE):
+        for raw in raw_order_chunk(rng, min(CHUNK_SIZE, order_count - offset)):
+            orders.append(data_layer.order_from_raw(raw))
+            lines += len(orders[-1].get_tickets())  # Repeated ticket types are folded into one line item
+    gc.collect()
+    used = resident_bytes() - before
+    return {"orders": len(orders), "lines": lines, "bytes": used, "bytes_per_order": used / len(orders)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--orders", type=int, default=1000000)
+    args = parser.parse_args()
+    result = measure(args.orders)
+    print(f"{result['orders']} orders, {result['lines']} ticket lines")
+    print(f"Resident memory: {result['bytes'] / 2 ** 20:.1f} MiB, {result['bytes_per_order']:.0f} bytes per order")
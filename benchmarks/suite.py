@@ -0,0 +1,257 @@
+"""
+Headless benchmark suite for the data layer.
+
+For each dataset size (in orders) a synthetic dataset is generated with benchmarks/dataset.py and the
+operations the application depends on are timed against it: DataLayer.load_all (eager and lazy, as the
+UI uses it), save_customers (with every account changed, and with one), login lookups, the daily sales report behind display_ticket_sales (and its
+rebuild from the orders), pricing a 500-ticket group cart and checkout. Each operation reports latency percentiles, throughput and its
+peak traced memory, and is compared with a stored baseline so regressions are flagged. No Tk display
+is needed.
+
+    python benchmarks/suite.py --sizes 1000,10000,100000 --save-baseline
+    python benchmarks/suite.py --sizes 1000,10000,100000          # exits with 1 on a regression
+
+benchmarks/baseline.json is the baseline recorded with the first command. Timings depend on the machine, so
+re-record it before comparing on another one.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import data_layer  # noqa: E402
+from business_model import Cart, IdentityIndex, Order, Payment, PricingEngine, SalesAggregate, Status  # noqa: E402
+from dataset import generate, username  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+GROUP_CART = 500  # Tickets in the priced group cart
+NOISE_FLOOR = 0.0001  # Seconds; slowdowns smaller than this are timer noise, not regressions
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of a list of samples."""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+def time_calls(function, repeat):
+    """Wall-clock seconds of each of repeat calls."""
+    samples = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def peak_memory(function):
+    """Peak bytes allocated by Python while function runs (timed separately, as tracing slows it down)."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+class Benchmark:
+    """Runs the operations against one generated dataset."""
+    def __init__(self, directory, orders, args):
+        self.directory = directory
+        self.orders = orders
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.customer_count = max(1, orders // args.orders_per_customer)
+        data_layer.BASE_PATH = directory  # get_filepath reads it on every call
+        counts = generate(directory, self.customer_count, args.orders_per_customer, seed=args.seed)
+        self.lines = counts["lines"]
+        if args.backend == "sqlite":
+            layer = self.data_layer()
+            data_layer.copy_backend(data_layer.PickleBackend(layer.filepaths), layer.backend)
+            layer.backend.close()
+
+    def data_layer(self):
+        return data_layer.DataLayer(log_mode=self.args.log_mode, backend=self.args.backend)
+
+    def result(self, operation, samples, work, unit, peak):
+        """work is the number of units (orders, lookups, ...) handled by one sample."""
+        return {"operation": operation, "orders": self.orders, "samples": len(samples),
+                "p50": percentile(samples, 0.5), "p95": percentile(samples, 0.95), "p99": percentile(samples, 0.99),
+                "mean": sum(samples) / len(samples), "throughput": work * len(samples) / sum(samples), "unit": unit,
+                "peak_bytes": peak}
+
+    def measure(self, operation, function, repeat, work, unit):
+        samples = time_calls(function, repeat)
+        peak = peak_memory(function) if self.args.memory else None
+        return self.result(operation, samples, work, unit, peak)
+
+    # Operations
+    def run(self):
+        repeat = self.args.repeat
+        results = [
+            self.measure("load_all", lambda: self.data_layer().load_all(), repeat, self.orders, "orders/s"),
+            self.measure("load_all_lazy", lambda: self.data_layer().load_all(lazy_customers=True), repeat, self.orders, "orders/s"),
+        ]
+        layer = self.data_layer()
+        data = layer.load_all()
+        results.append(self.measure("save_customers", lambda: self.save_customers(layer, data["customers"]), repeat,
+                                    self.customer_count, "customers/s"))
+        results.append(self.measure("save_one_change", lambda: self.save_customers(layer, data["customers"], changed=1), repeat,
+                                    1, "saves/s"))
+        results.append(self.login(layer))
+        results.append(self.measure("sales_report", lambda: self.sales_rows(data["sales"]), repeat, 1, "reports/s"))
+        results.append(self.measure("sales_rebuild", lambda: SalesAggregate.rebuild(data["orders"]), repeat,
+                                    self.orders, "orders/s"))
+        results.append(self.group_pricing(data))
+        results.append(self.checkout(layer, data))  # Last, since it adds orders
+        return results
+
+    def save_customers(self, layer, customers, changed=None):
+        # Only accounts changed through their setters are written, so the work is the number changed
+        for customer in customers if changed is None else self.rng.sample(customers, changed):
+            customer.set_email(f"{customer.get_username()}.{self.rng.randrange(10 ** 6)}@example.com")
+        layer.save_customers(customers)
+
+    def login(self, layer):
+        # The UI's login path: the identity index over the lazily loaded accounts
+        data = layer.load_all(lazy_customers=True)
+        index = IdentityIndex(admins=data["admins"], customer_store=data["customers"])
+        names = [username(self.rng.randrange(self.customer_count)) if self.rng.random() < 0.9 else "nobody"
+                 for _ in range(self.args.lookups)]
+        def attempt(name):
+            customer = index.find_customer(name)
+            return customer is not None and customer.validate_password(f"pw{int(name[4:])}")
+        samples = []
+        for name in names:
+            start = time.perf_counter()
+            attempt(name)
+            samples.append(time.perf_counter() - start)
+        peak = peak_memory(lambda: [attempt(name) for name in names[:100]]) if self.args.memory else None
+        return self.result("login", samples, 1, "lookups/s", peak)
+
+    def sales_rows(self, sales):
+        # What display_ticket_sales formats for its table
+        return [(str(day), values["ticket_count"], ", ".join(f"{ticket_type} ({count})" for ticket_type, count in values["ticket_types"].items()),
+                 f"{values['total_price']:.2f}") for day, values in sales.get_daily_sales().items()]
+
+    def group_pricing(self, data):
+        # What add_to_cart reprices: a school group's cart, with the cached prices invalidated as a discount save does
+        pricing = PricingEngine(data["tickets"])
+        cart = Cart([pricing.line("Group Ticket (10+)", GROUP_CART - 20), pricing.line("Child Ticket", 20)])
+        def price_cart():
+            pricing.invalidate()
+            cart.set_cart_items(pricing.price_lines(cart.get_cart_items()))
+        return self.measure("price_group_cart", price_cart, self.args.repeat * 10, GROUP_CART, "tickets/s")
+
+    def checkout(self, layer, data):
+        customers = [customer for customer in data["customers"]]
+        def checkout_one():
+            customer = customers[self.rng.randrange(len(customers))]
+            cart = customer.get_cart()
+            for ticket in self.rng.choices(data["tickets"], k=self.rng.randint(1, 3)):
+                cart.add_to_cart(ticket)
+            items = cart.get_cart_items()
+            order = Order(purchase_date=date.today(), status=Status.Paid, tickets=items,
+                          payment=Payment(payment_method="Credit Card", amount=cart.calculate_cart_total()))
+            customer.add_order_to_history(order)
+            layer.record_order(data, customer, order)
+            cart.clear_cart()
+        samples = time_calls(checkout_one, self.args.checkouts)
+        peak = peak_memory(checkout_one) if self.args.memory else None
+        return self.result("checkout", samples, 1, "checkouts/s", peak)
+
+
+# Baseline
+def result_key(result):
+    return f"{result['operation']}/{result['orders']}"
+
+
+def compare(results, baseline, tolerance):
+    """Mark each result with its change against the baseline and return the keys that regressed."""
+    regressions = []
+    for result in results:
+        reference = baseline.get("results", {}).get(result_key(result))
+        if reference is None:
+            continue
+        result["p50_change"] = result["p50"] / reference["p50"] - 1
+        if result["peak_bytes"] and reference.get("peak_bytes"):
+            result["peak_change"] = result["peak_bytes"] / reference["peak_bytes"] - 1
+        slower = result["p50_change"] > tolerance and result["p50"] - reference["p50"] > NOISE_FLOOR
+        if slower or result.get("peak_change", 0) > tolerance:
+            regressions.append(result_key(result))
+    return regressions
+
+
+def settings(args):
+    return {"backend": args.backend, "log_mode": args.log_mode, "orders_per_customer": args.orders_per_customer,
+            "seed": args.seed, "python": platform.python_version()}
+
+
+def print_results(results, regressions):
+    print(f"{'operation':<16}{'orders':>9}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'throughput':>24}{'peak MiB':>10}{'vs baseline':>14}")
+    for result in results:
+        peak = f"{result['peak_bytes'] / 2 ** 20:.1f}" if result["peak_bytes"] is not None else "-"
+        change = f"{result['p50_change']:+.0%}" if "p50_change" in result else "-"
+        if result_key(result) in regressions:
+            change += " !"
+        print(f"{result['operation']:<16}{result['orders']:>9}{result['p50'] * 1000:>11.3f}{result['p95'] * 1000:>11.3f}"
+              f"{result['p99'] * 1000:>11.3f}{result['throughput']:>13.0f} {result['unit']:<10}{peak:>10}{change:>14}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Comma-separated dataset sizes in orders (up to 1000000)")
+    parser.add_argument("--orders-per-customer", type=int, default=5)
+    parser.add_argument("--backend", default="pickle", choices=("pickle", "binary", "framed", "sqlite"))
+    parser.add_argument("--log-mode", action="store_true", help="Run the data layer with the append-only log, as the UI does")
+    parser.add_argument("--repeat", type=int, default=5, help="Samples per bulk operation")
+    parser.add_argument("--lookups", type=int, default=2000, help="Login lookups per size")
+    parser.add_argument("--checkouts", type=int, default=20, help="Checkouts per size")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="Skip the traced peak-memory runs")
+    parser.add_argument("--data-dir", help="Where to generate the datasets (a temporary directory by default)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown or memory growth before flagging (0.25 = 25%%)")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    results = []
+    root = args.data_dir or tempfile.mkdtemp(prefix="adventure_land_bench_")
+    for orders in (int(size) for size in args.sizes.split(",")):
+        print(f"Generating {orders} orders...", file=sys.stderr)
+        results.extend(Benchmark(os.path.join(root, str(orders)), orders, args).run())
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline.get("settings") != settings(args):
+            print(f"Note: the baseline was recorded with {baseline.get('settings')}", file=sys.stderr)
+    regressions = compare(results, baseline, args.tolerance)
+    print_results(results, regressions)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump({"settings": settings(args), "results": {result_key(result): result for result in results}}, file, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+    elif regressions:
+        print(f"Regressions beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
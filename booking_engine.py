@@ -0,0 +1,408 @@
+"""
+Headless booking engine.
+
+BookingEngine holds the loaded entities and exposes what a ticket terminal does (log in, fill a cart,
+check out, see the order history, change discounts, read the sales report) as plain method calls that
+take and return JSON-friendly values. The Tk UI and the kiosk server both drive it, so the business
+rules live in one place. Every call runs under one lock, so any number of sessions can mutate the data
+concurrently without interleaving half-applied changes, and first takes in what other engines sharing
+the data files (other entrances) changed, so it never acts on a stale copy.
+"""
+import functools
+import os
+import secrets
+import threading
+import time
+from datetime import date, timedelta
+from business_model import Admin, CustomerAccount, IdentityIndex, Order, Payment, PricingEngine, Status
+from data_layer import DataLayer
+
+MAX_QUANTITY = 1000  # Tickets on one cart or import line
+
+def synchronized(method):
+    @functools.wraps(method)
+    def locked(self, *args, **kwargs):
+        with self.lock:
+            self.refresh()
+            return method(self, *args, **kwargs)
+    return locked
+
+
+def as_date(value):
+    """A date given as a date or, over the wire, as an ISO string (None stays None)."""
+    if value is None or isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value).strip())
+    except ValueError:
+        raise ValueError(f"Invalid date {value}. Please use YYYY-MM-DD.")
+
+
+def validate_payment(payment_method, card_number, expire_date, ccv):
+    """Raise ValueError with the message to show when the card details are not acceptable."""
+    if not card_number.isdigit() or len(card_number) < 12:
+        raise ValueError("Invalid card number. Please enter a valid card number.")
+    if not expire_date or len(expire_date) != 5 or '/' not in expire_date:
+        raise ValueError("Invalid expiration date. Please use MM/YY format.")
+    if not ccv.isdigit() or len(ccv) != 3:
+        raise ValueError("Invalid CCV. Please enter a 3-digit CCV.")
+    if payment_method == "Debit Card" and not card_number.startswith("4"):  # Only cards starting with '4' for Debit
+        raise ValueError("Invalid Debit Card number.")
+
+
+class Session:
+    """A logged-in customer or admin."""
+    def __init__(self, role, user):
+        self.role = role
+        self.user = user  # The CustomerAccount or Admin
+
+
+class BookingEngine:
+    def __init__(self, data_layer=None):
+        # Writes run on the data layer's background worker, so calls never wait on disk I/O; with ORDER_ARCHIVE_DAYS
+        # set, orders older than that many days move to the compressed archive at startup
+        archive_after = int(os.environ["ORDER_ARCHIVE_DAYS"]) if os.environ.get("ORDER_ARCHIVE_DAYS") else None
+        self.data_layer = data_layer or DataLayer(log_mode=True, backend=os.environ.get("DATA_LAYER_BACKEND", "pickle"), background=True,
+                                                  archive_after=archive_after)
+        self.data = None  # Set by start()
+        self.identity_index = None
+        self.pricing = None  # Cached effective prices of the catalog, set by start()
+        self.sessions = {}  # token -> Session
+        self.timings = {}  # Startup step -> seconds
+        self.lock = threading.RLock()
+
+    # Startup and Shutdown
+    def start(self, progress=None):
+        """Load the entities and seed the catalog; progress(fraction, message) is called as loading goes."""
+        start = time.perf_counter()
+        data = self.data_layer.load_all(lazy_customers=True, progress=progress)  # Customers are materialized on demand
+        self.timings["load"] = time.perf_counter() - start
+        start = time.perf_counter()
+        data["tickets"] = self.data_layer.seed_catalog(data["tickets"])  # Only writes when the catalog is missing or outdated
+        self.timings["seed"] = time.perf_counter() - start
+        with self.lock:
+            self.data = data
+            # O(1) login and signup checks; accounts are resolved through the customer cache
+            self.identity_index = IdentityIndex(admins=data["admins"], customer_store=data["customers"])
+            self.pricing = PricingEngine(data["tickets"])
+
+    def refresh(self):
+        """Apply other processes' changes; sessions follow their accounts when those were reloaded."""
+        if self.data is None:
+            return
+        changed = self.data_layer.refresh(self.data)
+        if "tickets" in changed:
+            self.pricing.set_catalog(self.data["tickets"])  # Another process changed a discount
+        if not changed & {"customers", "admins"}:
+            return
+        self.identity_index = IdentityIndex(admins=self.data["admins"], customer_store=self.data["customers"])
+        for token, session in list(self.sessions.items()):
+            if session.role == "customer":
+                user = self.identity_index.find_customer(session.user.get_username())
+            else:
+                user = self.identity_index.find_admin(session.user.get_admin_id())
+            if user is None:
+                del self.sessions[token]  # Deleted by another process
+                continue
+            session.user = user
+            if session.role == "customer":
+                self.data["customers"].pin(user)
+
+    @synchronized
+    def close(self):
+        """Write back changed accounts and wait for the queued writes."""
+        if self.data is not None:
+            self.data["customers"].flush()
+        self.data_layer.shutdown()
+
+    # Sessions
+    def session(self, token, role=None):
+        session = self.sessions.get(token)
+        if session is None:
+            raise ValueError("Please log in first.")
+        if role is not None and session.role != role:
+            raise ValueError(f"Only a logged-in {role} can do this.")
+        return session
+
+    def customer(self, token):
+        return self.session(token, "customer").user
+
+    @synchronized
+    def login(self, username, password, role="customer"):
+        """Return a session token, or raise ValueError for a wrong username or password."""
+        if role == "customer":
+            user = self.identity_index.find_customer(username)
+        else:
+            user = self.identity_index.find_admin(username)
+        if user is None or not user.validate_password(password):
+            raise ValueError(f"Invalid username or password for {role}.")
+        if role == "customer":
+            self.data["customers"].pin(user)  # Keep the session's account cached
+        token = secrets.token_hex(16)
+        self.sessions[token] = Session(role, user)
+        return {"token": token, "role": role, "username": self.username(user)}
+
+    @synchronized
+    def logout(self, token):
+        session = self.sessions.pop(token, None)
+        if session is not None and session.role == "customer" and not any(
+                other.user is session.user for other in self.sessions.values()):
+            self.data["customers"].unpin(session.user)  # The account may be evicted again
+
+    @synchronized
+    def signup(self, username, password, email="", role="customer"):
+        """Create an account; raises ValueError when it is invalid or already taken."""
+        if role == "customer":
+            customer = CustomerAccount(username=username, password=password, email=email, purchase_date=date.today(), tickets=[], order_store=self.data["orders"])
+            customer.validate_account_creation()
+            self.identity_index.add_customer(customer)  # Rejects a username or email that is already taken
+            self.data["customers"].append(customer)
+            self.data_layer.record_account(self.data, customer)
+        else:
+            admin = Admin(admin_id=username, password=password, orders=[], email=email)
+            admin.validate_admin_creation()
+            self.identity_index.add_admin(admin)  # Rejects an admin ID that is already taken
+            self.data["admins"].append(admin)
+            self.data_layer.save_admins(self.data["admins"])
+
+    # Catalog and Cart
+    @synchronized
+    def catalog(self):
+        return [{"ticket_type": ticket.get_ticket_type(), "description": ticket.get_description(), "price": ticket.get_price(),
+                 "validity": ticket.get_validity(), "limitations": ticket.get_limitations(), "discount": ticket.get_discount(),
+                 "discounted_price": self.pricing.unit_price(ticket.get_ticket_type())}
+                for ticket in self.data["tickets"]]
+
+    @synchronized
+    def add_to_cart(self, token, ticket_type, quantity=1):
+        """Add quantity tickets of a type; they join the cart's line for that type."""
+        customer = self.customer(token)
+        cart = customer.get_cart()
+        if not isinstance(quantity, int) or not 1 <= cart.get_quantity(ticket_type) + quantity <= MAX_QUANTITY:
+            raise ValueError(f"A cart holds from 1 to {MAX_QUANTITY} tickets of a type.")
+        cart.add_to_cart(self.pricing.line(ticket_type), quantity)  # Raises ValueError for an unknown ticket type
+        # Group promotions follow how many tickets of a type the cart holds
+        cart.set_cart_items(self.pricing.price_lines(cart.get_cart_items()))
+        return self.cart_summary(customer)
+
+    @synchronized
+    def remove_from_cart(self, token, position, quantity=None):
+        """Take quantity tickets (the whole line when None) off the cart line at position."""
+        customer = self.customer(token)
+        items = customer.get_cart().get_cart_items()
+        if not 0 <= position < len(items):
+            raise ValueError("Select a ticket to remove.")
+        if quantity is not None and (not isinstance(quantity, int) or quantity < 1):
+            raise ValueError("Enter how many tickets to remove.")
+        customer.get_cart().remove_from_cart(items[position], quantity)
+        customer.get_cart().set_cart_items(self.pricing.price_lines(customer.get_cart().get_cart_items()))  # A group may shrink below a promotion
+        return self.cart_summary(customer)
+
+    @synchronized
+    def clear_cart(self, token):
+        customer = self.customer(token)
+        customer.get_cart().clear_cart()
+        return self.cart_summary(customer)
+
+    @synchronized
+    def view_cart(self, token):
+        return self.cart_summary(self.customer(token))
+
+    def cart_summary(self, customer):
+        cart = customer.get_cart()
+        return {"items": [{"ticket_type": ticket.get_ticket_type(), "price": ticket.get_price(), "quantity": ticket.get_quantity(),
+                           "line_total": ticket.get_line_total()} for ticket in cart.get_cart_items()],
+                "tickets": cart.get_ticket_count(), "total": cart.calculate_cart_total()}
+
+    @synchronized
+    def checkout(self, token, payment_method, card_number, expire_date, ccv):
+        """Pay for the cart; returns the new order, or raises ValueError for an empty cart or bad card details."""
+        customer = self.customer(token)
+        cart = customer.get_cart()
+        items = cart.get_cart_items()
+        if not items:
+            raise ValueError("Your cart is empty.")
+        validate_payment(payment_method, card_number, expire_date, ccv)
+        payment = Payment(payment_method=payment_method, amount=cart.calculate_cart_total())
+        order = Order(purchase_date=date.today(), status=Status.Paid, tickets=items, payment=payment)
+        customer.add_order_to_history(order)  # Stored once, in the shared order store
+        self.data_layer.record_order(self.data, customer, order)
+        cart.clear_cart()
+        return {"order_id": order.get_order_id(), "total_price": order.get_total_price(), "payment_method": payment_method}
+
+    # Accounts
+    @synchronized
+    def order_history(self, token, start=None, end=None):
+        """The customer's orders placed from start to end (inclusive, all by default); archived ones are paged in."""
+        return [self.order_summary(order) for order in self.customer(token).get_purchase_history(as_date(start), as_date(end))]
+
+    def order_summary(self, order):
+        return {"order_id": order.get_order_id(), "purchase_date": order.get_purchase_date(), "status": order.get_status().name,
+                "total_price": order.get_total_price(),
+                "tickets": [{"ticket_type": ticket.get_ticket_type(), "price": ticket.get_price(), "quantity": ticket.get_quantity()}
+                            for ticket in order.get_tickets()]}
+
+    @synchronized
+    def account(self, token):
+        session = self.session(token)
+        user = session.user
+        return {"role": session.role, "username": self.username(user), "email": user.get_email(), "password": user.get_password()}
+
+    @synchronized
+    def update_account(self, token, username=None, password=None, email=None):
+        """Change the logged-in account; empty values are left unchanged."""
+        session = self.session(token)
+        if session.role == "customer":
+            self.identity_index.modify_customer(session.user, username=username or None, password=password or None, email=email or None)
+        else:
+            if username:
+                self.identity_index.set_admin_id(session.user, username)
+            if password:
+                session.user.set_password(password)
+            if email:
+                session.user.set_email(email)
+            self.data_layer.save_admins(self.data["admins"])
+
+    @synchronized
+    def delete_account(self, token):
+        customer = self.customer(token)
+        self.identity_index.remove_customer(customer)
+        self.data["customers"].remove(customer)
+        self.data_layer.delete_customer(customer.get_username())
+        for other, session in list(self.sessions.items()):
+            if session.user is customer:
+                del self.sessions[other]
+
+    def username(self, user):
+        return user.get_username() if isinstance(user, CustomerAccount) else user.get_admin_id()
+
+    # Admin Operations
+    @synchronized
+    def set_discounts(self, token, discounts):
+        """Apply {ticket_type: percent}; returns the ticket types whose discount changed."""
+        self.session(token, "admin")
+        for ticket_type, discount in discounts.items():
+            if not isinstance(discount, int) or not 0 <= discount <= 100:
+                raise ValueError(f"Invalid discount value for {ticket_type}. Enter 0-100.")
+        changed = [ticket for ticket in self.data["tickets"]
+                   if ticket.get_ticket_type() in discounts and discounts[ticket.get_ticket_type()] != ticket.get_discount()]
+        for ticket in changed:
+            ticket.set_discount(discounts[ticket.get_ticket_type()])
+        self.pricing.invalidate()
+        self.data_layer.record_discounts(self.data, changed)
+        return [ticket.get_ticket_type() for ticket in changed]
+
+    @synchronized
+    def import_orders(self, token, rows):
+        """
+        Import pre-sold partner and group orders (rows as described in import_orders.py). Rows sharing an order
+        reference and username become one paid order priced at the current discounts, and customers that do
+        not exist yet are created. Everything accepted is stored in one persistence pass; rejected rows come
+        back as [line, reason], and an order is rejected whole when any of its lines is.
+        """
+        self.session(token, "admin")
+        catalog = self.pricing.get_catalog()
+        groups = {}  # (reference, username) -> [(line, parsed row or the ValueError it raised)]
+        for position, row in enumerate(rows, 1):
+            line = row.get("line", position)
+            try:
+                parsed = self.parse_import_row(row, catalog)
+            except ValueError as e:
+                parsed = e
+            reference = str(row.get("order") or "").strip() or f"on line {line}"
+            groups.setdefault((reference, str(row.get("username") or "").strip().casefold()), []).append((line, parsed))
+        rejected, accepted, accounts, new_customers = [], [], [], []
+        for (reference, _), lines in groups.items():
+            errors = [[line, str(parsed)] for line, parsed in lines if isinstance(parsed, ValueError)]
+            if not errors and len({parsed["purchase_date"] for _, parsed in lines}) > 1:
+                errors = [[lines[0][0], "The lines of one order must share a purchase date."]]
+            if not errors:
+                username, error = self.import_customer([parsed for _, parsed in lines], accounts, new_customers)
+                errors = [[line, error] for line, _ in lines] if error else []
+            if errors:
+                failed = {line for line, _ in errors}
+                rejected += errors + [[line, f"Another line of order {reference} was rejected."] for line, _ in lines if line not in failed]
+                continue
+            accepted.append((username, [parsed for _, parsed in lines]))
+        orders = []
+        # One ID lease for the whole batch instead of one per block of 100 orders
+        for order_id, (username, lines) in zip(self.data_layer.order_ids.reserve(len(accepted)), accepted):
+            quantities = {}  # One line per ticket type, however many rows it was spread over
+            for parsed in lines:
+                ticket_type = parsed["ticket"].get_ticket_type()
+                quantities[ticket_type] = quantities.get(ticket_type, 0) + parsed["quantity"]
+            tickets = [self.pricing.line(ticket_type, quantity, on=lines[0]["purchase_date"]) for ticket_type, quantity in quantities.items()]
+            order = Order(purchase_date=lines[0]["purchase_date"], status=Status.Paid, tickets=tickets, order_id=order_id)
+            order.calculate_total_price()
+            order.set_payment(Payment(payment_method=lines[0]["payment_method"], amount=order.get_total_price()))
+            self.data["orders"].add(order, username)
+            orders.append(order)
+        self.data_layer.record_import(self.data, new_customers, orders)
+        rejected.sort(key=lambda entry: entry[0])
+        return {"orders": len(orders), "tickets": sum(order.get_ticket_count() for order in orders),
+                "total_price": sum(order.get_total_price() for order in orders), "accounts": accounts, "rejected": rejected}
+
+    @synchronized
+    def archive_orders(self, token, days):
+        """Move the orders older than days days to the compressed archive; returns how many were moved."""
+        self.session(token, "admin")
+        if not isinstance(days, int) or days < 0:
+            raise ValueError("Enter the age in days as a whole number of 0 or more.")
+        return self.data_layer.archive_orders(self.data, date.today() - timedelta(days=days))
+
+    def parse_import_row(self, row, catalog):
+        """Check one import row and return its fields; raises ValueError with the reason it is rejected."""
+        if row.get("error"):
+            raise ValueError(row["error"])  # Set by the reader for a row it could not parse
+        username = str(row.get("username") or "").strip()
+        if not username:
+            raise ValueError("Missing username.")
+        ticket_type = str(row.get("ticket_type") or "").strip()
+        if ticket_type not in catalog:
+            raise ValueError(f"Unknown ticket type: {ticket_type}")
+        quantity = str(row.get("quantity") or 1).strip()
+        if not quantity.isdigit() or not 1 <= int(quantity) <= MAX_QUANTITY:
+            raise ValueError(f"Quantity must be a whole number from 1 to {MAX_QUANTITY}.")
+        purchase_date = date.today()
+        if row.get("purchase_date"):
+            try:
+                purchase_date = date.fromisoformat(str(row["purchase_date"]).strip())
+            except ValueError:
+                raise ValueError(f"Invalid purchase date {row['purchase_date']}. Please use YYYY-MM-DD.")
+        return {"username": username, "ticket": catalog[ticket_type], "quantity": int(quantity), "purchase_date": purchase_date,
+                "email": str(row.get("email") or "").strip(), "password": str(row.get("password") or ""),
+                "payment_method": str(row.get("payment_method") or "").strip() or "Partner"}
+
+    def import_customer(self, lines, accounts, new_customers):
+        """Resolve the customer of an imported order, creating the account when needed; returns (username, error)."""
+        username = self.identity_index.find_customer_username(lines[0]["username"])
+        if username is not None:
+            return username, None
+        details = next((parsed for parsed in lines if parsed["email"]), lines[0])
+        password = details["password"] or secrets.token_urlsafe(9)
+        customer = CustomerAccount(username=details["username"], password=password, email=details["email"],
+                                   purchase_date=date.today(), tickets=[], order_store=self.data["orders"])
+        try:
+            customer.validate_account_creation()
+            self.identity_index.add_customer(customer)  # Rejects an email that is already taken
+        except ValueError as e:
+            return None, str(e)
+        self.data["customers"].append(customer)
+        new_customers.append(customer)
+        # A generated password is handed back so the partner can pass it on
+        accounts.append({"username": customer.get_username(), "password": None if details["password"] else password})
+        return customer.get_username(), None
+
+    @synchronized
+    def daily_sales(self, token):
+        self.session(token, "admin")
+        return self.data["sales"].get_days()
+
+    @synchronized
+    def rebuild_sales(self, token):
+        """Recompute the sales aggregate from the orders; returns whether it matched the maintained one."""
+        self.session(token, "admin")
+        rebuilt = self.data_layer.rebuild_sales(self.data["orders"].including_archive())
+        matched = rebuilt == self.data["sales"]
+        self.data["sales"] = rebuilt
+        return matched
@@ -1,3 +1,6 @@
+import sys
+from bisect import bisect_right
+from collections import Counter
 from datetime import date
 from enum import Enum
 
@@ -6,14 +9,34 @@ class Status(Enum):
     Paid= 2
     Cancelled= 3
 
-class Order:
+class ChangeTracked:
+    """
+    Base of the entities the data layer stores on their own. Setters mark an entity dirty; the data layer writes only
+    dirty entities and marks them clean once their write is queued. A new entity starts dirty, as it was never stored.
+    """
+    __slots__ = ("__dirty",)
+    def __init__(self):
+        self.__dirty = True
+    def is_dirty(self):
+        return self.__dirty
+    def mark_dirty(self):
+        self.__dirty = True
+    def mark_clean(self):
+        self.__dirty = False
+
+class Order(ChangeTracked):
+    __slots__ = ("__order_id", "__status", "__purchase_date", "__tickets", "__payment", "__total_price", "__customer")
     #to track the next available order ID
     order_id = 1
-    def __init__(self, purchase_date: date,status , tickets: list['Ticket'], payment: 'Payment' = None, total_price=0):
-        # Automatically assign the next available order ID
-        self.__order_id = Order.order_id
+    id_allocator = None  # Durable allocator installed by the data layer; the counter above is the in-memory fallback
+    def __init__(self, purchase_date: date,status , tickets: list['Ticket'], payment: 'Payment' = None, total_price=0, order_id=None, customer=None):
+        super().__init__()
+        # New orders get their ID on first use, so orders that are never stored (e.g. an account's placeholder) use none
+        self.__order_id = order_id  # Persisted orders keep the ID they were stored with
         self.__status = status
-        Order.order_id += 1  # Increment the class-level order ID for the next instance
+        if order_id is not None and Order.id_allocator is None:
+            Order.order_id = max(Order.order_id, order_id + 1)  # Keep the fallback counter past the loaded IDs
+        self.__customer = customer  # Username of the owning customer, the order's only link to its account
         self.__purchase_date = purchase_date
         self.__tickets = tickets #Aggregation: Order can link to Ticket objects, but they exist independently.
         self.__payment = payment
@@ -22,7 +45,18 @@ class Order:
     def get_status(self):
         return self.__status
     def get_order_id(self):
+        if self.__order_id is None:
+            self.__order_id = Order.allocate_id()
         return self.__order_id
+    def has_order_id(self):
+        return self.__order_id is not None  # Unlike get_order_id, never allocates one
+    @classmethod
+    def allocate_id(cls):
+        if cls.id_allocator is not None:
+            return cls.id_allocator.next_id()
+        order_id = cls.order_id
+        cls.order_id += 1  # Increment the class-level order ID for the next instance
+        return order_id
     def get_purchase_date(self):
         return self.__purchase_date
     def get_tickets(self):
@@ -31,49 +65,221 @@ class Order:
         return self.__payment
     def get_total_price(self):
         return self.__total_price
+    def get_customer(self):
+        return self.__customer
     # Setters
+    def set_status(self, status: Status):
+        self.__status = status
+        self.mark_dirty()
+    def set_customer(self, customer):
+        self.__customer = customer
+        self.mark_dirty()
     def set_purchase_date(self, purchase_date: date):
         self.__purchase_date = purchase_date
+        self.mark_dirty()
     def set_tickets(self, tickets: list['Ticket']):
         self.__tickets = tickets
+        self.mark_dirty()
     def set_payment(self, payment: 'Payment'):
         self.__payment = payment
+        self.mark_dirty()
     def set_total_price(self, total_price: float):
         self.__total_price = total_price
+        self.mark_dirty()
     # Other methods
+    def get_ticket_count(self):
+        return sum(ticket.get_quantity() for ticket in self.__tickets)  # Lines carry a quantity of tickets each
     def calculate_total_price(self):
-        total_price = sum(ticket.get_price() for ticket in self.get_tickets())  # Sum updated ticket prices
+        total_price = sum(ticket.get_line_total() for ticket in self.get_tickets())  # Sum updated line totals
         self.set_total_price(total_price)
     def update_tickets(self, new_tickets: list['Ticket']):
         self.set_tickets(new_tickets)  # Aggregation: Updates aggregated Ticket objects.
         self.calculate_total_price()
     def has_payment(self):
         return self.get_payment() is not None  # Aggregation: Checks for the aggregated Payment object.
-    def apply_discounts(self, group_size: int = 0, is_online: bool = False, is_renewal: bool = False):
-        for ticket in self.__tickets:
-            ticket_type = ticket.get_ticket_type()
-
-            # Apply specific discounts
-            if ticket_type == "Two-Day Pass" and is_online:
-                ticket.set_price(ticket.get_price() * 0.9)  # 10% online discount
-            elif ticket_type == "Annual Membership" and is_renewal:
-                ticket.set_price(ticket.get_price() * 0.85)  # 15% renewal discount
-            elif ticket_type == "Group Ticket" and group_size >= 10:
-                ticket.set_price(ticket.get_price() * 0.8)  # 20% group discount
+    def apply_discounts(self, group_size: int = 0, is_online: bool = False, is_renewal: bool = False, pricing: 'PricingEngine' = None):
+        # The promotions are rules in PricingEngine; the order gets priced copies of its lines, so tickets
+        # shared with a cart or another order keep their prices and applying twice does not discount twice
+        pricing = pricing or PricingEngine()
+        self.set_tickets(pricing.price_lines(self.__tickets, group_size or None, is_online, is_renewal, self.__purchase_date))
         # Recalculate the total price after applying discounts
         self.calculate_total_price()
         def set_status(self, status: Status):
             if not isinstance(status, Status):
                 raise ValueError(f"Invalid status. Status must be one of: {list(Status)}")
             self.__status = status
-class CustomerAccount:
-    def __init__(self, username, password, email, purchase_date: date, tickets: list, purchase_history=None, cart=None):
+class OrderStore:
+    """
+    The single home of every order; customer purchase histories are views over it.
+    The order ID index makes lookups, cancels and deletes O(1) however many orders there are.
+    Only the hot (recent) orders are held; with an archive (order_archive.OrderArchive), the history and report
+    queries page in the archived orders their date range reaches into. get, cancel and remove see hot orders only.
+    """
+    def __init__(self, orders: list = None, archive=None):
+        self.__orders = {}  # order_id -> Order, in insertion order
+        self.__by_customer = {}  # username -> {order_id: Order} of that customer's orders, in insertion order
+        self.__archive = archive
+        for order in orders or []:
+            self.add(order)
+    def __iter__(self):
+        return iter(list(self.__orders.values()))
+    def __len__(self):
+        return len(self.__orders)
+    def __contains__(self, order):
+        # An order with no ID yet was never added, and asking for its ID would allocate one
+        return order.has_order_id() and self.__orders.get(order.get_order_id()) is order
+    def get(self, order_id):
+        return self.__orders.get(order_id)
+    def owner(self, order_id):
+        """Username of the customer an order belongs to (None for unknown or unowned orders)."""
+        order = self.__orders.get(order_id)
+        return order.get_customer() if order is not None else None
+    def add(self, order: Order, customer=None):
+        if customer is not None:
+            order.set_customer(customer)
+        if order.get_order_id() in self.__orders:
+            return  # Already stored; adding again must not duplicate it
+        self.__orders[order.get_order_id()] = order
+        if order.get_customer() is not None:
+            self.__by_customer.setdefault(order.get_customer(), {})[order.get_order_id()] = order
+    append = add  # Lets the store stand in for the old orders list
+    def remove(self, order_id):
+        order = self.__orders.pop(order_id, None)
+        if order is not None and order.get_customer() in self.__by_customer:
+            self.__by_customer[order.get_customer()].pop(order_id, None)
+        return order
+    def cancel(self, order_id):
+        order = self.__orders.get(order_id)
+        if order is not None:
+            order.set_status(Status.Cancelled)
+        return order
+    def get_archive(self):
+        return self.__archive
+    def find(self, order_id):
+        """get, falling back to the archive (as a read-only copy) for an order no longer hot."""
+        order = self.__orders.get(order_id)
+        if order is None and self.__archive is not None:
+            order = self.__archive.get_order(order_id)
+        return order
+    def history_for(self, username, start: date = None, end: date = None, archived=True):
+        """A customer's orders, optionally only those placed from start to end (inclusive); archived ones come first."""
+        hot = [order for order in self.__by_customer.get(username, {}).values() if in_range(order, start, end)]
+        if self.__archive is None or not archived:
+            return hot
+        return self.__archive.find_orders(username=username, start=start, end=end) + hot
+    def including_archive(self, start: date = None, end: date = None):
+        """Every order placed from start to end (inclusive), archived and hot, for reports over the whole history."""
+        hot = [order for order in self.__orders.values() if in_range(order, start, end)]
+        if self.__archive is None:
+            return hot
+        return self.__archive.find_orders(start=start, end=end) + hot
+    def replace_history(self, username, orders: list):
+        for order_id in list(self.__by_customer.get(username, {})):
+            self.remove(order_id)
+        for order in orders:
+            self.add(order, username)
+    def rename_customer(self, old_username, new_username):
+        orders = self.__by_customer.pop(old_username, {})
+        for order in orders.values():
+            order.set_customer(new_username)
+        self.__by_customer.setdefault(new_username, {}).update(orders)
+
+def in_range(order: Order, start: date = None, end: date = None):
+    return (start is None or order.get_purchase_date() >= start) and (end is None or order.get_purchase_date() <= end)
+
+class SalesAggregate:
+    """Per-day totals of paid orders (tickets sold, revenue and counts per ticket type), kept up to date order by order."""
+    def __init__(self, days: list = None):
+        self.__daily = {}  # purchase_date -> {"ticket_count", "ticket_types", "total_price"}
+        self.__changed = set()  # Days changed since the aggregate was loaded or last stored, so saves write only those
+        for day in days or []:
+            self.__daily[day["purchase_date"]] = {"ticket_count": day["ticket_count"],
+                                                  "ticket_types": dict(day["ticket_types"]),
+                                                  "total_price": day["total_price"]}
+    def __len__(self):
+        return len(self.__daily)
+    def __eq__(self, other):
+        if not isinstance(other, SalesAggregate):
+            return NotImplemented
+        return self.get_days() == other.get_days()
+    def record_order(self, order: Order, sign=1):
+        """Add a paid order to its day in O(lines in order); sign=-1 takes it back out."""
+        if order.get_status() != Status.Paid:  # Only count paid orders
+            return
+        self.__changed.add(order.get_purchase_date())
+        day = self.__daily.setdefault(order.get_purchase_date(), {"ticket_count": 0, "ticket_types": {}, "total_price": 0.0})
+        day["ticket_count"] += sign * order.get_ticket_count()
+        day["total_price"] += sign * order.get_total_price()
+        for ticket in order.get_tickets():
+            ticket_type = ticket.get_ticket_type()
+            day["ticket_types"][ticket_type] = day["ticket_types"].get(ticket_type, 0) + sign * ticket.get_quantity()
+            if not day["ticket_types"][ticket_type]:
+                del day["ticket_types"][ticket_type]
+        if not day["ticket_count"]:
+            del self.__daily[order.get_purchase_date()]
+    def remove_order(self, order: Order):
+        self.record_order(order, sign=-1)
+    def record_raw_order(self, raw):
+        """record_order for a stored order record, without building the Order and its tickets."""
+        if raw["status"] != Status.Paid.name:
+            return
+        ticket_types = {}
+        for ticket in raw["tickets"]:
+            ticket_types[ticket["ticket_type"]] = ticket_types.get(ticket["ticket_type"], 0) + ticket.get("quantity", 1)
+        self.add_day(raw["purchase_date"], {"ticket_count": sum(ticket_types.values()), "ticket_types": ticket_types, "total_price": raw["total_price"]})
+    def add_day(self, purchase_date, totals):
+        """Add one day of another aggregate's totals (e.g. a batch of imported orders) to that day."""
+        self.__changed.add(purchase_date)
+        day = self.__daily.setdefault(purchase_date, {"ticket_count": 0, "ticket_types": {}, "total_price": 0.0})
+        day["ticket_count"] += totals["ticket_count"]
+        day["total_price"] += totals["total_price"]
+        for ticket_type, count in totals["ticket_types"].items():
+            day["ticket_types"][ticket_type] = day["ticket_types"].get(ticket_type, 0) + count
+    def get_day(self, purchase_date):
+        day = self.__daily.get(purchase_date)
+        return dict(day, purchase_date=purchase_date) if day else None
+    # Change Tracking
+    def is_dirty(self):
+        return bool(self.__changed)
+    def get_changed_dates(self):
+        return set(self.__changed)
+    def mark_clean(self, dates=None):
+        """Forget the changes to the given days (all of them when None) once they are stored."""
+        if dates is None:
+            self.__changed.clear()
+        else:
+            self.__changed.difference_update(dates)
+    def get_daily_sales(self):
+        return {purchase_date: self.__daily[purchase_date] for purchase_date in sorted(self.__daily)}
+    def get_days(self):
+        """The aggregate as a list of rows, rounded to cents so rebuilt and incremental totals compare equal."""
+        return [{"purchase_date": purchase_date, "ticket_count": day["ticket_count"],
+                 "ticket_types": dict(day["ticket_types"]), "total_price": round(day["total_price"], 2)}
+                for purchase_date, day in self.get_daily_sales().items()]
+    @classmethod
+    def rebuild(cls, orders):
+        """Recompute the aggregate from raw orders, e.g. to verify the maintained one."""
+        aggregate = cls()
+        for order in orders:
+            if order.get_customer() is not None:  # Sales are what customers bought
+                aggregate.record_order(order)
+        return aggregate
+
+class CustomerAccount(ChangeTracked):
+    __slots__ = ("__username", "__password", "__email", "__order", "__purchase_history", "__cart", "__order_store")
+    def __init__(self, username, password, email, purchase_date: date, tickets: list, purchase_history=None, cart=None, order_store: OrderStore = None):
+        super().__init__()
         self.__username = username
         self.__password = password
         self.__email = email
         self.__order = Order(purchase_date, Status.Pending, tickets)
+        self.__order_store = order_store  # When set, the purchase history is a view over the shared store
         self.__purchase_history = purchase_history or []
         self.__cart = cart or Cart()  # Initialize the cart
+        if order_store is not None:
+            for order in self.__purchase_history:
+                order_store.add(order, username)
+            self.__purchase_history = None
         # Getters
     def get_username(self):
         return self.__username
@@ -83,21 +289,43 @@ class CustomerAccount:
         return self.__email
     def get_order(self):
         return self.__order
-    def get_purchase_history(self):
-        return self.__purchase_history
+    def get_purchase_history(self, start: date = None, end: date = None):
+        """The orders placed from start to end (inclusive, the whole history by default), paging in archived ones."""
+        if self.__order_store is not None:
+            return self.__order_store.history_for(self.__username, start, end)
+        if start is None and end is None:
+            return self.__purchase_history
+        return [order for order in self.__purchase_history if in_range(order, start, end)]
     def get_cart(self):
         return self.__cart
+    # Change Tracking (the account's record also holds its cart and order lines)
+    def is_dirty(self):
+        return super().is_dirty() or self.__cart.is_dirty() or self.__order.is_dirty()
+    def mark_clean(self):
+        super().mark_clean()
+        self.__cart.mark_clean()
+        self.__order.mark_clean()
     # Setters
     def set_username(self, username):
+        if self.__order_store is not None:
+            self.__order_store.rename_customer(self.__username, username)
         self.__username = username
+        self.mark_dirty()
     def set_password(self, password):
         self.__password = password
+        self.mark_dirty()
     def set_email(self, email):
         self.__email = email
+        self.mark_dirty()
     def set_order(self, purchase_date: date, tickets: list):
         self.__order = Order(purchase_date, tickets)
+        self.mark_dirty()
     def set_purchase_history(self, purchase_history):
-        self.__purchase_history = purchase_history
+        if self.__order_store is not None:
+            self.__order_store.replace_history(self.__username, purchase_history)
+        else:
+            self.__purchase_history = purchase_history
+        self.mark_dirty()
     # Methods
     def get_logged_in_customer(self, logged_in_username):
         if self.username == logged_in_username:
@@ -122,7 +350,12 @@ class CustomerAccount:
             raise ValueError("Invalid order. Must be an instance of the Order class.")
         # Recalculate total price and apply discounts before saving
         order.calculate_total_price()
-        self.__purchase_history.append(order)
+        order.set_customer(self.__username)
+        if self.__order_store is not None:
+            self.__order_store.add(order)
+        else:
+            self.__purchase_history.append(order)
+        self.mark_dirty()
     def view_purchase_history(self):
         history = self.get_purchase_history()  # Access purchase history through getter
         formatted_history = []
@@ -131,7 +364,7 @@ class CustomerAccount:
             # Include details for each ticket in the order
             for ticket in order.get_tickets():
                 ticket_details = ticket.display_ticket_details()
-                ticket_data = {"ticket_type": ticket_details["ticket_type"],"original_price": ticket_details["price"],"discounted_price": ticket.get_price(),"validity": ticket_details["validity"]}
+                ticket_data = {"ticket_type": ticket_details["ticket_type"],"original_price": ticket_details["price"],"discounted_price": ticket.get_price(),"validity": ticket_details["validity"],"quantity": ticket.get_quantity()}
                 order_details["tickets"].append(ticket_data)
             formatted_history.append(order_details)
         return formatted_history
@@ -161,17 +394,24 @@ class CustomerAccount:
         if email:
             self.set_email(email)
     def delete_order(self, order_id: int):
-        history = self.get_purchase_history()
-        updated_history = [order for order in history if order.get_order_id() != order_id]
-        if len(history) == len(updated_history):
+        if self.__order_store is not None:
+            # O(1) through the store's order index
+            order = self.__order_store.remove(order_id) if self.__order_store.owner(order_id) == self.__username else None
+        else:
+            order = next((order for order in self.__purchase_history if order.get_order_id() == order_id), None)
+            if order is not None:
+                self.__purchase_history.remove(order)
+        if order is None:
             print(f"No order found with ID: {order_id}")
         else:
-            self.set_purchase_history(updated_history)
+            self.mark_dirty()
             print(f"Order with ID {order_id} has been successfully deleted.")
+        return order
     def get_cart(self):
         return self.__cart
 
 class Payment:
+    __slots__ = ("__payment_method", "__amount")
     def __init__(self, payment_method: str, amount: float):
         self.__payment_method = payment_method
         self.__amount = amount  # Aggregation: Payment is linked to an Order.
@@ -186,65 +426,121 @@ class Payment:
     def set_amount(self, amount: float):
         self.__amount = amount
 
+class TicketCatalogEntry:
+    """The descriptive part of a ticket, shared by every ticket of the same type."""
+    __slots__ = ("__ticket_type", "__description", "__validity", "__limitations")
+    def __init__(self, ticket_type, description, validity, limitations):
+        self.__ticket_type = ticket_type
+        self.__description = description
+        self.__validity = validity
+        self.__limitations = limitations
+    # Getters
+    def get_ticket_type(self):
+        return self.__ticket_type
+    def get_description(self):
+        return self.__description
+    def get_validity(self):
+        return self.__validity
+    def get_limitations(self):
+        return self.__limitations
+
+class TicketCatalog:
+    """Interns catalog entries so order lines share one entry per ticket type (flyweight)."""
+    __entries = {}
+    @classmethod
+    def intern(cls, ticket_type, description, validity, limitations):
+        key = (ticket_type, description, validity, limitations)
+        entry = cls.__entries.get(key)
+        if entry is None:
+            entry = cls.__entries[key] = TicketCatalogEntry(*(sys.intern(value) if isinstance(value, str) else value for value in key))
+        return entry
+    @classmethod
+    def size(cls):
+        return len(cls.__entries)
+
 class Ticket:
-    def __init__(self, ticket_type, description, price, validity, limitations, discount=0):
-        self.__ticket_type = ticket_type  # Private attribute
-        self.__description = description  # Private attribute
+    # Only the unit price, discount and quantity belong to the line; everything else lives in the shared catalog entry
+    __slots__ = ("__entry", "__price", "__discount", "__quantity")
+    def __init__(self, ticket_type, description, price, validity, limitations, discount=0, quantity=1):
+        self.__entry = TicketCatalog.intern(ticket_type, description, validity, limitations)  # Private attribute
         self.__price = price  # Private attribute
-        self.__validity = validity  # Private attribute
-        self.__limitations = limitations  # Private attribute
         self.__discount = discount  # Private attribute
+        self.__quantity = quantity  # Tickets of this type on the line, all at the same unit price
 
     # Getters
+    def get_catalog_entry(self):
+        return self.__entry
     def get_ticket_type(self):
-        return self.__ticket_type
+        return self.__entry.get_ticket_type()
     def get_description(self):
-        return self.__description
+        return self.__entry.get_description()
     def get_price(self):
         return self.__price
     def get_validity(self):
-        return self.__validity
+        return self.__entry.get_validity()
     def get_limitations(self):
-        return self.__limitations
+        return self.__entry.get_limitations()
 
     def get_discount(self):
         return self.__discount
-    # Setters
+    def get_quantity(self):
+        return self.__quantity
+    def get_line_total(self):
+        return self.__price * self.__quantity
+    def mark_dirty(self):
+        pass  # A line is stored with the order, account or cart holding it, which track their own changes
+    # Setters (descriptive changes re-point the ticket at another shared entry)
+    def __replace_entry(self, **changes):
+        fields = {"ticket_type": self.get_ticket_type(), "description": self.get_description(),
+                  "validity": self.get_validity(), "limitations": self.get_limitations()}
+        fields.update(changes)
+        self.__entry = TicketCatalog.intern(**fields)
+        self.mark_dirty()
+
     def set_ticket_type(self, ticket_type):
         if isinstance(ticket_type, str) and ticket_type.strip():
-            self.__ticket_type = ticket_type
+            self.__replace_entry(ticket_type=ticket_type)
         else:
             raise ValueError("Ticket type must be a non-empty string.")
 
     def set_description(self, description):
         if isinstance(description, str) and description.strip():
-            self.__description = description
+            self.__replace_entry(description=description)
         else:
             raise ValueError("Description must be a non-empty string.")
 
     def set_price(self, price):
         if isinstance(price, (int, float)) and price > 0:
             self.__price = price
+            self.mark_dirty()
         else:
             raise ValueError("Price must be a positive number.")
 
     def set_validity(self, validity):
         if isinstance(validity, str) and validity.strip():
-            self.__validity = validity
+            self.__replace_entry(validity=validity)
         else:
             raise ValueError("Validity must be a non-empty string.")
 
     def set_limitations(self, limitations):
         if isinstance(limitations, str):
-            self.__limitations = limitations
+            self.__replace_entry(limitations=limitations)
         else:
             raise ValueError("Limitations must be a string.")
 
     def set_discount(self, discount):
         if isinstance(discount, int) and 0 <= discount <= 100:
             self.__discount = discount
+            self.mark_dirty()
         else:
             raise ValueError("Discount must be an integer between 0 and 100.")
+
+    def set_quantity(self, quantity):
+        if isinstance(quantity, int) and quantity > 0:
+            self.__quantity = quantity
+            self.mark_dirty()
+        else:
+            raise ValueError("Quantity must be a positive whole number.")
     # Other methods
     def display_ticket_details(self):
         return {"ticket_type": self.get_ticket_type(),"description": self.get_description(),"price": self.get_price(),"validity": self.get_validity(),"limitations": self.get_limitations()}
@@ -253,7 +549,25 @@ class Ticket:
 # Assuming you have a dictionary or a list that stores ticket details globally
 
 
+class CatalogTicket(Ticket):
+    """
+    A ticket type offered in the catalog. Catalog tickets are saved on their own, so unlike order and cart lines they
+    keep a dirty flag, as ChangeTracked entities do (a second base with slots would not fit Ticket's layout).
+    """
+    __slots__ = ("__dirty",)
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.__dirty = True
+    def is_dirty(self):
+        return self.__dirty
+    def mark_dirty(self):
+        self.__dirty = True
+    def mark_clean(self):
+        self.__dirty = False
+
+
 class TicketType(Ticket):  # Inherits from Ticket
+    __slots__ = ("__discount",)
     def __init__(self, ticket_type: str, description: str, price: float, validity: str, limitations: str, discount: float):
         super().__init__(ticket_type, description, price, validity, limitations)  # Inheritance: TicketType inherits Ticket attributes.
         self.__discount = discount
@@ -263,6 +577,7 @@ class TicketType(Ticket):  # Inherits from Ticket
     # Setters
     def set_discount(self, discount: float):
         self.__discount = discount
+        self.mark_dirty()
     # Additional methods
     def calculate_discounted_price(self):
         return self.get_price() * (1 - self.get_discount())
@@ -271,33 +586,205 @@ class TicketType(Ticket):  # Inherits from Ticket
         details["discounted_price"] = self.calculate_discounted_price()
         return details
 
-class Cart:
+class Cart(ChangeTracked):
+    """Ticket lines keyed by ticket type, each with a quantity; the total is kept up to date on every change."""
+    __slots__ = ("__items", "__total")
     def __init__(self, items=None):
-        if items is None:
-            items = []
-        self.__items = items  # Initialize the cart with the given items
+        super().__init__()
+        self.__items = {}  # ticket_type -> line
+        self.__total = 0.0
+        for item in items or []:
+            self.add_to_cart(item)
 
-    def add_to_cart(self, item):
-        self.__items.append(item)
+    def add_to_cart(self, item, quantity=None):
+        """Add item's quantity (or quantity) of its type; a type already in the cart takes the item's unit price."""
+        quantity = item.get_quantity() if quantity is None else quantity
+        line = self.__items.get(item.get_ticket_type())
+        if line is not None:
+            quantity += line.get_quantity()
+            self.__total -= line.get_line_total()
+        line = Ticket(item.get_ticket_type(), item.get_description(), item.get_price(), item.get_validity(),
+                      item.get_limitations(), item.get_discount(), quantity)  # The cart owns its lines
+        self.__items[line.get_ticket_type()] = line
+        self.__total += line.get_line_total()
+        self.mark_dirty()
 
-    def remove_from_cart(self, item):
-        if item in self.__items:
-            self.__items.remove(item)
+    def remove_from_cart(self, item, quantity=None):
+        """Take quantity tickets (the whole line when None) of item's type out of the cart; item may be the type name."""
+        ticket_type = item if isinstance(item, str) else item.get_ticket_type()
+        line = self.__items.get(ticket_type)
+        if line is None:
+            return
+        self.__total -= line.get_line_total()
+        if quantity is None or quantity >= line.get_quantity():
+            del self.__items[ticket_type]
+        else:
+            line.set_quantity(line.get_quantity() - quantity)
+            self.__total += line.get_line_total()
+        if not self.__items:
+            self.__total = 0.0  # No rounding residue on an empty cart
+        self.mark_dirty()
 
     def clear_cart(self):
-        self.__items = []
+        self.__items = {}
+        self.__total = 0.0
+        self.mark_dirty()
 
     def get_cart_items(self):
-        return self.__items
+        return list(self.__items.values())
+
+    def get_quantity(self, ticket_type):
+        line = self.__items.get(ticket_type)
+        return line.get_quantity() if line is not None else 0
+
+    def get_ticket_count(self):
+        return sum(line.get_quantity() for line in self.__items.values())
+
+    def set_cart_items(self, items):
+        self.clear_cart()
+        for item in items:
+            self.add_to_cart(item)
 
     def calculate_cart_total(self):
-        return sum(item.get_price() for item in self.__items)
+        return self.__total
 
-class Admin:
+class Promotion:
+    """A declarative discount rule: percent off one ticket type while every condition it sets holds."""
+    __slots__ = ("__ticket_type", "__percent", "__min_group_size", "__online", "__renewal", "__start_date", "__end_date")
+    def __init__(self, ticket_type: str, percent: int, min_group_size: int = 0, online: bool = False, renewal: bool = False,
+                 start_date: date = None, end_date: date = None):
+        if not 0 <= percent <= 100:
+            raise ValueError("Promotion percent must be between 0 and 100.")
+        self.__ticket_type = ticket_type
+        self.__percent = percent
+        self.__min_group_size = min_group_size  # Tickets of the type bought together
+        self.__online = online  # Only for online purchases
+        self.__renewal = renewal  # Only for renewals
+        self.__start_date = start_date  # First and last day it runs (open-ended when None)
+        self.__end_date = end_date
+    # Getters
+    def get_ticket_type(self):
+        return self.__ticket_type
+    def get_percent(self):
+        return self.__percent
+    def get_min_group_size(self):
+        return self.__min_group_size
+    def is_online_only(self):
+        return self.__online
+    def is_renewal_only(self):
+        return self.__renewal
+    def is_dated(self):
+        return self.__start_date is not None or self.__end_date is not None
+    # Other methods
+    def applies(self, group_size, is_online, is_renewal, on):
+        return (group_size >= self.__min_group_size and (is_online or not self.__online) and (is_renewal or not self.__renewal)
+                and (self.__start_date is None or on >= self.__start_date) and (self.__end_date is None or on <= self.__end_date))
+
+# The park's standing promotions (formerly hard-coded in Order.apply_discounts)
+PROMOTIONS = (Promotion("Two-Day Pass", 10, online=True),
+              Promotion("Annual Membership", 15, renewal=True),
+              Promotion("Group Ticket (10+)", 20, min_group_size=10))
+
+class PricingEngine:
+    """
+    Prices tickets with the promotions that apply to them. The rules are compiled into a dispatch table by
+    ticket type, and a line gets the best of its catalog discount and the applicable promotions (they never
+    stack). Effective unit prices of catalog tickets are cached per set of conditions until invalidate().
+    """
+    def __init__(self, tickets: list = (), promotions=PROMOTIONS):
+        self.__catalog = {}  # ticket_type -> catalog Ticket
+        self.__table = {}  # ticket_type -> (promotions best first, group size thresholds, online?, renewal?, dated?)
+        self.__prices = {}  # condition key -> (unit price, percent)
+        self.set_promotions(promotions)
+        self.set_catalog(tickets)
+    def set_catalog(self, tickets):
+        self.__catalog = {ticket.get_ticket_type(): ticket for ticket in tickets}
+        self.invalidate()
+    def set_promotions(self, promotions):
+        rules = {}
+        for promotion in promotions:
+            rules.setdefault(promotion.get_ticket_type(), []).append(promotion)
+        self.__table = {}
+        for ticket_type, promotions in rules.items():
+            promotions.sort(key=lambda promotion: -promotion.get_percent())  # The first one that applies is the best
+            self.__table[ticket_type] = (tuple(promotions), sorted({promotion.get_min_group_size() for promotion in promotions}),
+                                         any(promotion.is_online_only() for promotion in promotions),
+                                         any(promotion.is_renewal_only() for promotion in promotions),
+                                         any(promotion.is_dated() for promotion in promotions))
+        self.invalidate()
+    def invalidate(self):
+        """Forget the cached prices, e.g. after a catalog discount changed."""
+        self.__prices = {}
+    def get_catalog(self):
+        return self.__catalog
+    def promotion_percent(self, ticket_type, group_size=1, is_online=False, is_renewal=False, on=None):
+        """Percent of the best promotion that applies to a ticket type (0 when none does)."""
+        compiled = self.__table.get(ticket_type)
+        if compiled is None:
+            return 0
+        on = on or date.today()
+        return next((promotion.get_percent() for promotion in compiled[0] if promotion.applies(group_size, is_online, is_renewal, on)), 0)
+    def __key(self, ticket_type, group_size, is_online, is_renewal, on):
+        # Conditions none of the type's rules look at are left out, so they share one cached price
+        compiled = self.__table.get(ticket_type)
+        if compiled is None:
+            return ticket_type
+        _, thresholds, online, renewal, dated = compiled
+        return (ticket_type, bisect_right(thresholds, group_size), online and is_online, renewal and is_renewal,
+                (on or date.today()) if dated else None)
+    def __effective(self, ticket_type, group_size, is_online, is_renewal, on):
+        key = self.__key(ticket_type, group_size, is_online, is_renewal, on)
+        effective = self.__prices.get(key)
+        if effective is None:
+            ticket = self.__catalog.get(ticket_type)
+            if ticket is None:
+                raise ValueError(f"Unknown ticket type: {ticket_type}")
+            percent = max(ticket.get_discount(), self.promotion_percent(ticket_type, group_size, is_online, is_renewal, on))
+            effective = self.__prices[key] = (ticket.get_price() * (1 - percent / 100), percent)
+        return effective
+    def unit_price(self, ticket_type, group_size=1, is_online=False, is_renewal=False, on=None):
+        """Price of one catalog ticket after its discount; raises ValueError for a type not in the catalog."""
+        return self.__effective(ticket_type, group_size, is_online, is_renewal, on)[0]
+    def line(self, ticket_type, quantity=1, group_size=None, is_online=False, is_renewal=False, on=None):
+        """A priced line of quantity catalog tickets (bought quantity at a time unless group_size says otherwise)."""
+        price, percent = self.__effective(ticket_type, group_size or quantity, is_online, is_renewal, on)
+        ticket = self.__catalog[ticket_type]
+        return Ticket(ticket_type, ticket.get_description(), price, ticket.get_validity(), ticket.get_limitations(), percent, quantity)
+    def price_lines(self, tickets, group_size=None, is_online=False, is_renewal=False, on=None):
+        """
+        The lines priced as bought together: each ticket type's group size is its ticket count among them
+        unless group_size is given. Lines whose price does not change are kept, the others are replaced by copies.
+        Types outside the catalog are priced from the line's own price before its discount.
+        """
+        counts = None
+        if group_size is None:
+            counts = Counter()
+            for ticket in tickets:
+                counts[ticket.get_ticket_type()] += ticket.get_quantity()
+        priced = []
+        for ticket in tickets:
+            ticket_type = ticket.get_ticket_type()
+            size = counts[ticket_type] if counts is not None else group_size
+            if ticket_type in self.__catalog:
+                price, percent = self.__effective(ticket_type, size, is_online, is_renewal, on)
+            else:
+                discount = ticket.get_discount()
+                percent = max(discount, self.promotion_percent(ticket_type, size, is_online, is_renewal, on))
+                price = ticket.get_price() if percent == discount or discount >= 100 else ticket.get_price() / (1 - discount / 100) * (1 - percent / 100)
+            if price == ticket.get_price() and percent == ticket.get_discount():
+                priced.append(ticket)
+            else:
+                priced.append(Ticket(ticket_type, ticket.get_description(), price, ticket.get_validity(), ticket.get_limitations(),
+                                     percent, ticket.get_quantity()))
+        return priced
+
+class Admin(ChangeTracked):
+    __slots__ = ("__admin_id", "__password", "__orders", "__all_admins", "__email")
     def __init__(self, admin_id: str, password: str, orders: list['Order'], email: str = "", all_admins: list = None):
+        super().__init__()
         self.__admin_id = admin_id
         self.__password = password
-        self.__orders = orders
+        self.__orders = {order.get_order_id(): order for order in orders or []}  # order_id -> Order, so deletes are O(1)
         self.__all_admins = all_admins or []
         self.__email = email  # Ensure this is set
 
@@ -309,18 +796,24 @@ class Admin:
     def get_email(self):
         return self.__email
     def get_orders(self):
-        return self.__orders
+        return list(self.__orders.values())
+    def get_order(self, order_id):
+        return self.__orders.get(order_id)
     def get_all_admins(self):
         return self.__all_admins
     # Setters
     def set_admin_id(self, admin_id: str):
         self.__admin_id = admin_id
+        self.mark_dirty()
     def set_password(self, password: str):
         self.__password = password
+        self.mark_dirty()
     def set_email(self, email: str):
         self.__email = email
+        self.mark_dirty()
     def set_orders(self, orders: list['Order']):
-        self.__orders = orders
+        self.__orders = {order.get_order_id(): order for order in orders}
+        self.mark_dirty()
     def set_all_admins(self, all_admins: list):
         self.__all_admins = all_admins
     def validate_admin_creation(self):
@@ -376,8 +869,9 @@ class Admin:
         ticket.set_price(new_price)
     def delete_order(self, order):
         """Remove an order from the list of orders."""
-        if order in self.__orders:
-            self.__orders.remove(order)
+        if self.__orders.get(order.get_order_id()) is order:
+            del self.__orders[order.get_order_id()]
+            self.mark_dirty()
         else:
             raise ValueError("Order not found.")
     def modify_ticket_discount(self, ticket: TicketType, new_discount: float):
@@ -394,4 +888,104 @@ class Admin:
             raise ValueError(f"Order with ID {order_id} not found.")
         # Add the new ticket to the system as part of an Order
         self.__orders.append(Order(purchase_date=date.today(), tickets=[new_ticket]))
-        print(f"New ticket '{new_ticket.get_ticket_type()}' created and added to the system.")
\ No newline at end of file
+        print(f"New ticket '{new_ticket.get_ticket_type()}' created and added to the system.")
+class IdentityIndex:
+    """
+    Case-insensitive hash index over customer usernames and emails and admin IDs.
+    With a customer_store (any object offering identities(), get(username) and rename()) only the
+    identities are indexed and accounts are resolved through the store when looked up.
+    """
+    def __init__(self, customers: list = None, admins: list = None, customer_store=None):
+        self.__customer_store = customer_store
+        self.__customers_by_username = {}  # normalized username -> account, or its username when store-backed
+        self.__customers_by_email = {}
+        self.__admins_by_id = {}
+        if customer_store is not None:
+            for username, email in customer_store.identities():
+                self.__index_customer(username, email, username, strict=False)
+        for customer in customers or []:
+            self.add_customer(customer, strict=False)
+        for admin in admins or []:
+            self.add_admin(admin, strict=False)
+    @staticmethod
+    def normalize(value):
+        return value.strip().casefold() if value else None
+    def __resolve(self, entry):
+        if entry is None or self.__customer_store is None:
+            return entry
+        return self.__customer_store.get(entry)
+    def __owned_by(self, entry, customer):
+        if self.__customer_store is None:
+            return entry is customer
+        return customer is not None and entry == customer.get_username()
+    # Lookups
+    def find_customer(self, username):
+        return self.__resolve(self.__customers_by_username.get(self.normalize(username)))
+    def find_customer_by_email(self, email):
+        return self.__resolve(self.__customers_by_email.get(self.normalize(email)))
+    def find_admin(self, admin_id):
+        return self.__admins_by_id.get(self.normalize(admin_id))
+    def is_username_taken(self, username, ignore=None):
+        entry = self.__customers_by_username.get(self.normalize(username))
+        return entry is not None and not self.__owned_by(entry, ignore)
+    def is_email_taken(self, email, ignore=None):
+        entry = self.__customers_by_email.get(self.normalize(email))
+        return entry is not None and not self.__owned_by(entry, ignore)
+    def find_customer_username(self, username):
+        """The stored spelling of a customer's username, without materializing the account (None when unknown)."""
+        entry = self.__customers_by_username.get(self.normalize(username))
+        return entry.get_username() if entry is not None and self.__customer_store is None else entry
+    def is_admin_id_taken(self, admin_id, ignore=None):
+        owner = self.find_admin(admin_id)
+        return owner is not None and owner is not ignore
+    # Customers
+    def __index_customer(self, username, email, entry, strict):
+        username_taken, email_taken = self.is_username_taken(username), bool(email) and self.is_email_taken(email)
+        if strict and (username_taken or email_taken):
+            raise ValueError("Username or email is already registered.")
+        # Legacy data may already hold duplicates; the first account keeps the contested key
+        if username_taken or email_taken:
+            print(f"Skipping duplicate identity for customer: {username}")
+        if not username_taken:
+            self.__customers_by_username[self.normalize(username)] = entry
+        if email and not email_taken:
+            self.__customers_by_email[self.normalize(email)] = entry
+    def add_customer(self, customer: CustomerAccount, strict=True):
+        entry = customer.get_username() if self.__customer_store is not None else customer
+        self.__index_customer(customer.get_username(), customer.get_email(), entry, strict)
+    def remove_customer(self, customer: CustomerAccount):
+        username_key, email_key = self.normalize(customer.get_username()), self.normalize(customer.get_email())
+        if self.__owned_by(self.__customers_by_username.get(username_key), customer):
+            del self.__customers_by_username[username_key]
+        if self.__owned_by(self.__customers_by_email.get(email_key), customer):
+            del self.__customers_by_email[email_key]
+    def modify_customer(self, customer: CustomerAccount, username=None, password=None, email=None):
+        """Apply CustomerAccount.modify_account and re-key the index, rejecting identities owned by someone else."""
+        if username and self.is_username_taken(username, ignore=customer):
+            raise ValueError("Username is already registered.")
+        if email and self.is_email_taken(email, ignore=customer):
+            raise ValueError("Email is already registered.")
+        old_username = customer.get_username()
+        self.remove_customer(customer)
+        customer.modify_account(username=username, password=password, email=email)
+        if self.__customer_store is not None:
+            self.__customer_store.rename(customer, old_username)
+        self.add_customer(customer)
+    # Admins
+    def add_admin(self, admin: Admin, strict=True):
+        if self.is_admin_id_taken(admin.get_admin_id()):
+            if strict:
+                raise ValueError("Admin ID already exists.")
+            print(f"Skipping duplicate admin ID: {admin.get_admin_id()}")
+            return
+        self.__admins_by_id[self.normalize(admin.get_admin_id())] = admin
+    def remove_admin(self, admin: Admin):
+        if self.find_admin(admin.get_admin_id()) is admin:
+            del self.__admins_by_id[self.normalize(admin.get_admin_id())]
+    def set_admin_id(self, admin: Admin, admin_id: str):
+        """Apply Admin.set_admin_id and re-key the index."""
+        if self.is_admin_id_taken(admin_id, ignore=admin):
+            raise ValueError("Admin ID already exists.")
+        self.remove_admin(admin)
+        admin.set_admin_id(admin_id)
+        self.add_admin(admin)
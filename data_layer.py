@@ -1,6 +1,21 @@
+import hashlib
 import pickle
 import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from datetime import timedelta
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; IDs are still leased in blocks and writes serialized, without the cross-process lock
+    fcntl = None
+import record_codec
 from business_model import *
+from order_archive import OrderArchive
+from order_file import OrderLineFile
 
 
 ticket_data = [
@@ -17,343 +32,2318 @@ def get_filepath(filename):
     return os.path.join(BASE_PATH, filename)
 
 
-def save_to_file(data, filepath):
+def save_to_file(data, filepath, entity=None):
+    # Written aside and renamed over the file, so a reader in another process never sees it half written
+    tmp = f"{filepath}.{os.getpid()}-{threading.get_ident()}.tmp"
     try:
-        with open(filepath, 'wb') as file:
-            pickle.dump(data, file)
+        with open(tmp, 'wb') as file:
+            if entity is not None:
+                file.write(record_codec.dumps(entity, data))  # Entity records in their declared compact schema
+            else:
+                pickle.dump(data, file)
+        os.replace(tmp, filepath)
     except Exception as e:
         print(f"Failed to save data to {filepath}: {e}")
         raise
 
 
+def decode_file(data, match=None):
+    # Entity files written before the record codec are plain pickles of the raw dicts; match as record_codec.loads takes it
+    if record_codec.is_encoded(data):
+        return record_codec.loads(data, match)
+    records = pickle.loads(data)
+    return [record for record in records if all(record.get(name) == value for name, value in match.items())] if match else records
+
+
 def load_from_file(filepath):
     try:
         with open(filepath, 'rb') as file:
-            return pickle.load(file)
+            return decode_file(file.read())
     except FileNotFoundError:
         print(f"File not found: {filepath}. Returning empty list.")
         save_to_file([], filepath)
         return []
 
-    except (pickle.UnpicklingError, EOFError):
+    except (pickle.UnpicklingError, EOFError, struct.error):
         print(f"Corrupted or empty file: {filepath}. Returning empty list.")
         save_to_file([], filepath)  # Overwrite with an empty list
         return []
 
 
+def merge_ticket_lines(tickets):
+    """Fold raw ticket lines that differ only in quantity into one line item (older orders stored a line per ticket)."""
+    if len(tickets) < 2:
+        return tickets
+    lines = {}
+    for ticket in tickets:
+        key = (ticket["ticket_type"], ticket["description"], ticket["price"], ticket.get("discount", 0))
+        line = lines.get(key)
+        if line is None:
+            lines[key] = ticket
+        else:
+            lines[key] = dict(line, quantity=line.get("quantity", 1) + ticket.get("quantity", 1))
+    return list(lines.values()) if len(lines) < len(tickets) else tickets
+
+
+# Append-only log framing: each record is a (length, crc32) header followed by the pickled payload
+FRAME_HEADER = struct.Struct("<II")
+
+
+def encode_frame(record):
+    payload = pickle.dumps(record)
+    return FRAME_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def append_frames(frames, filepath):
+    """Append already encoded frames with a single write and fsync."""
+    with open(filepath, 'ab') as file:
+        file.write(b"".join(frames))
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def write_frames(records, filepath):
+    """Replace a framed file with the given records, writing them as they are produced."""
+    tmp = filepath + ".tmp"
+    with open(tmp, 'wb') as file:
+        for record in records:
+            file.write(encode_frame(record))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp, filepath)
+
+
+def read_frames(filepath, start=0, repair=True):
+    """
+    Yield the records of a framed log from byte offset start, cutting off a torn or corrupted tail. Readers that
+    do not hold the process lock pass repair=False, since the "torn" tail may be a frame another process is writing.
+    """
+    for record, _ in iter_frames(filepath, start, repair):
+        yield record
+
+
+def iter_frames(filepath, start=0, repair=True):
+    """Yield (record, offset just past it) for each complete frame."""
+    if not os.path.exists(filepath):
+        return
+    with open(filepath, 'rb') as file:
+        file.seek(start)
+        while True:
+            offset = file.tell()
+            header = file.read(FRAME_HEADER.size)
+            if not header:
+                return
+            if len(header) == FRAME_HEADER.size:
+                length, checksum = FRAME_HEADER.unpack(header)
+                payload = file.read(length)
+                if len(payload) == length and zlib.crc32(payload) == checksum:
+                    yield pickle.loads(payload), file.tell()
+                    continue
+            break
+    if repair:
+        # Drop the torn tail so later appends are not hidden behind it
+        print(f"Truncating torn record at the end of {filepath}.")
+        os.truncate(filepath, offset)
+
+
+# Entries kept in the cross-process change feed; a process that falls further behind reloads everything
+MAX_TRACKED_CHANGES = 1024
+
+# Storage Backends
+# Every backend stores the raw dicts produced by DataLayer's converters, keyed per entity as below
+ENTITY_KEYS = {"customers": "username", "admins": "admin_id", "tickets": "ticket_type", "orders": None, "sales": "purchase_date"}
+# The same keys read off the loaded entities, for saves that write only what changed
+ENTITY_KEY_GETTERS = {"customers": CustomerAccount.get_username, "admins": Admin.get_admin_id, "tickets": Ticket.get_ticket_type,
+                      "orders": Order.get_order_id}
+
+
+def as_stored(entity):
+    """Mark an entity just built from its stored record clean, and return it."""
+    entity.mark_clean()
+    return entity
+
+
+def apply_changes_to(records, key_field, changes):
+    """Yield records with the ones named in changes replaced in place or dropped (None); new keys come last."""
+    changes = dict(changes)
+    for record in records:
+        if record[key_field] in changes:
+            record = changes.pop(record[key_field])
+            if record is None:
+                continue
+        yield record
+    yield from (record for record in changes.values() if record is not None)
+
+
+class StorageBackend:
+    """Interface shared by the storage engines behind DataLayer."""
+    incremental = False  # True when single-record writes do not rewrite the whole entity set
+    order_appends = False  # True when add_order stores one order without rewriting the others
+
+    def load(self, entity):
+        raise NotImplementedError
+    def iter_records(self, entity):
+        """Yield the records of one entity; backends that can read one record at a time override this."""
+        yield from self.load(entity)
+    def save(self, entity, records):
+        raise NotImplementedError
+    def get(self, entity, key):
+        key_field = ENTITY_KEYS[entity]
+        return next((record for record in self.load(entity) if record[key_field] == key), None)
+    def upsert(self, entity, record):
+        self.apply_changes(entity, {record[ENTITY_KEYS[entity]]: record})
+    def delete(self, entity, key):
+        self.apply_changes(entity, {key: None})
+    def apply_changes(self, entity, changes):
+        """Write several records in one pass: changes maps a key to its new record, or to None to delete it."""
+        self.save(entity, list(apply_changes_to(self.load(entity), ENTITY_KEYS[entity], changes)))
+    def get_order(self, order_id):
+        return next((order for order in self.iter_records("orders") if order.get("order_id") == order_id), None)
+    def add_order(self, order):
+        """Store one new order record (it carries its owner's username)."""
+        self.add_orders([order])
+    def add_orders(self, orders):
+        """Store a batch of new order records in one write."""
+        self.save("orders", self.load("orders") + list(orders))
+    def replace_order(self, order):
+        """Overwrite the stored order with the same order_id."""
+        self.save("orders", [order if existing.get("order_id") == order["order_id"] else existing for existing in self.load("orders")])
+    def remove_order(self, order_id):
+        self.save("orders", [order for order in self.load("orders") if order.get("order_id") != order_id])
+    def find_orders(self, username=None, purchase_date=None):
+        return [order for order in self.load("orders")
+                if (username is None or order.get("username") == username)
+                and (purchase_date is None or order["purchase_date"] == purchase_date)]
+    def identities(self):
+        """Return (username, email) for every customer without building the rest of the records."""
+        return [(customer["username"], customer["email"]) for customer in self.load("customers")]
+    # Customer shards; backends that do not split the customers store them as a single shard
+    def customer_shards(self):
+        return 1
+    def shard_of(self, username):
+        return 0
+    def load_shard(self, index):
+        return self.iter_records("customers")
+    def reshard(self, shards):
+        raise ValueError(f"The {type(self).__name__} does not shard customers.")
+    def close(self):
+        pass
+
+
+class MemoryBackend(StorageBackend):
+    """Keeps every entity in process memory, for tests and benchmarks."""
+    incremental = True
+    order_appends = True
 
-class DataLayer:
     def __init__(self):
+        self.__records = {entity: [] for entity in ENTITY_KEYS if entity != "orders"}
+        self.__orders = {}  # order_id -> record, in insertion order, so single-order changes are O(1)
+    def load(self, entity):
+        if entity == "orders":
+            return list(self.__orders.values())
+        return list(self.__records[entity])
+    def save(self, entity, records):
+        if entity == "orders":
+            self.__orders = {record.get("order_id"): record for record in records}
+        else:
+            self.__records[entity] = list(records)
+    def upsert(self, entity, record):
+        key_field = ENTITY_KEYS[entity]
+        records = self.__records[entity]
+        for index, existing in enumerate(records):
+            if existing[key_field] == record[key_field]:
+                records[index] = record
+                return
+        records.append(record)
+    def add_orders(self, orders):
+        self.__orders.update((order.get("order_id"), order) for order in orders)
+    def replace_order(self, order):
+        if order["order_id"] in self.__orders:  # An unknown order is left alone, as on the other backends
+            self.__orders[order["order_id"]] = order
+    def remove_order(self, order_id):
+        self.__orders.pop(order_id, None)
+    def get_order(self, order_id):
+        return self.__orders.get(order_id)
+
+
+class PickleBackend(StorageBackend):
+    """
+    The original layout: one file of records per entity, encoded by record_codec (files written before it, plain
+    pickles of the raw dicts, are still read and are re-encoded when next saved). The customers may instead be split by
+    username hash into shard files (customers-<generation>-<index>.pkl, listed in customers.shards), so a
+    change to one account rewrites only its shard.
+    """
+
+    def __init__(self, filepaths):
+        self.filepaths = filepaths
+        self.__manifest = None  # ((inode, mtime), layout) of the shard manifest last read
+    def load(self, entity):
+        layout = self.shard_layout()  # Also read by FramedBackend until its customers.rec is first written
+        if entity == "customers" and layout["shards"] > 1:
+            return [record for index in range(layout["shards"]) for record in self.__read_shard(index, layout)]
+        return load_from_file(self.filepaths[entity])
+    def iter_records(self, entity):
+        layout = self.__sharded(entity)
+        if layout is not None:
+            return (record for index in range(layout["shards"]) for record in self.__read_shard(index, layout))
+        return iter(self.load(entity))
+    def save(self, entity, records):
+        layout = self.__sharded(entity)
+        if layout is not None:
+            for index, shard in enumerate(self.__partition(records, layout["shards"])):
+                save_to_file(shard, self.shard_path(index, layout), "customers")
+        else:
+            save_to_file(records, self.filepaths[entity], entity)
+    def get(self, entity, key):
+        if entity != "customers":
+            return super().get(entity, key)
+        # Only the account asked for is decoded, so reading one on demand does not build every record of its file
+        layout = self.__sharded(entity)
+        path = self.shard_path(self.shard_of(key), layout) if layout is not None else self.filepaths["customers"]
+        try:
+            with open(path, 'rb') as file:
+                return next(iter(decode_file(file.read(), {"username": key})), None)
+        except FileNotFoundError:
+            return None
+    def apply_changes(self, entity, changes):
+        layout = self.__sharded(entity)
+        if layout is None:
+            super().apply_changes(entity, changes)
+            return
+        by_shard = {}
+        for username, record in changes.items():
+            by_shard.setdefault(self.shard_of(username), {})[username] = record
+        for index, shard_changes in by_shard.items():  # The other shards are not read or written
+            save_to_file(list(apply_changes_to(self.__read_shard(index, layout), "username", shard_changes)), self.shard_path(index, layout), "customers")
+
+    # Customer Shards
+    def shard_layout(self):
+        """The shard manifest: {"shards": n, "generation": g}, or a single unsharded customers.pkl without one."""
+        try:
+            stat = os.stat(self.filepaths["customer_shards"])
+        except FileNotFoundError:
+            return {"shards": 1, "generation": None}
+        if self.__manifest is None or self.__manifest[0] != (stat.st_ino, stat.st_mtime_ns):
+            self.__manifest = ((stat.st_ino, stat.st_mtime_ns), load_from_file(self.filepaths["customer_shards"]))
+        return self.__manifest[1]
+    def customer_shards(self):
+        return self.shard_layout()["shards"]
+    def shard_of(self, username, shards=None):
+        # crc32 rather than hash(), which is salted per process
+        return zlib.crc32(username.encode()) % (shards or self.customer_shards())
+    def shard_path(self, index, layout):
+        if layout["shards"] == 1:
+            return self.filepaths["customers"]
+        return f"{os.path.splitext(self.filepaths['customers'])[0]}-{layout['generation']}-{index:03d}.pkl"
+    def load_shard(self, index):
+        layout = self.shard_layout()
+        return iter(self.__read_shard(index, layout)) if layout["shards"] > 1 else self.iter_records("customers")
+    def save_shard(self, index, records):
+        """Replace one shard's accounts; they must all hash to that shard."""
+        save_to_file(list(records), self.shard_path(index, self.shard_layout()), "customers")
+    def reshard(self, shards):
+        """
+        Rewrite the customers into the given number of shard files (1 merges them back into customers.pkl).
+        Replacing the manifest switches layouts; the files it replaced are kept until the next reshard, so a
+        process still reading them finishes with a complete, if stale, set.
+        """
+        if shards < 1:
+            raise ValueError("The number of shards must be at least 1.")
+        old = self.shard_layout()
+        records = self.load("customers")
+        new = {"shards": shards, "generation": max(self.__shard_files().values(), default=0) + 1 if shards > 1 else None}
+        for index, shard in enumerate(self.__partition(records, shards)):
+            save_to_file(shard, self.shard_path(index, new), "customers")
+        if shards > 1:
+            save_to_file(new, self.filepaths["customer_shards"])
+        elif os.path.exists(self.filepaths["customer_shards"]):
+            os.remove(self.filepaths["customer_shards"])
+        self.__remove_shard_files(keep={old["generation"], new["generation"]})
+        return len(records)
+    def __sharded(self, entity):
+        # The shard layout when entity is split into shards here, else None
+        return self.shard_layout() if entity == "customers" and self.customer_shards() > 1 else None
+    def __partition(self, records, shards):
+        partitions = [[] for _ in range(shards)]
+        for record in records:
+            partitions[self.shard_of(record["username"], shards)].append(record)
+        return partitions
+    def __read_shard(self, index, layout):
+        # A shard that was never written is empty; it is not created here, as a reader may not hold the lock
+        try:
+            with open(self.shard_path(index, layout), 'rb') as file:
+                return decode_file(file.read())
+        except FileNotFoundError:
+            return []
+    def __shard_files(self):
+        # path -> generation of every shard file on disk
+        directory, base = os.path.split(os.path.splitext(self.filepaths["customers"])[0])
+        files = {}
+        for name in os.listdir(directory or "."):
+            parts = name[len(base) + 1:-len(".pkl")].split("-")
+            if name.startswith(base + "-") and name.endswith(".pkl") and len(parts) == 2 and all(part.isdigit() for part in parts):
+                files[os.path.join(directory, name)] = int(parts[0])
+        return files
+    def __remove_shard_files(self, keep):
+        for path, generation in self.__shard_files().items():
+            if generation not in keep:
+                os.remove(path)
+        if None not in keep and os.path.exists(self.filepaths["customers"]):
+            os.remove(self.filepaths["customers"])  # Two layouts old
+
+
+class BinaryOrdersBackend(PickleBackend):
+    """The pickle layout, except orders live in a memory-mapped fixed-width line file with a string dictionary."""
+    order_appends = True
+
+    def __init__(self, filepaths):
+        super().__init__(filepaths)
+        self.order_file = OrderLineFile(filepaths["order_lines"], filepaths["order_strings"])
+    def converted(self):
+        # Until the first orders write, orders.pkl stays authoritative (and may still need the order migration)
+        return os.path.exists(self.filepaths["order_lines"])
+    def load(self, entity):
+        return list(self.iter_records(entity))
+    def iter_records(self, entity):
+        if entity == "orders" and self.converted():
+            return self.order_file.iter_orders()
+        return iter(super().load(entity))
+    def save(self, entity, records):
+        if entity == "orders":
+            self.order_file.write(records)
+        else:
+            super().save(entity, records)
+    def add_orders(self, orders):
+        if not self.converted():
+            self.order_file.write(super().load("orders"))
+        self.order_file.append(*orders)  # Appends their lines; the rest of the file is not read
+    def get_order(self, order_id):
+        if not self.converted():
+            return super().get_order(order_id)
+        return self.order_file.get(order_id)  # Reads only that order's lines
+    def replace_order(self, order):
+        if not self.converted():
+            super().replace_order(order)
+            return
+        self.order_file.replace(order)  # In place, unless its number of ticket lines changed
+    def find_orders(self, username=None, purchase_date=None):
+        if not self.converted():
+            return super().find_orders(username=username, purchase_date=purchase_date)
+        return list(self.order_file.iter_orders(username=username, purchase_date=purchase_date))
+
+
+class FramedBackend(PickleBackend):
+    """
+    Every entity file is a sequence of (length, crc32)-framed records (customers.rec, ...), so reads stream one
+    record at a time and single-record writes rewrite the file record by record instead of holding it in memory.
+    Until an entity is first written its .pkl file is read instead.
+    """
+    order_appends = True
+
+    def __init__(self, filepaths):
+        super().__init__(filepaths)
+        self.__checked_tail = False
+    def record_path(self, entity):
+        return os.path.splitext(self.filepaths[entity])[0] + ".rec"
+    def load(self, entity):
+        return list(self.iter_records(entity))
+    def iter_records(self, entity):
+        if os.path.exists(self.record_path(entity)):
+            # Another process may be appending, so an incomplete last frame is skipped rather than cut off
+            return read_frames(self.record_path(entity), repair=False)
+        if os.path.exists(self.filepaths[entity]) or (entity == "customers" and self.shard_layout()["shards"] > 1):
+            return iter(super().load(entity))
+        return iter([])
+    def save(self, entity, records):
+        write_frames(records, self.record_path(entity))
+    def get(self, entity, key):
+        return next((record for record in self.iter_records(entity) if record[ENTITY_KEYS[entity]] == key), None)
+    def apply_changes(self, entity, changes):
+        # Streams the old file into the new one, one record at a time
+        self.save(entity, apply_changes_to(self.iter_records(entity), ENTITY_KEYS[entity], changes))
+    def customer_shards(self):
+        return 1  # customers.rec streams; a sharded customers.pkl is only read until the first write
+    def shard_of(self, username, shards=None):
+        return 0
+    def load_shard(self, index):
+        return self.iter_records("customers")
+    def reshard(self, shards):
+        raise ValueError(f"The {type(self).__name__} does not shard customers.")
+    def add_orders(self, orders):
+        if not os.path.exists(self.record_path("orders")):
+            self.save("orders", self.iter_records("orders"))
+        elif not self.__checked_tail:
+            # Once per process, with the writers' lock held: a tail torn by a crash would hide the appended order
+            for _ in read_frames(self.record_path("orders")):
+                pass
+            self.__checked_tail = True
+        append_frames([encode_frame(order) for order in orders], self.record_path("orders"))
+
+
+class SQLiteBackend(StorageBackend):
+    """Stores entities in indexed sqlite3 tables so single-record writes and lookups do not touch the rest of the data."""
+    incremental = True
+    order_appends = True
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS customers (
+            username TEXT PRIMARY KEY, password TEXT, email TEXT, purchase_date TEXT, tickets BLOB, cart BLOB);
+        CREATE INDEX IF NOT EXISTS customers_email ON customers (email);
+        CREATE TABLE IF NOT EXISTS admins (
+            admin_id TEXT PRIMARY KEY, password TEXT, email TEXT, order_ids BLOB);
+        CREATE TABLE IF NOT EXISTS tickets (
+            ticket_type TEXT PRIMARY KEY, position INTEGER, description TEXT, price REAL, validity TEXT,
+            limitations TEXT, discount INTEGER);
+        CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER PRIMARY KEY, username TEXT, purchase_date TEXT, status TEXT, total_price REAL, tickets BLOB);
+        CREATE INDEX IF NOT EXISTS orders_username ON orders (username);
+        CREATE INDEX IF NOT EXISTS orders_purchase_date ON orders (purchase_date);
+        CREATE TABLE IF NOT EXISTS sales (
+            purchase_date TEXT PRIMARY KEY, ticket_count INTEGER, total_price REAL, ticket_types BLOB);
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        # Writes may come from the persistence worker thread; DataLayer routes all of them through that one thread
+        self.connection = sqlite3.connect(filepath, check_same_thread=False)
+        self.connection.executescript(self.SCHEMA)
+
+    # Row Converters
+    def _order_row(self, order):
+        return (order.get("order_id"), order.get("username"), order["purchase_date"].isoformat(), order["status"],
+                order["total_price"], pickle.dumps(order["tickets"]))
+
+    def _order_from_row(self, row):
+        return {"order_id": row[0], "username": row[1], "purchase_date": date.fromisoformat(row[2]), "status": row[3],
+                "total_price": row[4], "tickets": pickle.loads(row[5])}
+
+    def _customer_row(self, customer):
+        return (customer["username"], customer["password"], customer["email"], customer["purchase_date"].isoformat(),
+                pickle.dumps(customer["tickets"]), pickle.dumps(customer.get("cart", [])))
+
+    def _customer_from_row(self, row):
+        return {"username": row[0], "password": row[1], "email": row[2], "purchase_date": date.fromisoformat(row[3]),
+                "tickets": pickle.loads(row[4]), "cart": pickle.loads(row[5])}
+
+    def _write_record(self, entity, record, position=0):
+        if entity == "customers":
+            self.connection.execute("INSERT OR REPLACE INTO customers VALUES (?, ?, ?, ?, ?, ?)", self._customer_row(record))
+        elif entity == "admins":
+            self.connection.execute("INSERT OR REPLACE INTO admins VALUES (?, ?, ?, ?)",
+                                    (record["admin_id"], record["password"], record["email"], pickle.dumps(record["order_ids"])))
+        elif entity == "sales":
+            self.connection.execute("INSERT OR REPLACE INTO sales VALUES (?, ?, ?, ?)",
+                                    (record["purchase_date"].isoformat(), record["ticket_count"], record["total_price"],
+                                     pickle.dumps(record["ticket_types"])))
+        elif entity == "tickets":
+            self.connection.execute("INSERT OR REPLACE INTO tickets VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                    (record["ticket_type"], position, record["description"], record["price"],
+                                     record["validity"], record["limitations"], record.get("discount", 0)))
+        else:
+            self.connection.execute("INSERT OR REPLACE INTO orders VALUES (?, ?, ?, ?, ?, ?)", self._order_row(record))
+
+    # Backend Interface
+    def iter_records(self, entity):
+        # The cursor hands rows over as they are read instead of fetching the whole table
+        if entity == "customers":
+            for row in self.connection.execute("SELECT * FROM customers ORDER BY rowid"):
+                yield self._customer_from_row(row)
+        elif entity == "orders":
+            for row in self.connection.execute("SELECT * FROM orders ORDER BY id"):
+                yield self._order_from_row(row)
+        else:
+            yield from self.load(entity)
+
+    def load(self, entity):
+        if entity == "customers":
+            rows = self.connection.execute("SELECT * FROM customers ORDER BY rowid").fetchall()
+            return [self._customer_from_row(row) for row in rows]
+        if entity == "admins":
+            rows = self.connection.execute("SELECT * FROM admins ORDER BY rowid")
+            return [{"admin_id": row[0], "password": row[1], "email": row[2], "order_ids": pickle.loads(row[3])} for row in rows]
+        if entity == "tickets":
+            rows = self.connection.execute(
+                "SELECT ticket_type, description, price, validity, limitations, discount FROM tickets ORDER BY position")
+            return [dict(zip(("ticket_type", "description", "price", "validity", "limitations", "discount"), row)) for row in rows]
+        if entity == "sales":
+            rows = self.connection.execute("SELECT * FROM sales ORDER BY purchase_date")
+            return [{"purchase_date": date.fromisoformat(row[0]), "ticket_count": row[1], "total_price": row[2],
+                     "ticket_types": pickle.loads(row[3])} for row in rows]
+        return self.find_orders()
+
+    def save(self, entity, records):
+        with self.connection:
+            self.connection.execute(f"DELETE FROM {entity}")
+            for position, record in enumerate(records):
+                self._write_record(entity, record, position)
+
+    def get(self, entity, key):
+        if entity == "customers":
+            row = self.connection.execute("SELECT * FROM customers WHERE username = ?", (key,)).fetchone()
+            return self._customer_from_row(row) if row else None
+        return super().get(entity, key)
+
+    def upsert(self, entity, record):
+        with self.connection:
+            position = 0
+            if entity == "tickets":
+                row = self.connection.execute("SELECT position FROM tickets WHERE ticket_type = ?", (record["ticket_type"],)).fetchone()
+                position = row[0] if row else self.connection.execute("SELECT COUNT(*) FROM tickets").fetchone()[0]
+            self._write_record(entity, record, position)
+
+    def delete(self, entity, key):
+        if isinstance(key, date):
+            key = key.isoformat()
+        with self.connection:
+            self.connection.execute(f"DELETE FROM {entity} WHERE {ENTITY_KEYS[entity]} = ?", (key,))
+
+    def apply_changes(self, entity, changes):
+        for key, record in changes.items():
+            if record is None:
+                self.delete(entity, key)
+            else:
+                self.upsert(entity, record)
+
+    def add_orders(self, orders):
+        # A checkout is a single-row insert in one transaction, whatever the size of the history
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO orders VALUES (?, ?, ?, ?, ?, ?)", map(self._order_row, orders))
+
+    def replace_order(self, order):
+        self.add_order(order)  # The id primary key makes the insert replace the old row
+
+    def get_order(self, order_id):
+        row = self.connection.execute("SELECT * FROM orders WHERE id = ?", (order_id,)).fetchone()
+        return self._order_from_row(row) if row else None
+
+    def remove_order(self, order_id):
+        with self.connection:
+            self.connection.execute("DELETE FROM orders WHERE id = ?", (order_id,))
+
+    def find_orders(self, username=None, purchase_date=None):
+        query, params = "SELECT * FROM orders", []
+        conditions = []
+        if username is not None:
+            conditions.append("username = ?")
+            params.append(username)
+        if purchase_date is not None:
+            conditions.append("purchase_date = ?")
+            params.append(purchase_date.isoformat())
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        rows = self.connection.execute(query + " ORDER BY id", params)
+        return [self._order_from_row(row) for row in rows]
+
+    def identities(self):
+        return self.connection.execute("SELECT username, email FROM customers ORDER BY rowid").fetchall()
+
+    def close(self):
+        self.connection.close()
+
+
+def create_backend(name, filepaths):
+    """Build the storage backend selected by name ("pickle", "binary", "framed", "sqlite" or "memory")."""
+    if name == "sqlite":
+        return SQLiteBackend(filepaths["database"])
+    if name == "memory":
+        return MemoryBackend()
+    if name == "pickle":
+        return PickleBackend(filepaths)
+    if name == "binary":
+        return BinaryOrdersBackend(filepaths)
+    if name == "framed":
+        return FramedBackend(filepaths)
+    raise ValueError(f"Unknown storage backend: {name}")
+
+
+def copy_backend(source, target):
+    """Copy every entity from one storage backend into another, e.g. to move the pickle files into SQLite."""
+    # Stage in memory so a source still in the duplicated-orders layout is migrated on the way
+    staging = MemoryBackend()
+    for entity in ENTITY_KEYS:
+        staging.save(entity, source.load(entity))
+    staging_layer = DataLayer(backend=staging)
+    if staging_layer.needs_order_migration():
+        staging_layer.migrate_duplicated_orders()
+    for entity in ENTITY_KEYS:
+        target.save(entity, staging.load(entity))
+
+
+class CustomerCache:
+    """
+    Lazily materialized, LRU-bounded view of the customers, used in place of the customer list.
+    Only the identities (username and email) of every customer are kept; accounts are read from storage
+    (their shard, or their row) and built on first access, and evicted once the cache holds more than
+    max_entries accounts or max_bytes of raw record data. Dirty accounts (changed through their setters,
+    or marked with mark_dirty) are written back first.
+    With shards, only the accounts of those customer shards are held.
+    """
+    def __init__(self, data_layer, max_entries=256, max_bytes=None, order_store=None, shards=None, progress=None):
+        self.data_layer = data_layer
+        self.order_store = order_store  # Purchase histories of materialized accounts are views over this store
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.shards = shards
+        self.__cache = OrderedDict()  # username -> (customer, estimated bytes), least recently used first
+        self.__cached_bytes = 0
+        self.__dirty = set()
+        self.__pinned = set()
+        if data_layer.backend.incremental:
+            self.__emails = dict(data_layer.backend.identities())  # username -> email, in signup order
+        else:
+            # One streaming pass, shard by shard; the rest of each record is dropped as soon as it is read
+            self.__emails = {raw["username"]: raw["email"] for raw in data_layer.iter_customer_records(shards, progress)}
+
+    def identities(self):
+        return list(self.__emails.items())
+
+    def __len__(self):
+        return len(self.__emails)
+
+    def __iter__(self):
+        # Cold accounts are materialized for the caller without displacing the hot ones
+        for username in list(self.__emails):
+            if username in self.__cache:
+                yield self.__cache[username][0]
+            else:
+                customer = self.load_customer(username)
+                if customer is not None:
+                    yield customer
+
+    def __contains__(self, customer):
+        return self.__cache.get(customer.get_username(), (None,))[0] is customer
+
+    def load_customer(self, username):
+        if username not in self.__emails:
+            return None  # Unknown, or in a shard this cache does not hold
+        raw = self.data_layer.get_customer_record(username)
+        return self.data_layer.customer_from_raw(raw, self.order_store) if raw else None
+
+    def get(self, username):
+        if username in self.__cache:
+            self.__cache.move_to_end(username)
+            return self.__cache[username][0]
+        customer = self.load_customer(username)
+        if customer is not None:
+            self.__insert(customer)
+        return customer
+
+    def append(self, customer):
+        """Register a new account; persisting it stays with the caller."""
+        username = customer.get_username()
+        self.__emails[username] = customer.get_email()
+        self.__insert(customer)
+
+    def remove(self, customer):
+        username = customer.get_username()
+        del self.__emails[username]
+        if username in self.__cache:
+            self.__cached_bytes -= self.__cache.pop(username)[1]
+        self.__dirty.discard(username)
+        self.__pinned.discard(username)
+
+    def rename(self, customer, old_username):
+        """Re-key an account after its username or email changed."""
+        username = customer.get_username()
+        del self.__emails[old_username]
+        self.__emails[username] = customer.get_email()
+        if old_username in self.__cache:
+            self.__cache[username] = self.__cache.pop(old_username)
+        if old_username in self.__pinned:
+            self.__pinned.discard(old_username)
+            self.__pinned.add(username)
+        self.__dirty.discard(old_username)
+        # Store the account under its new name, and its orders with the new owner, before dropping the old record
+        orders = self.order_store.history_for(username, archived=False) if self.order_store is not None else []
+        self.data_layer.rename_customer(customer, old_username, orders)
+
+    def mark_dirty(self, customer):
+        self.__dirty.add(customer.get_username())
+
+    def pin(self, customer):
+        """Keep an account (e.g. the logged-in one) cached so callers holding it never see a stale copy."""
+        self.__pinned.add(customer.get_username())
+
+    def unpin(self, customer):
+        self.__pinned.discard(customer.get_username())
+        self.__evict()
+
+    def is_dirty(self, username):
+        return username in self.__dirty or (username in self.__cache and self.__cache[username][0].is_dirty())
+
+    def flush(self):
+        """Write back every dirty account, in one write per shard they fall in."""
+        customers = [customer for username, (customer, _) in self.__cache.items() if self.is_dirty(username)]
+        if customers:
+            self.data_layer.save_customer_batch(customers)
+        self.__dirty.clear()
+
+    def covers(self, username):
+        """Whether the account belongs to the shards this cache holds."""
+        return self.shards is None or self.data_layer.backend.shard_of(username) in self.shards
+
+    def refresh_account(self, username, raw):
+        """
+        Take in an account another process created or changed (raw) or deleted (raw None). A cached copy with
+        unsaved changes of its own is left alone; a pinned one is updated in place for the session holding it.
+        """
+        if raw is None:
+            if username in self.__emails:
+                del self.__emails[username]
+                if username in self.__cache:
+                    self.__cached_bytes -= self.__cache.pop(username)[1]
+                self.__dirty.discard(username)
+                self.__pinned.discard(username)
+            return
+        self.__emails[username] = raw["email"]
+        if username not in self.__cache or self.is_dirty(username):
+            return
+        if username in self.__pinned:
+            customer = self.__cache[username][0]
+            customer.set_password(raw["password"])
+            customer.set_email(raw["email"])
+            cart = customer.get_cart()
+            cart.clear_cart()
+            for item in raw.get("cart", []):
+                cart.add_to_cart(self.data_layer.ticket_from_raw(item))
+            customer.mark_clean()  # Now as stored
+        else:
+            self.__cached_bytes -= self.__cache.pop(username)[1]  # Rebuilt from the new record on next access
+
+    def reload(self, usernames=None):
+        """Re-read the given accounts (all of them when usernames is None) after another process rewrote them."""
+        if usernames is not None:
+            for username in usernames:
+                if self.covers(username):
+                    self.refresh_account(username, self.data_layer.get_customer_record(username))
+            return
+        cached = {}  # username -> record of the cached accounts, taken from the same pass
+        if self.data_layer.backend.incremental:
+            stored = dict(self.data_layer.backend.identities())  # username -> email; only cached accounts are re-read
+        else:
+            stored = {}
+            for raw in self.data_layer.iter_customer_records(self.shards):
+                stored[raw["username"]] = raw["email"]
+                if raw["username"] in self.__cache:
+                    cached[raw["username"]] = raw
+        for username in [username for username in self.__emails if username not in stored]:
+            self.refresh_account(username, None)
+        for username, email in stored.items():
+            if username in self.__cache:
+                self.refresh_account(username, cached.get(username) or self.data_layer.get_customer_record(username))
+            else:
+                self.__emails[username] = email
+
+    def __insert(self, customer):
+        size = len(pickle.dumps(self.data_layer.customer_to_raw(customer))) if self.max_bytes else 0
+        self.__cache[customer.get_username()] = (customer, size)
+        self.__cached_bytes += size
+        self.__evict()
+
+    def __over_budget(self):
+        if self.max_entries is not None and len(self.__cache) > self.max_entries:
+            return True
+        return self.max_bytes is not None and self.__cached_bytes > self.max_bytes
+
+    def __evict(self):
+        for username in list(self.__cache):
+            if not self.__over_budget():
+                return
+            if username in self.__pinned:
+                continue
+            dirty = self.is_dirty(username)
+            customer, size = self.__cache.pop(username)
+            self.__cached_bytes -= size
+            if dirty:
+                self.data_layer.save_customer(customer)  # Read back from the worker's queue or the log until stored
+                self.__dirty.discard(username)
+
+
+class PersistenceWorker:
+    """
+    Background thread that runs DataLayer writes off the UI thread.
+    Each write is queued under a key; a newer write for the same key replaces the pending one, so a burst of
+    mutations to one entity file or record within `window` seconds becomes a single write.
+    """
+    def __init__(self, window=0.25):
+        self.window = window
+        self.__condition = threading.Condition()
+        self.__pending = OrderedDict()  # key -> job, oldest first
+        self.__next_id = 0
+        self.__busy = False
+        self.__flushing = 0  # Number of callers waiting in flush(); they skip the coalescing window
+        self.__closed = False
+        self.__error = None
+        self.__thread = threading.Thread(target=self.__run, name="persistence-worker", daemon=True)
+        self.__thread.start()
+
+    def submit(self, job, key=None):
+        """Queue a write; pass a key to let it replace a pending write with the same key."""
+        with self.__condition:
+            if self.__closed:
+                raise RuntimeError("The persistence worker has been shut down.")
+            if key is None:
+                self.__next_id += 1
+                key = ("job", self.__next_id)
+            # The replacement moves to the back so it still runs after everything submitted before it
+            self.__pending.pop(key, None)
+            self.__pending[key] = job
+            self.__condition.notify_all()
+
+    def flush(self):
+        """Block until every queued write has run, re-raising the first write that failed."""
+        with self.__condition:
+            self.__flushing += 1
+            self.__condition.notify_all()
+            while self.__pending or self.__busy:
+                self.__condition.wait()
+            self.__flushing -= 1
+            error, self.__error = self.__error, None
+        if error is not None:
+            raise error
+
+    def shutdown(self):
+        """Barrier for closing the application: drain the queue, then stop the thread."""
+        try:
+            self.flush()
+        finally:
+            with self.__condition:
+                self.__closed = True
+                self.__condition.notify_all()
+            self.__thread.join()
+
+    def __run(self):
+        while True:
+            with self.__condition:
+                while not self.__pending and not self.__closed:
+                    self.__condition.wait()
+                if not self.__pending:
+                    return
+                # Collect the rest of the burst for one window after its first write
+                deadline = time.monotonic() + self.window
+                while not self.__flushing and not self.__closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.__condition.wait(remaining)
+                jobs = list(self.__pending.values())
+                self.__pending.clear()
+                self.__busy = True
+            for job in jobs:
+                try:
+                    job()
+                except Exception as e:
+                    print(f"Background write failed: {e}")
+                    with self.__condition:
+                        self.__error = self.__error or e
+            with self.__condition:
+                self.__busy = False
+                self.__condition.notify_all()
+
+
+class OrderIdAllocator:
+    """
+    Hands out durable order IDs from blocks leased in a small lease file that holds the next unleased ID.
+    Leasing a block is the only disk write, and the file is locked while it is advanced, so app instances
+    sharing the data never receive the same ID. IDs left in a block when the process exits are skipped.
+    """
+    def __init__(self, filepath, block_size=100, first_id=None):
+        self.filepath = filepath
+        self.block_size = block_size
+        self.first_id = first_id  # Called once, when the lease file does not exist yet, for the first free ID
+        self.__next = 0
+        self.__end = 0  # End of the current lease (exclusive)
+        self.__lock = threading.Lock()
+
+    def next_id(self):
+        with self.__lock:
+            if self.__next >= self.__end:
+                self.__next, self.__end = self.lease()
+            order_id = self.__next
+            self.__next += 1
+            return order_id
+
+    def reserve(self, count):
+        """Consecutive IDs for a batch of count orders: the rest of the current block, then one lease covering the others."""
+        with self.__lock:
+            ids = list(range(self.__next, min(self.__end, self.__next + count)))
+            self.__next += len(ids)
+            if len(ids) < count:
+                start, self.__end = self.lease(count - len(ids) + self.block_size)
+                self.__next = start + count - len(ids)
+                ids += range(start, self.__next)
+            return ids
+
+    def lease(self, size=None):
+        """Reserve the next block of IDs (size of them, block_size by default) and return it as (start, end)."""
+        descriptor = os.open(self.filepath, os.O_RDWR | os.O_CREAT)
+        try:
+            if fcntl is not None:
+                fcntl.flock(descriptor, fcntl.LOCK_EX)
+            content = os.read(descriptor, 64).strip()
+            if content:
+                start = int(content)
+            else:
+                start = self.first_id() if self.first_id else 1
+            end = start + (size or self.block_size)
+            os.lseek(descriptor, 0, os.SEEK_SET)
+            os.ftruncate(descriptor, 0)
+            os.write(descriptor, str(end).encode())
+            os.fsync(descriptor)
+            return start, end
+        finally:
+            os.close(descriptor)  # Closing also releases the lock
+
+
+class ProcessLock:
+    """
+    Exclusive advisory lock (flock on a lock file) shared by every app process using the same data files.
+    It is re-entrant within a process; DataLayer takes it around each single write or log read only, so
+    several entrances selling at once wait on each other for milliseconds rather than whole operations.
+    """
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.__lock = threading.RLock()
+        self.__depth = 0
+        self.__descriptor = None
+        self.__acquired = 0.0
+        self.wait_time = 0.0  # Total seconds spent waiting for other processes
+        self.longest_hold = 0.0
+
+    def __enter__(self):
+        self.__lock.acquire()
+        if self.__depth == 0:
+            start = time.perf_counter()
+            if self.__descriptor is None:
+                self.__descriptor = os.open(self.filepath, os.O_RDWR | os.O_CREAT)
+            if fcntl is not None:
+                fcntl.flock(self.__descriptor, fcntl.LOCK_EX)
+            self.__acquired = time.perf_counter()
+            self.wait_time += self.__acquired - start
+        self.__depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self.__depth -= 1
+        if self.__depth == 0:
+            self.longest_hold = max(self.longest_hold, time.perf_counter() - self.__acquired)
+            if fcntl is not None:
+                fcntl.flock(self.__descriptor, fcntl.LOCK_UN)
+        self.__lock.release()
+
+
+class DataLayer:
+    def __init__(self, log_mode=False, compact_threshold=500, backend="pickle", background=False, write_window=0.25,
+                 archive_after=None, archive_compression="zlib"):
         self.filepaths = {
-            "customers": r"C:\Users\shi5_\OneDrive\Desktop\customers.pkl",
-            "admins": r"C:\Users\shi5_\OneDrive\Desktop\admins.pkl",
-            "tickets": r"C:\Users\shi5_\OneDrive\Desktop\tickets.pkl",
-            "orders": r"C:\Users\shi5_\OneDrive\Desktop\orders.pkl",
+            "customers": get_filepath("customers.pkl"),
+            "admins": get_filepath("admins.pkl"),
+            "tickets": get_filepath("tickets.pkl"),
+            "orders": get_filepath("orders.pkl"),
+            "sales": get_filepath("sales.pkl"),
+            "database": get_filepath("adventure_land.db"),
+            "order_lines": get_filepath("orders.bin"),
+            "order_strings": get_filepath("orders.dict"),
+            "log": get_filepath("data.log"),
+            "checkpoint": get_filepath("data.log.ckpt"),
+            "catalog_seed": get_filepath("catalog.seed"),  # Hash of the seed data the tickets were written from
+            "order_ids": get_filepath("order_ids.lease"),  # Next order ID not yet leased to an app instance
+            "lock": get_filepath("data.lock"),  # Held while an app process writes the data files or reads the log
+            "versions": get_filepath("data.versions"),  # Change stamps of the entity files
+            "customer_shards": get_filepath("customers.shards"),  # Shard count of a hash-sharded customer store
+            "order_archive": get_filepath("orders.archive"),  # Directory of the compressed segments of old orders
         }
+        # Accept either a backend name or a ready-made StorageBackend instance
+        self.backend = create_backend(backend, self.filepaths) if isinstance(backend, str) else backend
+        # The log only pays off for backends that would otherwise rewrite whole files
+        self.log_mode = log_mode and not self.backend.incremental  # Append mutations to the log instead of rewriting the entity files
+        self.compact_threshold = compact_threshold  # Number of log records before they are folded into the snapshot
+        self.__pending_records = 0
+        # Opt-in background writes: the UI thread only queues them and never waits on disk I/O
+        self.worker = PersistenceWorker(write_window) if background else None
+        self.__log_buffer = []  # Log records waiting for the worker; their sequence numbers are assigned when written
+        self.__unflushed = {}  # (entity, key) -> record (None when deleted) queued but not yet written
+        self.__lock = threading.Lock()
+        # Orders older than archive_after days move to compressed segments on load (never when None)
+        self.archive_after = archive_after
+        self.archive = OrderArchive(self.filepaths["order_archive"], archive_compression, from_raw=self.order_from_raw)
+        self.order_ids = OrderIdAllocator(self.filepaths["order_ids"], first_id=self.first_free_order_id)
+        # Other app processes may share the files: every write and log read holds the process lock
+        self.process_lock = ProcessLock(self.filepaths["lock"])
+        self.writer_id = f"{os.getpid()}-{os.urandom(4).hex()}"  # Tags this instance's entries in the change feed
+        self.__seen_stamp = 0  # Last change stamp refresh() has taken in
+        self.__versions = None  # ((inode, mtime), feed) of the change feed last read
+        self.__deleted = {}  # entity -> keys this instance deleted, which merges must not bring back
+        self.__stored_keys = {}  # entity -> keys of the records this instance last loaded or saved as a whole set
+        self.__log_position = (None, 0)  # (inode, byte offset) of the log read so far
+        self.__applied_seq = 0  # Highest log sequence number this instance has written or taken in
+        self.__foreign = []  # Log records other processes appended, waiting for refresh()
+        self.__missed = False  # Set when another process compacted records this instance never read
+        self.__load_options = {}
+        self.__pinned_logs = {}  # thread -> log records that load_all or compact reads every entity against
 
-    # Generalized Methods
-    def save_entities(self, entities, filepath, to_serializable):
+    # Background Writes
+    def write(self, job, key=None):
+        """Run a write now, or queue it on the persistence worker (replacing a pending write with the same key)."""
+        if self.worker is None:
+            job()
+        else:
+            self.worker.submit(job, key)
+
+    def flush(self):
+        """Wait until every queued write is on disk."""
+        if self.worker is not None:
+            self.worker.flush()
+
+    def shutdown(self):
+        """Drain the queued writes and stop the worker; call before the application exits."""
+        if self.worker is not None:
+            self.worker.shutdown()
+            self.worker = None
+
+    def upsert_record(self, entity, record):
+        key = record[ENTITY_KEYS[entity]]
+        self.track_stored(entity, added=[key])
+        self.__write_record((entity, key), record, lambda: self.change(entity, key, lambda: self.backend.upsert(entity, record)))
+
+    def delete_record(self, entity, key):
+        self.__deleted.setdefault(entity, set()).add(key)
+        self.track_stored(entity, removed=[key])
+        self.__write_record((entity, key), None, lambda: self.change(entity, key, lambda: self.backend.delete(entity, key)))
+
+    def upsert_records(self, entity, records):
+        """Write several records of one entity at once; a sharded customer store rewrites each shard it touches once."""
+        changes = {record[ENTITY_KEYS[entity]]: record for record in records}
+        self.track_stored(entity, added=changes)
+        if changes:
+            self.__write_records({(entity, key): record for key, record in changes.items()},
+                                 lambda: self.change(entity, list(changes), lambda: self.backend.apply_changes(entity, changes)))
+
+    def track_stored(self, entity, added=(), removed=()):
+        """Keep the keys save_entities compares against current when records are written or deleted one at a time."""
+        keys = self.__stored_keys.get(entity)
+        if keys is not None:
+            keys.update(added)
+            keys.difference_update(removed)
+
+    def get_record(self, entity, key):
+        """Single-record read that also sees writes still queued on the worker."""
+        with self.__lock:
+            if (entity, key) in self.__unflushed:
+                return self.__unflushed[(entity, key)]
+        return self.backend.get(entity, key)
+
+    def get_customer_record(self, username):
+        """
+        One account's raw record (None when there is none). In log mode an account saved since the last compaction is
+        taken from the log records, the ones still waiting for the worker first; otherwise the backend reads it alone
+        (from its shard file on pickle files).
+        """
+        if self.log_mode:
+            with self.__lock:
+                buffered = list(self.__log_buffer)
+            changed = self.pending_changes("customers")[0]  # Read after the buffer, so a record moving between them is seen
+            for record in reversed(buffered):
+                if record["op"] in ("account_created", "account_saved") and record["customer"]["username"] == username:
+                    return record["customer"]
+                if record["op"] == "account_deleted" and record["username"] == username:
+                    return None
+            if username in changed:
+                return changed[username]
+        return self.get_record("customers", username)
+
+    def __write_record(self, key, record, write):
+        self.__write_records({key: record}, write, key)
+
+    def __write_records(self, records, write, key=None):
+        # records: (entity, key) -> record the queued write stores, visible to get_record until it has run
+        if self.worker is None:
+            write()
+            return
+        with self.__lock:
+            self.__unflushed.update(records)
+        def job():
+            write()
+            with self.__lock:
+                for unflushed_key, record in records.items():
+                    if unflushed_key in self.__unflushed and self.__unflushed[unflushed_key] is record:
+                        del self.__unflushed[unflushed_key]
+        self.worker.submit(job, key)
+
+    # Cross-Process Coordination
+    def read_versions(self):
+        """The change feed shared by the app processes: {"stamp": n, "changes": [(stamp, writer_id, entity, key), ...]}."""
         try:
-            serializable_data = [to_serializable(entity) for entity in entities]
-            save_to_file(serializable_data, filepath)
-        except Exception as e:
-            print(f"Failed to save entities to {filepath}: {e}")
-            raise
+            stat = os.stat(self.filepaths["versions"])
+        except FileNotFoundError:
+            return {"stamp": 0, "changes": []}
+        # Every write replaces the file, so an unchanged inode and mtime mean an unchanged feed
+        if self.__versions is None or self.__versions[0] != (stat.st_ino, stat.st_mtime_ns):
+            with open(self.filepaths["versions"], 'rb') as file:
+                self.__versions = ((stat.st_ino, stat.st_mtime_ns), pickle.load(file))
+        return self.__versions[1]
+
+    def change(self, entity, key, write):
+        """
+        Run one write to an entity file under the process lock and stamp it in the change feed (key None for a
+        whole-file write, a list for several records). Single-record writes read the stored file and change
+        only their record, so they never overwrite what another process wrote in the meantime.
+        """
+        keys = key if isinstance(key, list) else [key]
+        with self.process_lock:
+            write()
+            versions = self.read_versions()
+            stamp = versions["stamp"]
+            new = [(stamp + offset, self.writer_id, entity, key) for offset, key in enumerate(keys, 1)]
+            changes = (versions["changes"] + new)[-MAX_TRACKED_CHANGES:]
+            save_to_file({"stamp": stamp + len(keys), "changes": changes}, self.filepaths["versions"])
+
+    def changes_since_seen(self, versions):
+        """Other writers' changes this instance has not taken in, or None when the feed no longer reaches back that far."""
+        changes = versions["changes"]
+        if versions["stamp"] > self.__seen_stamp and (not changes or changes[0][0] > self.__seen_stamp + 1):
+            return None
+        return [change for change in changes if change[0] > self.__seen_stamp and change[1] != self.writer_id]
+
+    def merge_records(self, entity, stored, records):
+        """
+        Combine a whole-entity write with the stored records another process changed since this one last read
+        them: our records win key by key, records only the stored file has are kept, and records this instance
+        deleted stay deleted.
+        """
+        key_field = ENTITY_KEYS[entity]
+        key = (lambda record: record[key_field]) if key_field else (lambda record: record.get("order_id"))
+        ours = {key(record) for record in records}
+        deleted = self.__deleted.get(entity, set())
+        return list(records) + [record for record in stored if key(record) not in ours and key(record) not in deleted]
+
+    def __save_entity(self, entity, records):
+        def write():
+            changes = self.changes_since_seen(self.read_versions())
+            if changes is None or any(change[2] == entity for change in changes):
+                self.backend.save(entity, self.merge_records(entity, self.backend.load(entity), records))
+            else:
+                self.backend.save(entity, records)
+        self.change(entity, None, write)
 
-    def load_entities(self, filepath, from_raw):
+    # Generalized Methods
+    def save_entities(self, entities, entity, to_serializable):
+        """
+        Persist the current set of an entity: only the entities marked dirty are written, and the keys this
+        instance last loaded or saved but no longer holds are deleted, so the write scales with the change. An
+        entity this instance never loaded, or whose every record changed, is written whole, except that in log
+        mode changed accounts and orders are always logged, as the pending log records would replay over a
+        rewritten snapshot. The flags are cleared as the records are taken.
+        """
+        entities = list(entities)  # Freeze membership now
+        key_of = ENTITY_KEY_GETTERS[entity]
+        stored = self.__stored_keys.get(entity)
+        self.__stored_keys[entity] = {key_of(item) for item in entities}
+        changed = [item for item in entities if item.is_dirty()]
+        logged = self.log_mode and entity in ("customers", "orders")
+        if stored is None or (entities and len(changed) == len(entities) and not logged):
+            for item in entities:
+                item.mark_clean()
+            def job():
+                try:
+                    serializable_data = [to_serializable(item) for item in entities]  # Converted when the write runs
+                    self.__save_entity(entity, serializable_data)
+                except Exception as e:
+                    print(f"Failed to save {entity}: {e}")
+                    raise
+            self.write(job, key=entity)
+            return
+        removed = stored - self.__stored_keys[entity] - self.__deleted.get(entity, set())
+        if entity == "customers":
+            self.save_customer_batch(changed)  # Logged in log mode, like single account saves
+            for username in removed:
+                self.delete_customer(username)
+        elif entity == "orders":
+            self.__save_order_changes([self.order_to_raw(order) for order in changed], stored, removed)  # Logged in log mode too
+        else:
+            self.upsert_records(entity, [to_serializable(item) for item in changed])
+            for key in removed:
+                self.delete_record(entity, key)
+        for item in changed:
+            item.mark_clean()
+
+    def __save_order_changes(self, raws, stored, removed):
+        # Orders have no record key in the backends, so new, changed and removed orders take their own calls
+        self.__deleted.setdefault("orders", set()).update(removed)
+        added = [raw for raw in raws if raw["order_id"] not in stored]
+        replaced = [raw for raw in raws if raw["order_id"] in stored]
+        if self.log_mode:
+            # An order placed since the last compaction is only in the log, so its changes must be logged after it
+            if raws or removed:
+                self.append_record({"op": "orders_saved", "added": added, "changed": replaced, "removed": list(removed)})
+            return
+        def write():
+            if added:
+                self.backend.add_orders(added)
+            for raw in replaced:
+                self.backend.replace_order(raw)
+            for order_id in removed:
+                self.backend.remove_order(order_id)
+        if raws or removed:
+            self.write(lambda: self.change("orders", [raw["order_id"] for raw in raws] + list(removed), write))
+
+    def load_entities(self, entity, from_raw):
         try:
-            raw_data = load_from_file(filepath)
-            return [from_raw(data) for data in raw_data]
+            entities = [from_raw(data) for data in self.iter_records(entity)]
         except Exception as e:
-            print(f"Failed to load entities from {filepath}: {e}")
+            print(f"Failed to load {entity}: {e}")
             raise
+        self.__stored_keys[entity] = {ENTITY_KEY_GETTERS[entity](item) for item in entities}
+        return entities
 
-    # Entity-Specific Save Methods
-    def save_customers(self, customers):
-        self.save_entities(
-            customers,
-            self.filepaths["customers"],
-            lambda customer: {
-                "username": customer.get_username(),
-                "password": customer.get_password(),
-                "email": customer.get_email(),
-                "purchase_date": customer.get_order().get_purchase_date(),
-                "tickets": [
-                    {
-                        "ticket_type": ticket.get_ticket_type(),
-                        "description": ticket.get_description(),
-                        "price": ticket.get_price(),
-                        "validity": ticket.get_validity(),
-                        "limitations": ticket.get_limitations(),
-                        "discount": ticket.get_discount(),
-                    }
-                    for ticket in customer.get_order().get_tickets()
-                ],
-                "cart": [
-                    {
-                        "ticket_type": ticket.get_ticket_type(),
-                        "description": ticket.get_description(),
-                        "price": ticket.get_price(),
-                        "validity": ticket.get_validity(),
-                        "limitations": ticket.get_limitations(),
-                        "discount": ticket.get_discount(),
-                    }
-                    for ticket in customer.get_cart().get_cart_items()
-                ],
-                "purchase_history": [
-                    {
-                        "purchase_date": order.get_purchase_date(),
-                        "status": order.get_status().name,
-                        "total_price": order.get_total_price(),
-                        "tickets": [
-                            {
-                                "ticket_type": ticket.get_ticket_type(),
-                                "description": ticket.get_description(),
-                                "price": ticket.get_price(),
-                                "validity": ticket.get_validity(),
-                                "limitations": ticket.get_limitations(),
-                            }
-                            for ticket in order.get_tickets()
-                        ],
-                    }
-                    for order in customer.get_purchase_history()
-                ],
-            },
-        )
+    # Entity Converters (shared by the snapshot files and the append-only log)
+    def ticket_to_raw(self, ticket):
+        # Catalog tickets and order, account and cart lines share record_codec's TICKET layout, discount included
+        raw = {
+            "ticket_type": ticket.get_ticket_type(),
+            "description": ticket.get_description(),
+            "price": ticket.get_price(),
+            "validity": ticket.get_validity(),
+            "limitations": ticket.get_limitations(),
+            "discount": ticket.get_discount(),
+        }
+        if ticket.get_quantity() != 1:
+            raw["quantity"] = ticket.get_quantity()  # A line item; one ticket when absent
+        return raw
 
-    def save_admins(self, admins):
-        self.save_entities(
-            admins,
-            self.filepaths["admins"],
-            lambda admin: {
-                "admin_id": admin.get_admin_id(),
-                "password": admin.get_password(),
-                "email": admin.get_email(),
-                "orders": [
-                    {
-                        "purchase_date": order.get_purchase_date(),
-                        "status": order.get_status().name,
-                        "total_price": order.get_total_price(),
-                        "tickets": [
-                            {
-                                "ticket_type": ticket.get_ticket_type(),
-                                "description": ticket.get_description(),
-                                "price": ticket.get_price(),
-                                "validity": ticket.get_validity(),
-                                "limitations": ticket.get_limitations(),
-                            }
-                            for ticket in order.get_tickets()
-                        ],
-                    }
-                    for order in admin.get_orders()
-                ],
-            },
+    def ticket_from_raw(self, data, kind=Ticket):
+        return kind(
+            ticket_type=data["ticket_type"],
+            description=data["description"],
+            price=data["price"],
+            validity=data["validity"],
+            limitations=data["limitations"],
+            discount=data.get("discount", 0),  # Default discount to 0 if not present
+            quantity=data.get("quantity", 1),
         )
 
-    def save_orders(self, orders):
-        self.save_entities(orders, self.filepaths["orders"], lambda order: {
+    def catalog_ticket_from_raw(self, data):
+        return as_stored(self.ticket_from_raw(data, CatalogTicket))
+
+    def order_to_raw(self, order):
+        return {
+            "order_id": order.get_order_id(),
+            "username": order.get_customer(),  # The single reference from an order to its customer
             "purchase_date": order.get_purchase_date(),
             "status": order.get_status().name,
             "total_price": order.get_total_price(),
-            "tickets": [
-                {   "ticket_type": ticket.get_ticket_type(),
-                    "description": ticket.get_description(),
-                    "price": ticket.get_price(),
-                    "validity": ticket.get_validity(),
-                    "limitations": ticket.get_limitations(),}
-                for ticket in order.get_tickets()],})
+            "tickets": [self.ticket_to_raw(ticket) for ticket in order.get_tickets()],
+        }
+
+    def order_from_raw(self, data):
+        return as_stored(Order(
+            purchase_date=data["purchase_date"],
+            status=Status[data["status"]],
+            tickets=[self.ticket_from_raw(ticket) for ticket in merge_ticket_lines(data["tickets"])],
+            total_price=data["total_price"],
+            order_id=data.get("order_id"),
+            customer=data.get("username"),
+        ))
+
+    def customer_to_raw(self, customer):
+        return {
+            "username": customer.get_username(),
+            "password": customer.get_password(),
+            "email": customer.get_email(),
+            "purchase_date": customer.get_order().get_purchase_date(),
+            "tickets": [self.ticket_to_raw(ticket) for ticket in customer.get_order().get_tickets()],
+            "cart": [self.ticket_to_raw(ticket) for ticket in customer.get_cart().get_cart_items()],
+        }
+
+    def customer_from_raw(self, data, order_store=None):
+        """Build an account whose purchase history is a view over order_store (legacy records may still embed it)."""
+        return as_stored(CustomerAccount(
+            username=data["username"],
+            password=data["password"],
+            email=data["email"],
+            purchase_date=data["purchase_date"],
+            tickets=[self.ticket_from_raw(ticket) for ticket in data["tickets"]],
+            purchase_history=[self.order_from_raw(history) for history in data.get("purchase_history", [])],
+            cart=Cart(items=[self.ticket_from_raw(item) for item in data.get("cart", [])]),
+            order_store=order_store,
+        ))
+
+    def admin_to_raw(self, admin):
+        return {
+            "admin_id": admin.get_admin_id(),
+            "password": admin.get_password(),
+            "email": admin.get_email(),
+            "order_ids": [order.get_order_id() for order in admin.get_orders()],
+        }
+
+    def admin_from_raw(self, data, order_store=None):
+        if "order_ids" in data:
+            # Resolve the references to the shared orders instead of holding copies
+            orders = [order_store.find(order_id) for order_id in data["order_ids"]] if order_store is not None else []
+            orders = [order for order in orders if order is not None]
+        else:
+            orders = [self.order_from_raw(order_data) for order_data in data["orders"]]
+        return as_stored(Admin(
+            admin_id=data["admin_id"],
+            password=data["password"],
+            email=data["email"],
+            orders=orders,
+        ))
+
+    # Entity-Specific Save Methods
+    def save_customers(self, customers):
+        if isinstance(customers, CustomerCache):
+            customers.flush()  # Holds the dirty accounts itself; the others are not materialized
+            return
+        self.save_entities(customers, "customers", self.customer_to_raw)
+
+    def save_admins(self, admins):
+        self.save_entities(admins, "admins", self.admin_to_raw)
+
+    def save_orders(self, orders):
+        self.save_entities(orders, "orders", self.order_to_raw)
 
     def save_tickets(self, tickets):
         """
         Persist the list of tickets to a .pkl file.
         """
-        self.save_entities(tickets, self.filepaths["tickets"], lambda ticket: {
-            "ticket_type": ticket.get_ticket_type(),
-            "description": ticket.get_description(),
-            "price": ticket.get_price(),
-            "validity": ticket.get_validity(),
-            "limitations": ticket.get_limitations(),
-            "discount": ticket.get_discount()  # Include discount attribute
-        })
+        self.save_entities(tickets, "tickets", self.ticket_to_raw)
 
     # Entity-Specific Load Methods
-    def load_customers(self):
+    def load_records(self, entity):
+        """Load the raw records of one entity, with any pending log records replayed on top."""
+        return list(self.iter_records(entity))
+
+    def iter_records(self, entity):
+        """
+        Stream the raw records of one entity, with any pending log records applied. On the framed and SQLite
+        backends only one record is held at a time, so callers that consume it as they go run in constant memory.
+        """
+        self.flush()
+        yield from self.__fold_records(entity)
+
+    def __fold_records(self, entity):
+        # iter_records without waiting for the worker, so compaction can run on it
+        if not self.log_mode:
+            yield from self.backend.iter_records(entity)
+            return
+        key_field = ENTITY_KEYS[entity]
+        changed, appended = self.pending_changes(entity)
+        for record in self.backend.iter_records(entity):
+            key = record[key_field] if key_field else record.get("order_id")
+            if entity == "tickets" and key in changed:
+                record = dict(record, **changed.pop(key))
+            elif key in changed:
+                record = changed.pop(key)
+                if record is None:
+                    continue
+            yield record
+        if entity == "customers":
+            yield from (record for record in changed.values() if record is not None)
+        yield from appended.values()
+
+    def iter_customers(self, order_store=None):
+        """Yield one account at a time; pass an order_store when the purchase histories are needed."""
+        for data in self.iter_records("customers"):
+            yield self.customer_from_raw(data, order_store)
+
+    def iter_orders(self, username=None, purchase_date=None):
+        """Yield one order at a time, optionally only those of one customer and/or day."""
+        for data in self.iter_records("orders"):
+            if (username is None or data.get("username") == username) and (purchase_date is None or data["purchase_date"] == purchase_date):
+                yield self.order_from_raw(data)
+
+    def iter_customer_records(self, shards=None, progress=None):
+        """
+        Stream the raw customer records shard by shard, only those of the given shard indexes when shards is
+        given; progress(done, total) is called after each shard. Unsharded stores are a single shard 0.
+        """
+        self.flush()
+        shards = list(range(self.backend.customer_shards())) if shards is None else list(shards)
+        changed = self.pending_changes("customers")[0] if self.log_mode else {}
+        for done, index in enumerate(shards, 1):
+            # Accounts logged since the snapshot, folded into the shard they hash to
+            shard_changes = {username: record for username, record in changed.items() if self.backend.shard_of(username) == index}
+            yield from apply_changes_to(self.backend.load_shard(index), "username", shard_changes)
+            if progress is not None:
+                progress(done, len(shards))
+
+    def load_customers(self, order_store=None, shards=None, progress=None):
+        if order_store is None:
+            order_store = OrderStore(self.load_orders(), archive=self.archive)
         try:
-            return self.load_entities(self.filepaths["customers"], lambda data: CustomerAccount(
-                username=data["username"],
-                password=data["password"],
-                email=data["email"],
-                purchase_date=data["purchase_date"],
-                tickets=[
-                    Ticket(
-                        ticket_type=ticket_data["ticket_type"],
-                        description=ticket_data["description"],
-                        price=ticket_data["price"],
-                        validity=ticket_data["validity"],
-                        limitations=ticket_data["limitations"],
-                    )
-                    for ticket_data in data["tickets"]
-                ],
-                purchase_history=[
-                    Order(
-                        purchase_date=history["purchase_date"],
-                        status=Status[history["status"]],
-                        tickets=[
-                            Ticket(
-                                ticket_type=ticket["ticket_type"],
-                                description=ticket["description"],
-                                price=ticket["price"],
-                                validity=ticket["validity"],
-                                limitations=ticket["limitations"],
-                            )
-                            for ticket in history["tickets"]
-                        ],
-                        total_price=history["total_price"],
-                    )
-                    for history in data["purchase_history"]
-                ],
-                cart=Cart(items=[
-                    Ticket(
-                        ticket_type=item["ticket_type"],
-                        description=item["description"],
-                        price=item["price"],
-                        validity=item["validity"],
-                        limitations=item["limitations"],
-                        discount=item["discount"],
-                    )
-                    for item in data.get("cart", [])
-                ])
-            ))
+            customers = [self.customer_from_raw(data, order_store) for data in self.iter_customer_records(shards, progress)]
         except ValueError as e:
             print(f"Error loading customers: {e}. Returning empty list.")
             return []
+        self.__stored_keys["customers"] = {customer.get_username() for customer in customers}
+        return customers
 
-    def load_admins(self):
-        return self.load_entities(self.filepaths["admins"], lambda data: Admin(
-            admin_id=data["admin_id"],
-            password=data["password"],
-            email=data["email"],
-            orders=[
-                Order(
-                    purchase_date=order_data["purchase_date"],
-                    status=Status[order_data["status"]],
-                    tickets=[
-                        Ticket(
-                            ticket_type=ticket["ticket_type"],
-                            description=ticket["description"],
-                            price=ticket["price"],
-                            validity=ticket["validity"],
-                            limitations=ticket["limitations"],)
-                        for ticket in order_data["tickets"]],
-                    total_price=order_data["total_price"],)
-                for order_data in data["orders"]],))
+    def load_admins(self, order_store=None):
+        if order_store is None:
+            order_store = OrderStore(self.load_orders(), archive=self.archive)
+        return self.load_entities("admins", lambda data: self.admin_from_raw(data, order_store))
 
     def load_orders(self):
-        return self.load_entities(self.filepaths["orders"], lambda data: Order(
-            purchase_date=data["purchase_date"],
-            status=Status[data["status"]],
-            tickets=[
-                Ticket(
-                    ticket_type=ticket["ticket_type"],
-                    description=ticket["description"],
-                    price=ticket["price"],
-                    validity=ticket["validity"],
-                    limitations=ticket["limitations"],)
-                for ticket in data["tickets"]],
-            total_price=data["total_price"],))
+        orders = list(self.iter_orders())
+        self.__stored_keys["orders"] = {order.get_order_id() for order in orders}
+        return orders
 
     def load_tickets(self):
         """
         Load the list of tickets from the .pkl file.
         """
-        return self.load_entities(self.filepaths["tickets"], lambda data: Ticket(
-            ticket_type=data["ticket_type"],
-            description=data["description"],
-            price=data["price"],
-            validity=data["validity"],
-            limitations=data["limitations"],
-            discount=data.get("discount", 0)  # Default discount to 0 if not present
-        ))
+        return self.load_entities("tickets", self.catalog_ticket_from_raw)
+
+    def load_sales(self):
+        self.flush()
+        aggregate = self.__fold_sales()
+        aggregate.mark_clean()  # Days folded from the log are stored there
+        self.__stored_keys["sales"] = set(aggregate.get_daily_sales())
+        return aggregate
+
+    def __fold_sales(self):
+        aggregate = SalesAggregate(self.backend.load("sales"))
+        if self.log_mode:
+            # The aggregate snapshot covers the folded log, so only pending orders are added on top
+            for record in self.read_log():
+                if record["op"] == "sales_rebuilt":
+                    aggregate = SalesAggregate(record["days"])
+                elif record["op"] == "order_placed":
+                    aggregate.record_raw_order(record["order"])
+                elif record["op"] in ("order_cancelled", "order_deleted") and record["was_paid"]:
+                    aggregate.remove_order(self.order_from_raw(dict(record["order"], status=Status.Paid.name)))
+        return aggregate
+
+    def save_sales(self, aggregate):
+        """Write the days that changed since the aggregate was loaded or last saved; one never loaded here is written whole."""
+        if "sales" not in self.__stored_keys:
+            self.__replace_sales(aggregate)
+            return
+        days = {purchase_date: aggregate.get_day(purchase_date) for purchase_date in aggregate.get_changed_dates()}
+        self.upsert_records("sales", [dict(day, total_price=round(day["total_price"], 2)) for day in days.values() if day])
+        for purchase_date, day in days.items():
+            if day is None:
+                self.delete_record("sales", purchase_date)  # No paid orders left that day
+        aggregate.mark_clean()
+
+    def __replace_sales(self, aggregate):
+        days = aggregate.get_days()
+        self.__stored_keys["sales"] = {day["purchase_date"] for day in days}
+        aggregate.mark_clean()
+        self.write(lambda: self.__save_entity("sales", days), key="sales")
+
+    def rebuild_sales(self, orders):
+        """Recompute the daily sales aggregate from the raw orders and store it."""
+        aggregate = SalesAggregate.rebuild(orders)
+        if self.log_mode:
+            # Pending order records are already part of the rebuilt totals, so the snapshot must not count them again
+            self.append_record({"op": "sales_rebuilt", "days": aggregate.get_days()})
+            aggregate.mark_clean()
+        else:
+            self.__replace_sales(aggregate)  # Days with no orders left must go too
+        return aggregate
+
+    # Append-Only Log
+    def append_record(self, record):
+        """Queue one mutation record for the log and return the number of records pending compaction."""
+        return self.append_records([record])
+
+    def append_records(self, records):
+        """Queue several mutation records, written together; returns the number of records pending compaction."""
+        with self.__lock:
+            self.__log_buffer.extend(records)
+        if self.worker is None:
+            self.__write_log_buffer()
+        else:
+            # Records queued within one window go out in a single write and fsync
+            self.worker.submit(self.__write_log_buffer, key="log")
+        self.__pending_records += len(records)
+        return self.__pending_records
+
+    def __write_log_buffer(self):
+        with self.process_lock:
+            with self.__lock:
+                records, self.__log_buffer = self.__log_buffer, []
+            if not records:
+                return
+            # Catch up with what other processes appended, so the sequence numbers continue theirs
+            self.__read_log_tail()
+            seq = max(self.__applied_seq, self.load_checkpoint())
+            frames = []
+            for record in records:
+                seq += 1
+                record["seq"] = seq
+                frames.append(encode_frame(record))
+            append_frames(frames, self.filepaths["log"])
+            stat = os.stat(self.filepaths["log"])
+            self.__log_position = (stat.st_ino, stat.st_size)
+            self.__applied_seq = seq
+
+    def __read_log_tail(self):
+        """
+        Take in the log records appended since this instance last read the log, keeping the ones other processes
+        wrote for refresh(). Call with the process lock held. After another process compacted, the rest of the
+        old log is read from its retained copy; if that is gone too, refresh() falls back to a full reload.
+        """
+        inode, offset = self.__log_position
+        try:
+            stat = os.stat(self.filepaths["log"])
+        except FileNotFoundError:
+            return
+        if stat.st_ino != inode:
+            previous = self.filepaths["log"] + ".1"
+            if inode is not None and os.path.exists(previous) and os.stat(previous).st_ino == inode:
+                self.__take_log_records(read_frames(previous, offset, repair=False))
+            if self.load_checkpoint() > self.__applied_seq:
+                # Folded into the snapshot before this instance read them
+                with self.__lock:
+                    self.__missed = True
+                    self.__applied_seq = self.load_checkpoint()
+            offset = 0
+        records = []
+        if stat.st_size > offset:
+            for record, offset in iter_frames(self.filepaths["log"], offset):
+                records.append(record)
+        self.__log_position = (stat.st_ino, offset)
+        self.__take_log_records(records)
+
+    def __take_log_records(self, records):
+        with self.__lock:
+            for record in records:
+                if record["seq"] > self.__applied_seq:
+                    self.__foreign.append(record)
+                    self.__applied_seq = record["seq"]
+
+    def __log_moved(self):
+        try:
+            stat = os.stat(self.filepaths["log"])
+        except FileNotFoundError:
+            return False
+        return (stat.st_ino, stat.st_size) != self.__log_position
+
+    def read_log(self):
+        """Return the log records that have not been folded into the snapshot yet."""
+        pinned = self.__pinned_logs.get(threading.get_ident())
+        if pinned is not None:
+            return pinned  # load_all and compact fold every entity over the same records
+        with self.process_lock:  # Reading repairs a torn tail, which must not cut off a frame being appended
+            checkpoint = self.load_checkpoint()
+            records = [record for record in read_frames(self.filepaths["log"]) if record["seq"] > checkpoint]
+        self.__pending_records = len(records)
+        return records
+
+    def load_checkpoint(self):
+        if not os.path.exists(self.filepaths["checkpoint"]):
+            return 0
+        return load_from_file(self.filepaths["checkpoint"])
+
+    def pending_changes(self, entity):
+        """
+        Summarize the pending log records for one entity as (changed, appended): changed maps a record key (the
+        order_id for orders) to its latest raw record (None once deleted, a {"discount": ...} patch for tickets)
+        and appended maps the order_id of each new order record to its latest version, in log order.
+        """
+        changed, appended = {}, {}
+        for record in self.read_log():
+            op = record["op"]
+            if entity == "customers" and op in ("account_created", "account_saved"):
+                changed[record["customer"]["username"]] = record["customer"]
+            elif entity == "customers" and op == "account_deleted":
+                changed[record["username"]] = None
+            elif entity == "orders" and op == "order_placed":
+                appended[record["order"]["order_id"]] = dict(record["order"], username=record["username"])
+            elif entity == "orders" and op in ("order_cancelled", "order_deleted"):
+                order_id = record["order"]["order_id"]
+                latest = record["order"] if op == "order_cancelled" else None
+                if order_id in appended:  # Placed since the snapshot, so there is no stored record to patch
+                    if latest is None:
+                        del appended[order_id]
+                    else:
+                        appended[order_id] = latest
+                else:
+                    changed[order_id] = latest
+            elif entity == "orders" and op in ("orders_renamed", "orders_saved"):
+                for order in record.get("added", []):
+                    appended[order["order_id"]] = order
+                for order in record.get("orders", record.get("changed", [])):
+                    if order["order_id"] in appended:
+                        appended[order["order_id"]] = order
+                    else:
+                        changed[order["order_id"]] = order
+                for order_id in record.get("removed", []):
+                    if order_id in appended:
+                        del appended[order_id]
+                    else:
+                        changed[order_id] = None
+            elif entity == "tickets" and op == "discount_changed":
+                changed[record["ticket_type"]] = {"discount": record["discount"]}
+        return changed, appended
+
+    def compact(self, data=None):
+        """
+        Fold the log into a fresh snapshot so startup replay stays bounded. The snapshot is folded from the files
+        under the process lock, so records other processes appended are kept; data is no longer needed.
+        """
+        self.write(self.__compact)
+        self.__pending_records = 0
+
+    def __compact(self, accounts=(), orders=()):
+        # Folds a batch of new account and order records into the snapshot too, after the log they follow
+        self.__write_log_buffer()
+        with self.process_lock:
+            self.__read_log_tail()
+            checkpoint = max(self.__applied_seq, self.load_checkpoint())
+            records = self.read_log()
+            self.__pinned_logs[threading.get_ident()] = records  # Read once, not once per entity
+            try:
+                # Only the accounts the log changed are written, so a sharded store rewrites just their shards
+                customer_changes = self.pending_changes("customers")[0]
+                customer_changes.update((account["username"], account) for account in accounts)
+                snapshot = {entity: list(self.__fold_records(entity)) for entity in ("admins", "tickets", "orders")}
+                snapshot["orders"] += orders
+                sales = self.__fold_sales()
+                for order in orders:
+                    sales.record_raw_order(order)
+                snapshot["sales"] = sales.get_days()
+            finally:
+                self.__pinned_logs.pop(threading.get_ident(), None)
+            if customer_changes:
+                self.backend.apply_changes("customers", customer_changes)
+            for entity, entity_records in snapshot.items():
+                self.backend.save(entity, entity_records)
+            # The checkpoint is replaced atomically, so a crash before the log is trimmed only leaves records that replay skips
+            save_to_file(checkpoint, self.filepaths["checkpoint"])
+            self.trim_log(checkpoint, records)
+            stat = os.stat(self.filepaths["log"])
+            self.__log_position = (stat.st_ino, stat.st_size)
+        print(f"Compacted log into snapshot at sequence {checkpoint}.")
+
+    def trim_log(self, checkpoint, records=None):
+        """
+        Drop the folded records from the log, keeping any appended after the checkpoint (records, when given,
+        are the log's pending records as the caller already read them). The old log stays behind as data.log.1
+        until the next compaction, for processes that have not read its tail yet.
+        """
+        if records is None:
+            records = read_frames(self.filepaths["log"])
+        frames = [encode_frame(record) for record in records if record["seq"] > checkpoint]
+        log_tmp = self.filepaths["log"] + ".tmp"
+        with open(log_tmp, "wb") as file:
+            file.write(b"".join(frames))
+            file.flush()
+            os.fsync(file.fileno())
+        previous = self.filepaths["log"] + ".1"
+        if os.path.exists(self.filepaths["log"]):
+            if os.path.exists(previous):
+                os.remove(previous)
+            os.link(self.filepaths["log"], previous)
+        os.replace(log_tmp, self.filepaths["log"])
+
+    def maybe_compact(self, data):
+        if self.__pending_records >= self.compact_threshold:
+            self.compact(data)
+
+    # Mutation Methods (append to the log in log mode, otherwise write the single record under the process lock)
+    def record_order(self, data, customer, order):
+        if "sales" in data:
+            data["sales"].record_order(order)  # O(tickets in order); the log replays it from order_placed
+            data["sales"].mark_clean([order.get_purchase_date()])  # Stored below, by record_sales_change or the log
+        order.mark_clean()
+        self.track_stored("orders", added=[order.get_order_id()])
+        if self.log_mode:
+            self.append_record({"op": "order_placed", "username": customer.get_username(), "order": self.order_to_raw(order)})
+            self.maybe_compact(data)
+            return
+        # Stored once, so the customer file is left alone; on pickle files this rereads the stored orders
+        raw = self.order_to_raw(order)
+        self.write(lambda: self.change("orders", raw["order_id"], lambda: self.backend.add_order(raw)))
+        if "sales" in data:
+            self.record_sales_change(order)
+
+    def delete_order(self, data, order_id):
+        """Delete one order everywhere it is referenced, without scanning the other orders (except to rewrite a pickle file)."""
+        order = data["orders"].remove(order_id)
+        if order is None:
+            return None
+        for admin in data.get("admins", []):
+            if admin.get_order(order_id) is order:
+                admin.delete_order(order)
+        self.__record_order_change(data, order, "order_deleted", self.__counted_in_sales(order))
+        return order
+
+    def cancel_order(self, data, order_id):
+        """Mark one order as cancelled, taking it out of the sales totals if it had been paid."""
+        order = data["orders"].get(order_id)
+        if order is None or order.get_status() == Status.Cancelled:
+            return order
+        was_paid = self.__counted_in_sales(order)
+        if was_paid and "sales" in data:
+            data["sales"].remove_order(order)  # Before the status changes, while it still counts as paid
+            data["sales"].mark_clean([order.get_purchase_date()])  # Stored by __record_order_change
+        data["orders"].cancel(order_id)
+        self.__record_order_change(data, order, "order_cancelled", was_paid)
+        return order
+
+    def __counted_in_sales(self, order):
+        return order.get_status() == Status.Paid and order.get_customer() is not None  # As in SalesAggregate.rebuild
+
+    def __record_order_change(self, data, order, op, was_paid):
+        if op == "order_deleted" and was_paid and "sales" in data:
+            data["sales"].remove_order(order)
+            data["sales"].mark_clean([order.get_purchase_date()])
+        raw = self.order_to_raw(order)
+        order.mark_clean()
+        if op == "order_deleted":
+            self.track_stored("orders", removed=[raw["order_id"]])
+        if self.log_mode:
+            # was_paid lets load_sales take the order back out of the pending totals
+            self.append_record({"op": op, "order": raw, "was_paid": was_paid})
+            self.maybe_compact(data)
+            return
+        if op == "order_deleted":
+            self.__deleted.setdefault("orders", set()).add(raw["order_id"])
+            self.write(lambda: self.change("orders", raw["order_id"], lambda: self.backend.remove_order(raw["order_id"])))
+        else:
+            self.write(lambda: self.change("orders", raw["order_id"], lambda: self.backend.replace_order(raw)))
+        if was_paid and "sales" in data:
+            self.record_sales_change(order, removed=True)
+
+    def record_sales_change(self, order, removed=False):
+        """
+        Add a paid order to its stored sales day, or take it back out. The day is read and rewritten under the
+        process lock, so entrances selling on the same day add up instead of overwriting each other's totals.
+        """
+        raw = dict(self.order_to_raw(order), status=Status.Paid.name)  # As it counted, whatever its status is now
+        purchase_date = raw["purchase_date"]
+        def write():
+            stored = self.backend.get("sales", purchase_date)
+            day = SalesAggregate([stored] if stored else [])
+            day.record_order(self.order_from_raw(raw), sign=-1 if removed else 1)
+            if day.get_day(purchase_date) is None:
+                self.backend.delete("sales", purchase_date)
+            else:
+                self.backend.upsert("sales", day.get_day(purchase_date))
+        self.write(lambda: self.change("sales", purchase_date, write))
+
+    def record_import(self, data, customers, orders):
+        """
+        Store a batch of new accounts and orders (already added to data, except for the sales totals) in one
+        persistence pass. In log mode the batch is folded into the snapshot along with the log, as a compaction
+        would, instead of being logged and compacted again; otherwise each entity it touches is written once.
+        """
+        if "sales" in data:
+            for order in orders:
+                data["sales"].record_order(order)
+            data["sales"].mark_clean([order.get_purchase_date() for order in orders])
+        accounts = [self.customer_to_raw(customer) for customer in customers]
+        raws = [self.order_to_raw(order) for order in orders]
+        for entity in list(customers) + list(orders):
+            entity.mark_clean()
+        self.track_stored("customers", added=[account["username"] for account in accounts])
+        self.track_stored("orders", added=[raw["order_id"] for raw in raws])
+        if self.log_mode:
+            # Stamped so that other processes reload what the snapshot gained outside the log
+            self.write(lambda: self.change("customers", [account["username"] for account in accounts], lambda: self.change(
+                "orders", None, lambda: self.change("sales", None, lambda: self.__compact(accounts, raws)))))
+            self.__pending_records = 0
+            return
+        batch = SalesAggregate()
+        for order in orders:
+            batch.record_order(order)
+        days = batch.get_daily_sales()
+        def write_sales():
+            # Read-modify-write of the touched days, as record_sales_change does for one order
+            stored = SalesAggregate([day for day in self.backend.load("sales") if day["purchase_date"] in days])
+            for purchase_date, totals in days.items():
+                stored.add_day(purchase_date, totals)
+            self.backend.apply_changes("sales", {purchase_date: stored.get_day(purchase_date) for purchase_date in days})
+        def write():
+            # Whole-entity stamps for orders and sales: other processes reload them rather than track every key
+            self.change("orders", None, lambda: self.backend.add_orders(raws))
+            if days and "sales" in data:
+                self.change("sales", None, write_sales)
+        if accounts:
+            self.upsert_records("customers", accounts)
+        self.write(write)
+
+    def record_account(self, data, customer):
+        if self.log_mode:
+            self.append_record({"op": "account_created", "customer": self.customer_to_raw(customer)})
+            self.maybe_compact(data)
+        else:
+            self.upsert_record("customers", self.customer_to_raw(customer))
+        customer.mark_clean()
+
+    def record_discounts(self, data, tickets):
+        if self.log_mode:
+            for ticket in tickets:
+                self.append_record({"op": "discount_changed", "ticket_type": ticket.get_ticket_type(), "discount": ticket.get_discount()})
+            self.maybe_compact(data)
+        else:
+            for ticket in tickets:
+                self.upsert_record("tickets", self.ticket_to_raw(ticket))
+        for ticket in tickets:
+            ticket.mark_clean()
+
+    def save_customer(self, customer):
+        """Persist a single account."""
+        if self.log_mode:
+            self.append_record({"op": "account_saved", "customer": self.customer_to_raw(customer)})
+        else:
+            self.upsert_record("customers", self.customer_to_raw(customer))
+        customer.mark_clean()
+
+    def save_customer_batch(self, customers):
+        """Persist several accounts; on a sharded store each shard they fall in is rewritten once."""
+        if self.log_mode:
+            for customer in customers:
+                self.append_record({"op": "account_saved", "customer": self.customer_to_raw(customer)})
+        else:
+            self.upsert_records("customers", [self.customer_to_raw(customer) for customer in customers])
+        for customer in customers:
+            customer.mark_clean()
+
+    def reshard_customers(self, shards):
+        """
+        Split the stored customers into this many hash shards (1 merges them back into one file) and return the
+        number of accounts moved. Other processes re-read the customers, in the new layout, on their next refresh.
+        """
+        self.flush()
+        moved = []
+        self.change("customers", None, lambda: moved.append(self.backend.reshard(shards)))
+        return moved[0]
+
+    def rename_customer(self, customer, old_username, orders=()):
+        """
+        Store an account under its new username, drop the record under the old one and save the new owner onto its
+        orders (the hot ones given, and the archived ones), so the purchase history follows the account to disk.
+        """
+        username = customer.get_username()
+        if username == old_username:
+            self.save_customer(customer)
+            return
+        raws = [self.order_to_raw(order) for order in orders]
+        for order in orders:
+            order.mark_clean()
+        if self.archive.covering(old_username):
+            # Rewritten now rather than on the worker, so this process's history queries see the new name at once
+            with self.process_lock:
+                self.archive.rename_customer(old_username, username)
+        if self.log_mode:
+            self.append_records([{"op": "account_saved", "customer": self.customer_to_raw(customer)},
+                                 {"op": "account_deleted", "username": old_username},
+                                 {"op": "orders_renamed", "old_username": old_username, "username": username, "orders": raws}])
+            customer.mark_clean()
+            return
+        self.save_customer(customer)
+        self.delete_customer(old_username)
+        if raws:
+            self.write(lambda: self.change("orders", [raw["order_id"] for raw in raws], lambda: self.__replace_orders(raws)))
+
+    def __replace_orders(self, raws):
+        # A whole-file backend is rewritten once, however many of its orders change
+        if self.backend.incremental:
+            for raw in raws:
+                self.backend.replace_order(raw)
+        elif raws:
+            changed = {raw["order_id"]: raw for raw in raws}
+            self.backend.save("orders", [changed.get(raw["order_id"], raw) for raw in self.backend.iter_records("orders")])
+
+    def delete_customer(self, username):
+        if self.log_mode:
+            self.append_record({"op": "account_deleted", "username": username})
+        else:
+            self.delete_record("customers", username)
+
+    # Changes From Other Processes
+    def refresh(self, data):
+        """
+        Bring data up to date with what other app processes wrote since this instance last looked: their log
+        records are applied and the entity records they wrote are re-read. Returns the names of the entities
+        that changed (every entity when this instance fell too far behind and reloaded everything).
+        """
+        if self.log_mode and self.__log_moved():
+            with self.process_lock:
+                self.__read_log_tail()
+        versions = self.read_versions()
+        changes = self.changes_since_seen(versions)
+        with self.__lock:
+            foreign, self.__foreign = self.__foreign, []
+            missed, self.__missed = self.__missed, False
+        if missed or changes is None:
+            print("Reloading the data other processes changed.")
+            if hasattr(data.get("customers"), "flush"):
+                data["customers"].flush()  # Unsaved account changes are written before the cache is replaced
+            data.update(self.load_all(**self.__load_options))
+            return set(ENTITY_KEYS)
+        changed = set()
+        for record in foreign:
+            changed |= self.apply_record(data, record)
+        if changes:
+            self.flush()  # Queued writes of our own land first, so re-read records include them
+            reloads = {}  # entity -> keys to re-read, or None for the whole entity
+            for _, _, entity, key in changes:
+                if key is None or entity in ("admins", "tickets", "sales") or (entity in reloads and reloads[entity] is None):
+                    reloads[entity] = None
+                else:
+                    reloads.setdefault(entity, set()).add(key)
+            for entity, keys in reloads.items():
+                self.__reload(data, entity, keys)
+            changed |= set(reloads)
+        self.__seen_stamp = versions["stamp"]
+        return changed
+
+    def apply_record(self, data, record):
+        """Apply one log record another process appended to the loaded data; returns the entities it changed."""
+        op = record["op"]
+        orders = data["orders"]
+        if op == "order_placed":
+            if orders.get(record["order"]["order_id"]) is None:  # Already there when the load read it from the log
+                order = self.order_from_raw(dict(record["order"], username=record["username"]))
+                orders.add(order)
+                self.track_stored("orders", added=[order.get_order_id()])
+                if "sales" in data:
+                    data["sales"].record_order(order)
+                    data["sales"].mark_clean([order.get_purchase_date()])  # Stored by the process that placed it
+            return {"orders"}
+        if op in ("order_cancelled", "order_deleted"):
+            order_id = record["order"]["order_id"]
+            order = orders.get(order_id)
+            if order is None or (op == "order_cancelled" and order.get_status() == Status.Cancelled):
+                return set()
+            if record["was_paid"] and order.get_status() == Status.Paid and "sales" in data:
+                data["sales"].remove_order(order)
+                data["sales"].mark_clean([order.get_purchase_date()])
+            if op == "order_cancelled":
+                orders.cancel(order_id).mark_clean()  # Already stored by the process that cancelled it
+            else:
+                self.__forget_order(data, order_id)
+            return {"orders"}
+        if op == "orders_renamed":
+            orders.rename_customer(record["old_username"], record["username"])
+            for order in orders.history_for(record["username"], archived=False):
+                order.mark_clean()  # Stored by the process that renamed the account
+            return {"orders"}
+        if op == "orders_saved":
+            for raw in record["added"] + record["changed"]:
+                self.__sync_order(data, raw["order_id"], raw)
+            for order_id in record["removed"]:
+                self.__sync_order(data, order_id, None)
+            return {"orders"}
+        if op in ("account_created", "account_saved"):
+            self.__sync_customer(data, record["customer"]["username"], record["customer"])
+            return {"customers"}
+        if op == "account_deleted":
+            self.__sync_customer(data, record["username"], None)
+            return {"customers"}
+        if op == "discount_changed":
+            for ticket in data["tickets"]:
+                if ticket.get_ticket_type() == record["ticket_type"]:
+                    ticket.set_discount(record["discount"])
+                    ticket.mark_clean()
+            return {"tickets"}
+        return set()  # sales_rebuilt: the totals kept here already cover the same orders
+
+    def __forget_order(self, data, order_id):
+        # Another process deleted or archived the order and stored the change, so nothing here is left dirty by it
+        order = data["orders"].remove(order_id)
+        self.track_stored("orders", removed=[order_id])
+        if self.archive.holds(order_id):
+            return  # Only moved out of the hot store; admins keep referring to it
+        for admin in data.get("admins", []):
+            if admin.get_order(order_id) is order:
+                admin.delete_order(order)
+                admin.mark_clean()
+
+    def __sync_order(self, data, order_id, raw):
+        # Bring one loaded order in line with its stored record (None once deleted)
+        order = data["orders"].get(order_id)
+        if raw is None:
+            if order is not None:
+                self.__forget_order(data, order_id)
+        elif order is None:
+            data["orders"].add(self.order_from_raw(raw))
+            self.track_stored("orders", added=[order_id])
+        else:
+            if order.get_customer() != raw["username"]:
+                data["orders"].rename_customer(order.get_customer(), raw["username"])  # The account was renamed
+            if order.get_status().name != raw["status"]:
+                order.set_status(Status[raw["status"]])
+            order.mark_clean()
+
+    def __sync_customer(self, data, username, raw):
+        shards = self.__load_options.get("shards")
+        if shards is not None and self.backend.shard_of(username) not in shards:
+            return  # This instance only loaded the other shards
+        customers = data["customers"]
+        if hasattr(customers, "refresh_account"):
+            customers.refresh_account(username, raw)
+            return
+        position = next((index for index, customer in enumerate(customers) if customer.get_username() == username), None)
+        if raw is None:
+            if position is not None:
+                del customers[position]
+        elif position is None:
+            customers.append(self.customer_from_raw(raw, data["orders"]))
+        else:
+            customers[position] = self.customer_from_raw(raw, data["orders"])
+
+    def __reload(self, data, entity, keys):
+        """Re-read the given records of an entity (all of them when keys is None) into the loaded data."""
+        if entity == "orders":
+            if keys is None:
+                stored = {raw["order_id"]: raw for raw in self.iter_records("orders")}
+                for order in data["orders"]:
+                    if order.get_order_id() not in stored:
+                        self.__forget_order(data, order.get_order_id())
+            elif self.backend.incremental:
+                stored = {order_id: self.backend.get_order(order_id) for order_id in keys}
+            else:
+                # One pass over the file, however many of its orders changed
+                stored = dict.fromkeys(keys)
+                stored.update((raw["order_id"], raw) for raw in self.iter_records("orders") if raw["order_id"] in stored)
+            for order_id, raw in stored.items():
+                self.__sync_order(data, order_id, raw)
+        elif entity == "customers":
+            if hasattr(data["customers"], "reload"):
+                data["customers"].reload(keys)
+            elif keys is None:
+                data["customers"][:] = self.load_customers(data["orders"], self.__load_options.get("shards"))
+            else:
+                for username in keys:
+                    self.__sync_customer(data, username, self.get_record("customers", username))
+        elif entity == "admins":
+            data["admins"][:] = self.load_admins(data["orders"])
+        elif entity == "tickets":
+            data["tickets"][:] = self.load_tickets()
+        elif entity == "sales":
+            data["sales"] = self.load_sales()
+
+    # Order Archive
+    def archive_orders(self, data, before=None):
+        """
+        Move the orders placed before the given day (by default archive_after days ago) out of the hot order store
+        and memory into compressed archive segments. Histories and reports still see them through the store's
+        archive, and the sales totals, which already count them, are left alone. Returns the number of orders moved.
+        """
+        if before is None:
+            if self.archive_after is None:
+                return 0
+            before = date.today() - timedelta(days=self.archive_after)
+        self.flush()
+        with self.process_lock:
+            if self.log_mode:
+                self.__compact()  # Orders still in the log are folded first, so the snapshot alone holds them
+                self.__pending_records = 0
+            moved = [raw for raw in self.backend.iter_records("orders") if raw["purchase_date"] < before]
+            order_ids = {raw["order_id"] for raw in moved}
+            def write():
+                self.archive.add_segments(moved)
+                if self.backend.incremental:
+                    for order_id in order_ids:
+                        self.backend.remove_order(order_id)
+                else:
+                    self.backend.save("orders", [raw for raw in self.backend.iter_records("orders") if raw["order_id"] not in order_ids])
+            if moved:
+                # A whole-entity stamp: other processes re-read their orders and drop the archived ones
+                self.change("orders", None, write)
+        for order_id in order_ids:
+            data["orders"].remove(order_id)  # Admins keep their references to archived orders
+        self.track_stored("orders", removed=order_ids)
+        return len(moved)
+
+    # Lookups (index probes on the SQLite backend)
+    def find_customer(self, username):
+        self.flush()
+        if self.log_mode:  # The snapshot alone may be missing logged accounts
+            raw = next((record for record in self.iter_records("customers") if record["username"] == username), None)
+        else:
+            raw = self.get_record("customers", username)
+        return self.customer_from_raw(raw, OrderStore(self.find_orders(username=username, archived=False), archive=self.archive)) if raw else None
+
+    def find_orders(self, username=None, purchase_date=None, archived=True):
+        """The stored orders of a customer and/or day, with the archived ones first unless archived is False."""
+        self.flush()
+        if self.log_mode:
+            hot = list(self.iter_orders(username=username, purchase_date=purchase_date))
+        else:
+            hot = [self.order_from_raw(raw) for raw in self.backend.find_orders(username=username, purchase_date=purchase_date)]
+        if not archived:
+            return hot
+        return self.archive.find_orders(username=username, start=purchase_date, end=purchase_date) + hot
+
+    def first_free_order_id(self):
+        """One past the highest stored or archived order ID; only needed when the first block is leased."""
+        stored = max((record.get("order_id") or 0 for record in self.iter_records("orders")), default=0)
+        return max(stored, self.archive.last_order_id()) + 1
+
+    # One-Time Migration
+    def needs_order_migration(self):
+        """True while the entity files still hold the duplicated layout (orders embedded in customers and admins)."""
+        customers, orders = self.backend.load("customers"), self.backend.load("orders")
+        return (any("purchase_history" in customer for customer in customers)
+                or any("order_id" not in order for order in orders)
+                or any("orders" in admin for admin in self.backend.load("admins")))
+
+    def migrate_duplicated_orders(self):
+        """
+        Rewrite the duplicated layout so every order is stored once in the orders file with a customer reference.
+        The customer copies are authoritative because they know their owner; copies in the orders file and in
+        admin records that match one of them (same date, status, total and tickets) are folded into it.
+        """
+        def fingerprint(order):
+            return (order["purchase_date"], order["status"], order["total_price"],
+                    tuple((ticket["ticket_type"], ticket["price"], ticket.get("quantity", 1)) for ticket in order["tickets"]))
+
+        next_id = max([order.get("order_id") or 0 for order in self.backend.load("orders")] + [0]) + 1
+        orders, unmatched = [], {}  # unmatched: fingerprint -> ids of customer copies not yet claimed by the orders file
+        customers = self.backend.load("customers")
+        for customer in customers:
+            for order in customer.pop("purchase_history", []):
+                orders.append(dict(order, order_id=next_id, username=customer["username"]))
+                unmatched.setdefault(fingerprint(order), []).append(next_id)
+                next_id += 1
+        by_fingerprint = {key: list(ids) for key, ids in unmatched.items()}
+        for order in self.backend.load("orders"):
+            if "order_id" in order:
+                orders.append(order)
+            elif unmatched.get(fingerprint(order)):
+                unmatched[fingerprint(order)].pop(0)  # Same order as a customer copy
+            else:
+                orders.append(dict(order, order_id=next_id, username=None))
+                next_id += 1
+        admins = self.backend.load("admins")
+        for admin in admins:
+            order_ids = admin.get("order_ids", [])
+            for order in admin.pop("orders", []):
+                if by_fingerprint.get(fingerprint(order)):
+                    order_ids.append(by_fingerprint[fingerprint(order)][0])
+                else:
+                    orders.append(dict(order, order_id=next_id, username=None))
+                    order_ids.append(next_id)
+                    next_id += 1
+            admin["order_ids"] = order_ids
+        # Orders first, so a crash part-way leaves the customer copies in place for a re-run
+        self.backend.save("orders", orders)
+        self.backend.save("admins", admins)
+        self.backend.save("customers", customers)
+        print(f"Migrated {len(orders)} orders to the single-copy layout.")
 
     # Comprehensive Save-All and Load-All
+    def snapshot(self, data):
+        """Raw records of every entity, as save_all would write them."""
+        snapshot = {
+            "customers": [self.customer_to_raw(customer) for customer in data.get("customers", [])],
+            "admins": [self.admin_to_raw(admin) for admin in data.get("admins", [])],
+            "tickets": [self.ticket_to_raw(ticket) for ticket in data.get("tickets", [])],
+            "orders": [self.order_to_raw(order) for order in data.get("orders", [])],
+        }
+        if "sales" in data:
+            snapshot["sales"] = data["sales"].get_days()
+        return snapshot
+
     def save_all(self, data):
         self.save_customers(data.get("customers", []))
         self.save_admins(data.get("admins", []))
         self.save_tickets(data.get("tickets", []))
         self.save_orders(data.get("orders", []))
+        if "sales" in data:
+            self.save_sales(data["sales"])
 
     def initialize_files(self):
-        """Initialize the tickets file with the complete dataset."""
-        complete_tickets = [
-            {
-                "ticket_type": "Single-Day Pass",
-                "description": "Access to the park for one day",
-                "price": 275.0,
-                "validity": "1 Day",
-                "limitations": "Valid only on selected date",
-                "discount": 0,
-            },
-            {
-                "ticket_type": "Two-Day Pass",
-                "description": "Access to the park for two consecutive days",
-                "price": 480.0,
-                "validity": "2 Days",
-                "limitations": "Cannot be split over multiple trips",
-                "discount": 10,
-            },
-            {
-                "ticket_type": "Annual Membership",
-                "description": "Unlimited access for one year",
-                "price": 1840.0,
-                "validity": "1 Year",
-                "limitations": "Must be used by the same person",
-                "discount": 15,
-            },
-            {
-                "ticket_type": "Child Ticket",
-                "description": "Discounted ticket for children (ages 3-12)",
-                "price": 185.0,
-                "validity": "1 Day",
-                "limitations": "Valid only on selected date, must be accompanied by an adult",
-                "discount": 0,
-            },
-            {
-                "ticket_type": "Group Ticket (10+)",
-                "description": "Special rate for groups of 10 or more",
-                "price": 220.0,
-                "validity": "1 Day",
-                "limitations": "Must be booked in advance",
-                "discount": 20,
-            },
-            {
-                "ticket_type": "VIP Experience Pass",
-                "description": "Includes expedited access and reserved seating for shows",
-                "price": 550.0,
-                "validity": "1 Day",
-                "limitations": "Limited availability, must be purchased in advance",
-                "discount": 0,
-            },
-        ]
-
-        tickets_filepath = self.filepaths["tickets"]
+        """Reset the tickets to the complete dataset."""
+        return self.seed_catalog([], force=True)
 
-        # Remove existing tickets file if it exists
-        if os.path.exists(tickets_filepath):
-            os.remove(tickets_filepath)
-
-        print("Initializing tickets file with the complete dataset.")
-        complete_ticket_objects = [
-            Ticket(
+    def seed_catalog(self, tickets, force=False):
+        """
+        Write the seed catalog only when the stored one is missing or was seeded from different data; the
+        discounts admins saved are kept for ticket types that are still offered. Returns the resulting tickets.
+        """
+        seed_hash = hashlib.sha256(repr(ticket_data).encode()).hexdigest()
+        if tickets and not force and self.load_seed_hash() == seed_hash:
+            return tickets
+        print("Initializing tickets with the complete dataset.")
+        discounts = {ticket.get_ticket_type(): ticket.get_discount() for ticket in tickets}
+        seeded = [
+            CatalogTicket(
                 ticket_type=ticket["ticket_type"],
                 description=ticket["description"],
                 price=ticket["price"],
                 validity=ticket["validity"],
                 limitations=ticket["limitations"],
-                discount=ticket["discount"],
+                discount=discounts.get(ticket["ticket_type"], ticket["discount"]),
             )
-            for ticket in complete_tickets
+            for ticket in ticket_data
         ]
-        self.save_tickets(complete_ticket_objects)
-        print(f"Complete tickets saved to {tickets_filepath}.")
+        seeded_types = {ticket.get_ticket_type() for ticket in seeded}
+        seeded += [ticket for ticket in tickets if ticket.get_ticket_type() not in seeded_types]
+        self.save_tickets(seeded)
+        self.write(lambda: save_to_file(seed_hash, self.filepaths["catalog_seed"]), key="catalog_seed")
+        print(f"Complete tickets saved to the {type(self.backend).__name__}.")
+        return seeded
+
+    def load_seed_hash(self):
+        if not os.path.exists(self.filepaths["catalog_seed"]):
+            return None
+        return load_from_file(self.filepaths["catalog_seed"])
 
-    def load_all(self):return {"customers": self.load_customers(), "admins": self.load_admins(), "tickets": self.load_tickets(), "orders": self.load_orders(),}
+    def load_all(self, lazy_customers=False, cache_size=256, cache_bytes=None, progress=None, shards=None):
+        """
+        Load every entity; the orders come back as the OrderStore that customer histories and admin orders
+        are views over, and with lazy_customers the accounts come back as a CustomerCache instead of a list.
+        Customers are read one shard at a time, and only from the given shard indexes when shards is given.
+        progress, if given, is called as progress(fraction, message) after each step.
+        """
+        def report(fraction, message):
+            if progress is not None:
+                progress(fraction, message)
+        def report_shard(done, total):
+            if total > 1:
+                report(0.4 + 0.3 * done / total, f"Loading customers (shard {done} of {total})")
+        if shards is not None:
+            shards = sorted(set(shards))
+        self.__load_options = {"lazy_customers": lazy_customers, "cache_size": cache_size, "cache_bytes": cache_bytes, "shards": shards}
+        if self.needs_order_migration():
+            with self.process_lock:
+                if self.needs_order_migration():  # Unless another process migrated first
+                    self.migrate_duplicated_orders()
+                    for entity in ("orders", "admins", "customers"):
+                        self.change(entity, None, lambda: None)  # Other processes reload the rewritten files
+        Order.id_allocator = self.order_ids  # New orders draw durable IDs from this data layer's lease
+        while True:
+            self.flush()  # Our own queued records are never read back as another process's
+            with self.process_lock:
+                # The load covers the log up to here; refresh() applies what other processes append later
+                self.__read_log_tail()
+                with self.__lock:
+                    self.__foreign, self.__missed = [], False
+                self.__seen_stamp = self.read_versions()["stamp"]
+                checkpoint = self.load_checkpoint()
+                if self.log_mode:
+                    self.__pinned_logs[threading.get_ident()] = self.read_log()
+            try:
+                report(0.1, "Loading orders")
+                orders = OrderStore(self.load_orders(), archive=self.archive)
+                report(0.4, "Loading customers")
+                if lazy_customers:
+                    customers = CustomerCache(self, cache_size, cache_bytes, orders, shards=shards, progress=report_shard)
+                else:
+                    customers = self.load_customers(orders, shards, report_shard)
+                report(0.7, "Loading sales")
+                sales = self.load_sales()
+                report(0.8, "Loading admins and tickets")
+                data = {"customers": customers, "admins": self.load_admins(orders), "tickets": self.load_tickets(), "orders": orders, "sales": sales,}
+            finally:
+                self.__pinned_logs.pop(threading.get_ident(), None)
+            # A compaction by another process part-way through leaves snapshot files from either side of it
+            if not self.log_mode or self.load_checkpoint() == checkpoint:
+                break
+            print("The log was compacted while loading; loading again.")
+        if not len(data["sales"]) and (len(data["orders"]) or len(self.archive)):
+            data["sales"] = self.rebuild_sales(data["orders"].including_archive())  # First start with an existing order history
+        if self.archive_after is not None:
+            self.archive_orders(data)
+        if self.log_mode:
+            self.maybe_compact(data)
+        report(1.0, "Loaded")
+        return data
@@ -0,0 +1,108 @@
+"""
+Bulk import of pre-sold orders from partner agencies and school groups.
+
+Reads CSV (with a header row) or JSON Lines, one order line per row:
+
+    order           partner reference; rows with the same reference and username form one order (optional)
+    username        the customer; accounts that do not exist yet are created
+    email           needed when the account is created
+    password        for a created account; a random one is generated (and printed) otherwise
+    ticket_type     a ticket type in the catalog
+    quantity        number of tickets (1 by default)
+    purchase_date   YYYY-MM-DD (today by default)
+    payment_method  "Partner" by default
+
+Lines are priced at the current catalog discounts and every accepted order is stored in one pass. Rejected
+rows are listed with their line numbers (and written to --rejected as CSV); an order with a rejected line
+is skipped whole. Generated passwords of created accounts can be written to --accounts.
+
+    python import_orders.py partners.csv --admin admin0
+    python import_orders.py groups.jsonl --admin admin0 --server 127.0.0.1:8765
+"""
+import argparse
+import csv
+import getpass
+import json
+import os
+import sys
+import time
+import data_layer
+from booking_engine import BookingEngine
+from kiosk_server import KioskClient
+
+
+def read_rows(path, file_format=None):
+    """Yield the rows of a CSV or JSON Lines file as dicts carrying their line number; unreadable rows carry an error."""
+    file_format = file_format or ("jsonl" if os.path.splitext(path)[1].lower() in (".jsonl", ".ndjson", ".json") else "csv")
+    with open(path, newline="", encoding="utf-8-sig") as file:
+        if file_format == "csv":
+            reader = csv.DictReader(file)
+            for row in reader:
+                yield dict(row, line=reader.line_num)
+            return
+        for line, text in enumerate(file, 1):
+            if not text.strip():
+                continue
+            try:
+                row = json.loads(text)
+            except json.JSONDecodeError as e:
+                row = {"error": f"Malformed JSON: {e.msg}."}
+            if not isinstance(row, dict):
+                row = {"error": "Each line must be a JSON object."}
+            yield dict(row, line=line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import pre-sold partner and group orders from CSV or JSON Lines.")
+    parser.add_argument("file")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="Taken from the file extension by default")
+    parser.add_argument("--admin", required=True, help="Admin ID to import as")
+    parser.add_argument("--password", help="Admin password (asked for when not given)")
+    parser.add_argument("--server", help="Import through a running kiosk server (host:port) instead of the local data files")
+    parser.add_argument("--data-dir", help="Directory holding the data files (DATA_LAYER_PATH or the current directory by default)")
+    parser.add_argument("--rejected", help="Write the rejected rows to this CSV file")
+    parser.add_argument("--accounts", help="Write the created accounts with generated passwords to this CSV file")
+    args = parser.parse_args()
+    if args.data_dir:
+        data_layer.BASE_PATH = args.data_dir  # get_filepath reads it on every call
+    rows = list(read_rows(args.file, args.format))
+    password = args.password if args.password is not None else getpass.getpass(f"Password for {args.admin}: ")
+    engine = KioskClient.from_address(args.server) if args.server else BookingEngine()
+    try:
+        engine.start()
+        start = time.perf_counter()
+        token = engine.login(args.admin, password, "admin")["token"]
+        result = engine.import_orders(token, rows)
+    except ValueError as e:
+        print(f"Import failed: {e}", file=sys.stderr)
+        return 1
+    finally:
+        engine.close()  # Waits until the imported orders are on disk
+    elapsed = time.perf_counter() - start
+    print(f"Imported {result['orders']} orders ({result['tickets']} tickets, {result['total_price']:.2f}) "
+          f"from {len(rows)} rows in {elapsed:.2f}s; {len(result['accounts'])} accounts created, {len(result['rejected'])} rows rejected.")
+    generated = [(account["username"], account["password"]) for account in result["accounts"] if account["password"]]
+    for username, generated_password in generated[:20]:
+        print(f"  New account {username}: password {generated_password}")
+    if len(generated) > 20:
+        print(f"  ... and {len(generated) - 20} more generated passwords" + ("" if args.accounts else " (see --accounts)"))
+    for line, reason in result["rejected"][:20]:
+        print(f"  Line {line}: {reason}")
+    if len(result["rejected"]) > 20:
+        print(f"  ... and {len(result['rejected']) - 20} more rejected rows")
+    if args.accounts:
+        write_csv(args.accounts, ["username", "password"], generated)
+    if args.rejected:
+        write_csv(args.rejected, ["line", "reason"], result["rejected"])
+    return 0
+
+
+def write_csv(path, header, rows):
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
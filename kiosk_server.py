@@ -0,0 +1,179 @@
+"""
+Local multi-kiosk checkout server.
+
+KioskServer serves one BookingEngine to any number of kiosk connections on localhost with asyncio.
+Each request is one JSON line {"id": n, "op": "<engine method>", "args": {...}} and gets one JSON line
+back: {"id": n, "ok": true, "result": ...} or {"id": n, "ok": false, "error": "..."}. A connection may only
+use the session tokens it logged in with, and its sessions end when it disconnects.
+
+KioskClient is the blocking client the Tk UI uses in place of a local engine:
+
+    python kiosk_server.py --port 8765
+    ADVENTURE_LAND_SERVER=127.0.0.1:8765 python UI.py
+"""
+import argparse
+import asyncio
+import json
+import signal
+import socket
+import threading
+from datetime import date
+from booking_engine import BookingEngine
+
+# Engine methods kiosks may call; the ones that take a session token as their first argument are marked True
+OPERATIONS = {
+    "login": False, "signup": False, "catalog": False, "logout": True,
+    "add_to_cart": True, "remove_from_cart": True, "clear_cart": True, "view_cart": True, "checkout": True,
+    "order_history": True, "account": True, "update_account": True, "delete_account": True,
+    "set_discounts": True, "daily_sales": True, "rebuild_sales": True, "import_orders": True, "archive_orders": True,
+}
+
+
+def encode(message):
+    # Dates go over the wire as ISO strings, which display and sort the same way
+    return (json.dumps(message, default=lambda value: value.isoformat() if isinstance(value, date) else str(value)) + "\n").encode()
+
+
+class KioskServer:
+    def __init__(self, engine, host="127.0.0.1", port=8765):
+        self.engine = engine
+        self.host = host
+        self.port = port
+        self.server = None
+        self.connections = 0
+        self.requests = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]  # The bound port when 0 asked for any free one
+        return self.server
+
+    async def serve_until_stopped(self):
+        """Serve until SIGINT or SIGTERM; open connections end (logging their sessions out) when the loop shuts down."""
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, stop.set)
+            except NotImplementedError:  # Windows event loops; Ctrl+C still interrupts asyncio.run
+                pass
+        if self.server is None:
+            await self.start()
+        await stop.wait()
+        self.server.close()
+
+    async def handle(self, reader, writer):
+        tokens = set()  # Sessions opened on this connection
+        self.connections += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                writer.write(encode(self.dispatch(line, tokens)))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections -= 1
+            for token in tokens:
+                self.engine.logout(token)
+            writer.close()
+
+    def dispatch(self, line, tokens):
+        """Run one request against the engine and build its response."""
+        self.requests += 1
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get("id")
+            op, args = request["op"], request.get("args", {})
+            if op not in OPERATIONS:
+                raise ValueError(f"Unknown operation: {op}")
+            if OPERATIONS[op] and args.get("token") not in tokens:
+                raise ValueError("Please log in first.")
+            # Engine calls are short and their writes are queued on the persistence worker, so they run on the loop
+            result = getattr(self.engine, op)(**args)
+            if op == "login":
+                tokens.add(result["token"])
+            elif op in ("logout", "delete_account"):
+                tokens.discard(args["token"])
+            return {"id": request_id, "ok": True, "result": result}
+        except (ValueError, TypeError, KeyError) as e:
+            return {"id": request_id, "ok": False, "error": str(e)}
+        except Exception as e:  # An engine bug fails the request, not every kiosk on the server
+            print(f"Request {request_id} failed: {e!r}")
+            return {"id": request_id, "ok": False, "error": "Internal error."}
+
+
+class KioskClient:
+    """Blocking connection to a KioskServer with the same methods as BookingEngine; errors come back as ValueError."""
+    def __init__(self, host="127.0.0.1", port=8765, timeout=30):
+        self.connection = socket.create_connection((host, port), timeout=timeout)
+        self.stream = self.connection.makefile("rwb")
+        self.lock = threading.Lock()  # One request in flight at a time
+        self.next_id = 0
+        self.timings = {}
+
+    @classmethod
+    def from_address(cls, address):
+        host, _, port = address.rpartition(":")
+        return cls(host or "127.0.0.1", int(port))
+
+    def call(self, op, **args):
+        with self.lock:
+            self.next_id += 1
+            self.stream.write(encode({"id": self.next_id, "op": op, "args": args}))
+            self.stream.flush()
+            line = self.stream.readline()
+        if not line:
+            raise ConnectionError("The kiosk server closed the connection.")
+        response = json.loads(line)
+        if not response["ok"]:
+            raise ValueError(response["error"])
+        return response["result"]
+
+    def __getattr__(self, op):
+        if op not in OPERATIONS:
+            raise AttributeError(op)
+        return lambda *args, **kwargs: self.call(op, **self.__named(op, args, kwargs))
+
+    def __named(self, op, args, kwargs):
+        # Positional arguments follow the engine signatures, the token first where there is one
+        names = {"login": ("username", "password", "role"), "signup": ("username", "password", "email", "role"),
+                 "add_to_cart": ("token", "ticket_type", "quantity"), "remove_from_cart": ("token", "position", "quantity"),
+                 "checkout": ("token", "payment_method", "card_number", "expire_date", "ccv"),
+                 "update_account": ("token", "username", "password", "email"), "set_discounts": ("token", "discounts"),
+                 "import_orders": ("token", "rows"), "order_history": ("token", "start", "end"),
+                 "archive_orders": ("token", "days")}
+        return dict(zip(names.get(op, ("token",)), args), **kwargs)
+
+    def start(self, progress=None):
+        """The server has already loaded the data."""
+        if progress is not None:
+            progress(1.0, "Connected")
+
+    def close(self):
+        self.stream.close()
+        self.connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the booking engine to kiosks on localhost.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    engine = BookingEngine()
+    engine.start()
+    server = KioskServer(engine, args.host, args.port)
+    print(f"Serving kiosks on {args.host}:{args.port}")
+    try:
+        asyncio.run(server.serve_until_stopped())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine.close()  # Write back and flush before exiting
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+Compressed archive segments of old orders.
+
+Orders past the hot window are moved out of the order store into segment files under one directory. Each archiving
+run splits the orders it moves into segments by a hash of the username, so one customer's orders from that run sit
+in a single segment; a segment holds their raw records in date order, encoded by record_codec and compressed with
+zlib or lzma. A small index (index.pkl) lists each segment with its date range, its sorted order IDs and, per customer, the dates of
+that customer's orders in it, so a history or report query decompresses only the segments its customer and date range
+reach into, and an order is found by ID without decompressing any other. The last few segments read stay
+decompressed in memory, and only the records a query selects are decoded.
+
+Archived orders are closed history: they are read back as copies and are not cancelled or deleted through the store.
+
+    archive = OrderArchive("orders.archive", from_raw=data_layer.order_from_raw)
+    archive.add_segments(records)
+    orders = archive.find_orders(username="alice", start=date(2024, 1, 1))
+"""
+import lzma
+import os
+import pickle
+import struct
+import zlib
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+import record_codec
+
+MAGIC = b"ALOA"
+HEADER = struct.Struct("<4sHB")  # MAGIC, format version, compression code
+VERSION = 1
+COMPRESSIONS = {"zlib": (1, lambda data: zlib.compress(data, 6), zlib.decompress),
+                "lzma": (2, lzma.compress, lzma.decompress)}
+CODECS = {code: decompress for code, _, decompress in COMPRESSIONS.values()}
+SEGMENT_ORDERS = 10000  # Orders per segment; smaller segments page in faster, larger ones compress better
+
+
+class OrderArchive:
+    def __init__(self, directory, compression="zlib", from_raw=None, cache_segments=4):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression {compression}; use one of {sorted(COMPRESSIONS)}.")
+        self.directory = directory
+        self.index_path = os.path.join(directory, "index.pkl")
+        self.compression = compression
+        self.from_raw = from_raw  # Builds an Order from a raw record for find_orders and get_order
+        self.cache_segments = cache_segments
+        self.__segments = []  # Index entries, oldest first
+        self.__index_version = None  # (inode, size, mtime) of the index last read or written
+        self.__cache = OrderedDict()  # segment name -> decompressed record_codec bytes, least recently used first
+        self.pages_in = 0  # Segments decompressed so far
+
+    # Index
+    def refresh(self):
+        """Re-read the index when another process has added segments."""
+        if not os.path.exists(self.index_path):
+            return
+        version = self.__stat_index()
+        if version == self.__index_version:
+            return
+        with open(self.index_path, 'rb') as file:
+            self.__segments = pickle.load(file)
+        self.__index_version = version
+
+    def __stat_index(self):
+        stat = os.stat(self.index_path)
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def segments(self):
+        self.refresh()
+        return list(self.__segments)
+
+    def __len__(self):
+        """Number of archived orders."""
+        return sum(segment["count"] for segment in self.segments())
+
+    def last_order_id(self):
+        return max((segment["order_ids"][-1] for segment in self.segments()), default=0)
+
+    # Writing
+    def add_segments(self, records):
+        """
+        Archive raw order records (with their order IDs and usernames) as new segments of about SEGMENT_ORDERS orders
+        each, split by username hash. The segments are on disk before the index names them, so a crash leaves at most
+        unreferenced files. Callers hold the data layer's process lock. Returns the new index entries.
+        """
+        self.refresh()
+        os.makedirs(self.directory, exist_ok=True)
+        buckets = [[] for _ in range(-(-len(records) // SEGMENT_ORDERS))]
+        for record in records:
+            # crc32 rather than hash(), which differs between processes
+            buckets[zlib.crc32((record["username"] or "").encode()) % len(buckets)].append(record)
+        number = max((segment["number"] for segment in self.__segments), default=0)
+        added = []
+        for bucket in buckets:
+            if bucket:
+                number += 1
+                added.append(self.__write_segment(number, sorted(bucket, key=lambda record: (record["purchase_date"], record["order_id"] or 0))))
+        if added:
+            self.__save_index(self.__segments + added)
+        return added
+
+    def __write_segment(self, number, records):
+        code, compress, _ = COMPRESSIONS[self.compression]
+        name = f"segment-{number:06d}.{self.compression}"
+        data = HEADER.pack(MAGIC, VERSION, code) + compress(record_codec.dumps("orders", records))
+        path = os.path.join(self.directory, name)
+        with open(path + ".tmp", 'wb') as file:
+            file.write(data)
+        os.replace(path + ".tmp", path)
+        customers = {}  # username -> (first, last) purchase date of that customer's orders in the segment
+        for record in records:
+            first, last = customers.get(record["username"], (record["purchase_date"], record["purchase_date"]))
+            customers[record["username"]] = (min(first, record["purchase_date"]), max(last, record["purchase_date"]))
+        return {"number": number, "name": name, "count": len(records), "bytes": len(data),
+                "first": records[0]["purchase_date"], "last": records[-1]["purchase_date"],
+                "order_ids": array("q", sorted(record["order_id"] or 0 for record in records)), "customers": customers}
+
+    def rename_customer(self, old_username, new_username):
+        """
+        Rewrite the segments holding a customer's orders with the new username. The rewritten segments get new names,
+        so no process serves them from a cache of the old ones. Callers hold the data layer's process lock.
+        """
+        self.refresh()
+        number = max((segment["number"] for segment in self.__segments), default=0)
+        segments, replaced = [], []
+        for segment in self.__segments:
+            if old_username in segment["customers"]:
+                number += 1
+                records = [dict(record, username=new_username) if record["username"] == old_username else record
+                           for record in self.read_segment(segment)]
+                replaced.append(segment["name"])
+                segment = self.__write_segment(number, records)
+            segments.append(segment)
+        if not replaced:
+            return
+        self.__save_index(segments)
+        for name in replaced:
+            self.__cache.pop(name, None)
+            os.remove(os.path.join(self.directory, name))
+
+    def __save_index(self, segments):
+        tmp = self.index_path + ".tmp"
+        with open(tmp, 'wb') as file:
+            pickle.dump(segments, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.index_path)
+        self.__segments = segments
+        self.__index_version = self.__stat_index()
+
+    # Reading
+    def read_segment(self, segment, match=None):
+        """
+        The raw records of one segment (only those holding the values in match, as record_codec.loads takes it). The
+        segment is decompressed on first use and kept among the recently used ones.
+        """
+        payload = self.__cache.get(segment["name"])
+        if payload is not None:
+            self.__cache.move_to_end(segment["name"])
+            return record_codec.loads(payload, match)
+        with open(os.path.join(self.directory, segment["name"]), 'rb') as file:
+            data = file.read()
+        magic, version, code = HEADER.unpack_from(data)
+        if magic != MAGIC or version > VERSION or code not in CODECS:
+            raise ValueError(f"Archive segment {segment['name']} has an unknown format.")
+        payload = CODECS[code](memoryview(data)[HEADER.size:])
+        self.pages_in += 1
+        self.__cache[segment["name"]] = payload
+        while len(self.__cache) > self.cache_segments:
+            self.__cache.popitem(last=False)
+        return record_codec.loads(payload, match)
+
+    def covering(self, username=None, start=None, end=None):
+        """Index entries of the segments holding orders of a customer and/or date range (inclusive), without reading them."""
+        selected = []
+        for segment in self.segments():
+            first, last = segment["first"], segment["last"]
+            if username is not None:
+                if username not in segment["customers"]:
+                    continue
+                first, last = segment["customers"][username]
+            if (start is None or last >= start) and (end is None or first <= end):
+                selected.append(segment)
+        return selected
+
+    def find(self, username=None, start=None, end=None):
+        """Raw records of the archived orders of a customer and/or date range (inclusive), oldest first."""
+        found = []
+        for segment in self.covering(username, start, end):
+            found += [record for record in self.read_segment(segment, {"username": username} if username is not None else None)
+                      if (start is None or record["purchase_date"] >= start) and (end is None or record["purchase_date"] <= end)]
+        found.sort(key=lambda record: (record["purchase_date"], record["order_id"] or 0))
+        return found
+
+    def iter_records(self):
+        for segment in self.segments():
+            yield from self.read_segment(segment)
+
+    def segment_of(self, order_id):
+        """Index entry of the segment holding an order, found by binary search of the IDs without reading any segment."""
+        for segment in self.segments():
+            order_ids = segment["order_ids"]
+            position = bisect_left(order_ids, order_id)
+            if position < len(order_ids) and order_ids[position] == order_id:
+                return segment
+        return None
+
+    def holds(self, order_id):
+        return self.segment_of(order_id) is not None
+
+    def get(self, order_id):
+        """Raw record of one archived order, or None."""
+        segment = self.segment_of(order_id)
+        if segment is None:
+            return None
+        return self.read_segment(segment, {"order_id": order_id})[0]
+
+    # Orders
+    def find_orders(self, username=None, start=None, end=None):
+        return [self.from_raw(record) for record in self.find(username, start, end)]
+
+    def get_order(self, order_id):
+        record = self.get(order_id)
+        return self.from_raw(record) if record is not None else None
@@ -0,0 +1,314 @@
+"""
+Memory-mapped binary order file.
+
+Each ticket line of an order (a ticket type with its quantity and unit price) is one fixed-width record, so any
+line can be found by offset and read through a memoryview over an mmap of the file without unpickling the rest.
+Strings (usernames and ticket descriptions) live once in a small dictionary file and records refer to them by code.
+Orders without tickets keep a single line with the NO_TICKET type code so they survive a round trip.
+
+The file starts with a header naming its layout and how many lines from the start are in order_id order: a full
+write sorts the orders, but orders appended after it come in checkout order, which is not id order once several
+processes lease their own blocks of ids. get() binary searches the ordered lines and looks the appended ones up in
+an index of the file's tail, which each process extends by reading only the lines appended since it last looked.
+Files from before the header (layout 1, one line per ticket and no quantity) and from before the ordered count
+(layout 2) are still read, and are rewritten in the current layout the first time orders are appended or replaced.
+"""
+import mmap
+import os
+import pickle
+import struct
+from contextlib import contextmanager
+from datetime import date
+from business_model import Status
+
+MAGIC = b"ALOL"
+HEADER = struct.Struct("<4sIQ")  # MAGIC, layout version, lines from the start in order_id order
+VERSION = 3
+HEADERS = {2: struct.Struct("<4sI"), VERSION: HEADER}  # Layout 1 files have no header
+ORDERED = struct.Struct("<Q")  # The ordered line count, at the end of the current header
+# order id, customer code (0 = no customer), date ordinal, ticket-type code, status, pad, unit price, discount %, order total, quantity
+LINE = struct.Struct("<QIiHBxdddI")
+LINES = {1: struct.Struct("<QIiHBxddd"), 2: LINE, VERSION: LINE}
+NO_TICKET = 0xFFFF
+TICKET_FIELDS = ("ticket_type", "description", "validity", "limitations")
+
+
+class OrderLineFile:
+    def __init__(self, filepath, dictionary_path):
+        self.filepath = filepath
+        self.dictionary_path = dictionary_path
+        self.__customers = []  # code - 1 -> username
+        self.__ticket_types = []  # code -> (ticket_type, description, validity, limitations)
+        self.__customer_codes = {}
+        self.__ticket_codes = {}
+        self.__dictionary_dirty = False
+        self.__dictionary_version = None  # (inode, size, mtime) of the dictionary file last read or written
+        self.__tail = {}  # order_id -> first line, of the lines past the ordered ones read so far
+        self.__tail_file = None  # (inode, ordered line count) of the file the tail index was read from
+        self.__tail_lines = 0  # Lines of that file read into the tail index
+        self.refresh_dictionary()
+
+    # String Dictionary
+    def refresh_dictionary(self):
+        """Re-read the dictionary when another process has grown it, so its codes resolve and new ones do not collide."""
+        if not os.path.exists(self.dictionary_path):
+            return
+        version = self.__stat_dictionary()
+        if version == self.__dictionary_version:
+            return
+        with open(self.dictionary_path, 'rb') as file:
+            dictionary = pickle.load(file)
+        self.__customers, self.__customer_codes = [], {}
+        self.__ticket_types, self.__ticket_codes = [], {}
+        for username in dictionary["customers"]:
+            self.__customer_codes[username] = len(self.__customers) + 1
+            self.__customers.append(username)
+        for entry in dictionary["ticket_types"]:
+            self.__ticket_codes[entry] = len(self.__ticket_types)
+            self.__ticket_types.append(entry)
+        self.__dictionary_version = version
+
+    def __stat_dictionary(self):
+        stat = os.stat(self.dictionary_path)
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def customer_code(self, username):
+        if username is None:
+            return 0
+        if username not in self.__customer_codes:
+            self.__customers.append(username)
+            self.__customer_codes[username] = len(self.__customers)
+            self.__dictionary_dirty = True
+        return self.__customer_codes[username]
+
+    def ticket_code(self, ticket):
+        entry = tuple(ticket[field] for field in TICKET_FIELDS)
+        if entry not in self.__ticket_codes:
+            self.__ticket_codes[entry] = len(self.__ticket_types)
+            self.__ticket_types.append(entry)
+            self.__dictionary_dirty = True
+        return self.__ticket_codes[entry]
+
+    def username(self, code):
+        return self.__customers[code - 1] if code else None
+
+    def ticket_type(self, code):
+        return self.__ticket_types[code][0]
+
+    def ticket_types(self):
+        return [entry[0] for entry in self.__ticket_types]
+
+    def save_dictionary(self):
+        # The dictionary only ever grows, so writing it before the lines keeps every code resolvable after a crash
+        tmp = self.dictionary_path + ".tmp"
+        with open(tmp, 'wb') as file:
+            pickle.dump({"customers": self.__customers, "ticket_types": self.__ticket_types}, file)
+        os.replace(tmp, self.dictionary_path)
+        self.__dictionary_dirty = False
+        self.__dictionary_version = self.__stat_dictionary()
+
+    # Writing
+    def encode(self, order):
+        """Pack one raw order record into its fixed-width lines."""
+        head = (order["order_id"] or 0, self.customer_code(order.get("username")), order["purchase_date"].toordinal())
+        status, total = Status[order["status"]].value, order["total_price"]
+        if not order["tickets"]:
+            return LINE.pack(*head, NO_TICKET, status, 0.0, 0.0, total, 0)
+        return b"".join(LINE.pack(*head, self.ticket_code(ticket), status, ticket["price"], ticket.get("discount", 0), total,
+                                  ticket.get("quantity", 1))
+                        for ticket in order["tickets"])
+
+    def write(self, orders):
+        """Replace the file with the given raw order records."""
+        self.refresh_dictionary()
+        # Sorted by id, so get() can binary search every line until orders are appended out of order
+        lines = b"".join(self.encode(order) for order in sorted(orders, key=lambda order: order["order_id"] or 0))
+        self.save_dictionary()
+        tmp = self.filepath + ".tmp"
+        with open(tmp, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, VERSION, len(lines) // LINE.size) + lines)
+        os.replace(tmp, self.filepath)
+
+    def append(self, *orders):
+        """Append the lines of one or more new orders in a single write."""
+        if self.version() != VERSION:
+            self.write(list(self.iter_orders()))  # Once, for a file in an older layout
+        self.refresh_dictionary()  # Writers hold the data layer's process lock, so no one else assigns codes meanwhile
+        lines = b"".join(self.encode(order) for order in orders)
+        if self.__dictionary_dirty:
+            self.save_dictionary()
+        with open(self.filepath, 'ab') as file:
+            if file.tell() == 0:
+                file.write(HEADER.pack(MAGIC, VERSION, 0))
+            file.write(lines)
+        self.__extend_ordered(lines)
+
+    def __extend_ordered(self, appended):
+        # Count lines appended in id order after an all-ordered file as ordered too, so a single writer never needs the
+        # tail index. The count only grows after the lines are on disk, so a crash in between leaves it short, not wrong.
+        ids = [line[0] for line in LINE.iter_unpack(appended)]
+        with open(self.filepath, 'r+b') as file:
+            header = HEADER.unpack(file.read(HEADER.size))
+            count = (os.fstat(file.fileno()).st_size - HEADER.size) // LINE.size
+            if header[2] != count - len(ids) or ids != sorted(ids):
+                return
+            if header[2]:
+                file.seek(HEADER.size + (header[2] - 1) * LINE.size)
+                if LINE.unpack(file.read(LINE.size))[0] > ids[0]:
+                    return
+            file.seek(HEADER.size - ORDERED.size)
+            file.write(ORDERED.pack(count))
+
+    def replace(self, order):
+        """
+        Overwrite the stored order with the same order_id. Lines are fixed-width, so an order that keeps its number of
+        lines (a status change, a rename) is patched in place; otherwise the file is rewritten. Returns False when the
+        order is not stored.
+        """
+        if self.version() != VERSION:
+            self.write(list(self.iter_orders()))
+        self.refresh_dictionary()
+        lines = self.encode(order)
+        with self.__mapped() as (view, version, ordered):
+            first, count = self.__find(view, version, ordered, order["order_id"])
+        if count == 0:
+            return False
+        if count != len(lines) // LINE.size:
+            self.write([order if stored["order_id"] == order["order_id"] else stored for stored in self.iter_orders()])
+            return True
+        if self.__dictionary_dirty:
+            self.save_dictionary()
+        with open(self.filepath, 'r+b') as file:
+            file.seek(HEADER.size + first * LINE.size)
+            file.write(lines)
+        return True
+
+    # Reading
+    @staticmethod
+    def read_version(head):
+        """Line layout of a file starting with the bytes head (the current one for an empty file)."""
+        if len(head) >= HEADERS[2].size and head[:len(MAGIC)] == MAGIC:
+            return HEADERS[2].unpack(head[:HEADERS[2].size])[1]
+        return 1 if head else VERSION
+
+    def version(self):
+        if not os.path.exists(self.filepath):
+            return VERSION
+        with open(self.filepath, 'rb') as file:
+            return self.read_version(file.read(HEADER.size))
+
+    @contextmanager
+    def lines(self):
+        """
+        Zero-copy view of the records and their layout version; only the pages a reader touches are read from
+        disk. The version is read from the mapped file itself, so a concurrent rewrite cannot mismatch them.
+        """
+        with self.__mapped() as (view, version, _):
+            yield view, version
+
+    @contextmanager
+    def __mapped(self):
+        # lines() with the number of lines from the start that are in order_id order (none in older layouts)
+        if not os.path.exists(self.filepath) or os.path.getsize(self.filepath) == 0:
+            self.__tail_file = None
+            yield memoryview(b""), VERSION, 0
+            return
+        with open(self.filepath, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            whole = memoryview(mapped)
+            version = self.read_version(whole[:HEADER.size].tobytes())
+            start = HEADERS[version].size if version != 1 else 0
+            ordered = HEADER.unpack(whole[:HEADER.size])[2] if version == VERSION else 0
+            line = LINES[version]
+            view = whole[start:len(whole) - (len(whole) - start) % line.size]  # Ignore a line torn by a crash during append
+            if self.__tail_file != (os.fstat(file.fileno()).st_ino, ordered):
+                # Another file, or a grown ordered count: the tail index is read again from the new end of the ordered lines
+                self.__tail_file = (os.fstat(file.fileno()).st_ino, ordered)
+                self.__tail, self.__tail_lines = {}, ordered
+            try:
+                yield view, version, min(ordered, len(view) // line.size)
+            finally:
+                view.release()
+                whole.release()
+
+    def __len__(self):
+        """Number of lines (not orders) in the file."""
+        with self.lines() as (view, version):
+            return len(view) // LINES[version].size
+
+    def line(self, view, index, version=VERSION):
+        line = LINES[version]
+        return line.unpack(view[index * line.size:(index + 1) * line.size])
+
+    def decode(self, lines):
+        """Turn the unpacked lines of one order back into its raw record."""
+        order_id, customer, ordinal, _, status, _, _, total = lines[0][:8]
+        if customer > len(self.__customers) or any(line[3] != NO_TICKET and line[3] >= len(self.__ticket_types) for line in lines):
+            self.refresh_dictionary()  # Appended by another process after this one last read the dictionary
+        tickets = []
+        for line in lines:
+            if line[3] == NO_TICKET:
+                continue
+            ticket = dict(zip(TICKET_FIELDS, self.__ticket_types[line[3]]), price=line[5])
+            if line[6]:
+                ticket["discount"] = line[6]
+            if len(line) > 8 and line[8] != 1:
+                ticket["quantity"] = line[8]  # Layout 1 lines are one ticket each
+            tickets.append(ticket)
+        return {"order_id": order_id, "username": self.username(customer), "purchase_date": date.fromordinal(ordinal),
+                "status": Status(status).name, "total_price": total, "tickets": tickets}
+
+    def iter_orders(self, username=None, purchase_date=None):
+        """Yield raw order records one at a time, optionally only those of one customer and/or day."""
+        self.refresh_dictionary()
+        customer = self.__customer_codes.get(username) if username is not None else None
+        if username is not None and customer is None:
+            return
+        ordinal = purchase_date.toordinal() if purchase_date is not None else None
+        with self.lines() as (view, version):
+            current = []
+            for line in LINES[version].iter_unpack(view):
+                if current and line[0] != current[0][0]:
+                    yield self.decode(current)
+                    current = []
+                if (customer is None or line[1] == customer) and (ordinal is None or line[2] == ordinal):
+                    current.append(line)
+            if current:
+                yield self.decode(current)
+
+    def get(self, order_id):
+        """
+        One order: a binary search of the ordered lines, which touches O(log n) pages, then the tail index of the
+        lines appended after them.
+        """
+        self.refresh_dictionary()
+        with self.__mapped() as (view, version, ordered):
+            first, count = self.__find(view, version, ordered, order_id)
+            lines = [self.line(view, index, version) for index in range(first, first + count)]
+        return self.decode(lines) if lines else None
+
+    def __find(self, view, version, ordered, order_id):
+        # (first line, number of lines) of an order, (0, 0) when it is not stored
+        total = len(view) // LINES[version].size
+        low, high = 0, ordered
+        while low < high:
+            middle = (low + high) // 2
+            if self.line(view, middle, version)[0] < order_id:
+                low = middle + 1
+            else:
+                high = middle
+        if low == ordered or self.line(view, low, version)[0] != order_id:
+            # Not among the ordered lines; read the lines appended since the tail index was last extended
+            previous = self.line(view, self.__tail_lines - 1, version)[0] if self.__tail_lines > ordered else None
+            for index in range(self.__tail_lines, total):
+                line_id = self.line(view, index, version)[0]
+                if line_id != previous:
+                    self.__tail.setdefault(line_id, index)
+                    previous = line_id
+            self.__tail_lines = total
+            low = self.__tail.get(order_id)
+            if low is None:
+                return 0, 0
+        first = low
+        while low < total and self.line(view, low, version)[0] == order_id:
+            low += 1
+        return first, low - first
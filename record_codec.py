@@ -0,0 +1,188 @@
+"""
+Schema-driven compact encoding of entity records.
+
+Each entity's record layout is declared once (SCHEMAS). From a declaration, Schema generates an encoder that turns a
+raw record (the dicts DataLayer builds) into a positional tuple and a decoder that turns the tuple back, so an entity
+file stores only the values instead of repeating every field name in every record. Dates are stored as ordinals and
+nested records as tuples of their own schema. A shared nested schema (ticket lines, which repeat across thousands of
+orders) is stored once per distinct record in a table at the head of the file, and rows refer to it by index.
+
+An encoded file is HEADER (MAGIC and the format version) followed by a pickle of (entity, layout, tables, rows), where
+layout lists the fields the rows were written with. Rows written under an older layout are decoded by that layout, so
+adding a field with a default does not invalidate existing files; readers fill the default in as they do for old pickles.
+
+    data = dumps("orders", records)
+    records = loads(data)
+"""
+import pickle
+import struct
+from datetime import date
+
+MAGIC = b"ALEC"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sH")  # MAGIC, format version
+REQUIRED = object()  # Default of a field every record must have
+
+
+class Field:
+    """
+    One field of a record. kind is "value" (stored as is), "date" (stored as its ordinal) or a nested Schema for a
+    list of records. A field with omit_default is left out of decoded records that hold the default.
+    """
+    def __init__(self, name, kind="value", default=REQUIRED, omit_default=False):
+        self.name = name
+        self.kind = kind
+        self.default = () if default is REQUIRED and isinstance(kind, Schema) else default
+        self.omit_default = omit_default
+
+    def layout(self):
+        kind = ("schema", self.kind.name, self.kind.shared, self.kind.layout()) if isinstance(self.kind, Schema) else self.kind
+        return (self.name, kind, None if self.default is REQUIRED else self.default, self.default is REQUIRED, self.omit_default)
+
+
+class Schema:
+    """
+    The declared fields of one record type, with the encode and decode functions generated from them. Records of a
+    shared schema nested in another are stored in the file's table for that schema; decoding copies them (shallowly),
+    so the records handed out are never the same dict.
+    """
+    def __init__(self, name, fields, shared=False):
+        self.name = name
+        self.fields = tuple(fields)
+        self.shared = shared
+        self.names = frozenset(field.name for field in self.fields)
+        self.encode, self.decode = self.__generate()
+
+    @classmethod
+    def from_layout(cls, name, layout, shared=False):
+        """The schema a file was written with, rebuilt from the layout stored in it."""
+        fields = []
+        for field_name, kind, default, required, omit_default in layout:
+            if isinstance(kind, tuple):
+                kind = cls.from_layout(kind[1], kind[3], kind[2])
+            fields.append(Field(field_name, kind, REQUIRED if required else default, omit_default))
+        return cls(name, fields, shared)
+
+    def layout(self):
+        return tuple(field.layout() for field in self.fields)
+
+    def tables(self):
+        """name -> Schema of every shared schema nested in this one."""
+        tables = {}
+        for field in self.fields:
+            if isinstance(field.kind, Schema):
+                tables.update(field.kind.tables())
+                if field.kind.shared:
+                    tables[field.kind.name] = field.kind
+        return tables
+
+    def __generate(self):
+        # Straight-line code per schema: one tuple or dict display per record, with no loop over the fields
+        namespace = {"date_ordinal": date_ordinal, "fromordinal": date.fromordinal, "names": self.names, "schema": self.name}
+        values, items, optional, tables = [], [], [], []
+        for index, field in enumerate(self.fields):
+            namespace[f"default{index}"] = field.default
+            value = f"record[{field.name!r}]" if field.default is REQUIRED else f"record.get({field.name!r}, default{index})"
+            row_value = f"row[{index}]"
+            if field.kind == "date":
+                value, row_value = f"date_ordinal({value})", f"(fromordinal({row_value}) if {row_value} is not None else None)"
+            elif isinstance(field.kind, Schema) and field.kind.shared:
+                namespace[f"encode{index}"] = field.kind.encode
+                tables.append(f"    table{index} = tables[{field.kind.name!r}]\n")
+                value = f"tuple([table{index}.setdefault(encode{index}(item, tables), len(table{index})) for item in {value}])"
+                row_value = f"([*map(dict, map(table{index}.__getitem__, {row_value}))] if {row_value} else [])"
+            elif isinstance(field.kind, Schema):
+                namespace[f"encode{index}"], namespace[f"decode{index}"] = field.kind.encode, field.kind.decode
+                value = f"tuple([encode{index}(item, tables) for item in {value}])"
+                row_value = f"[decode{index}(item, tables) for item in {row_value}]"
+            values.append(value)
+            if field.omit_default:
+                optional.append(f"    if row[{index}] != default{index}:\n        record[{field.name!r}] = {row_value}\n")
+            else:
+                items.append(f"{field.name!r}: {row_value}")
+        source = (
+            "def encode(record, tables):\n"
+            "    if not record.keys() <= names:\n"
+            "        raise ValueError(f'{schema} record has undeclared fields: {sorted(set(record) - names)}')\n"
+            + "".join(tables) +
+            f"    return ({', '.join(values)},)\n"
+            "def decode(row, tables):\n"
+            + "".join(tables) +
+            f"    record = {{{', '.join(items)}}}\n"
+            + "".join(optional) +
+            "    return record\n"
+        )
+        exec(compile(source, f"<{self.name} schema>", "exec"), namespace)
+        return namespace["encode"], namespace["decode"]
+
+
+def date_ordinal(value):
+    return value.toordinal() if value is not None else None
+
+
+# Entity Schemas
+# Catalog tickets and the ticket lines of orders, accounts and carts share one layout
+TICKET = Schema("ticket", [
+    Field("ticket_type"), Field("description"), Field("price"), Field("validity"), Field("limitations"),
+    Field("discount", default=0), Field("quantity", default=1, omit_default=True),
+], shared=True)
+SCHEMAS = {
+    "customers": Schema("customers", [
+        Field("username"), Field("password"), Field("email"), Field("purchase_date", "date"),
+        Field("tickets", TICKET), Field("cart", TICKET),
+    ]),
+    "orders": Schema("orders", [
+        Field("order_id", default=None), Field("username", default=None), Field("purchase_date", "date"),
+        Field("status"), Field("total_price"), Field("tickets", TICKET),
+    ]),
+    "admins": Schema("admins", [Field("admin_id"), Field("password"), Field("email", default=""), Field("order_ids", default=())]),
+    "tickets": TICKET,  # The catalog itself is stored row by row; sharing only applies to nested records
+    "sales": Schema("sales", [Field("purchase_date", "date"), Field("ticket_count"), Field("ticket_types"), Field("total_price")]),
+}
+__schemas = {}  # (entity, layout) -> Schema, for the layouts files were written with
+
+
+# Files
+def is_encoded(data):
+    return data[:len(MAGIC)] == MAGIC
+
+
+def dumps(entity, records):
+    """Encode an entity's raw records into the bytes of an entity file."""
+    schema = SCHEMAS[entity]
+    encode = schema.encode
+    tables = {name: {} for name in schema.tables()}  # encoded record -> index, in first-seen order
+    rows = [encode(record, tables) for record in records]
+    return HEADER.pack(MAGIC, FORMAT_VERSION) + pickle.dumps(
+        (entity, schema.layout(), {name: list(table) for name, table in tables.items()}, rows), protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def loads(data, match=None):
+    """
+    Decode the bytes of an entity file back into raw records; raises ValueError for a format from a newer version.
+    With match ({field: value} of plain value fields) only the records holding those values are decoded.
+    """
+    _, version = HEADER.unpack_from(data)
+    if version > FORMAT_VERSION:
+        raise ValueError(f"Entity file format {version} is newer than this version reads ({FORMAT_VERSION}).")
+    entity, layout, tables, rows = pickle.loads(memoryview(data)[HEADER.size:])
+    schema = schema_of(entity, layout)
+    if match:
+        positions = {field.name: index for index, field in enumerate(schema.fields) if field.kind == "value"}
+        if not match.keys() <= positions.keys():
+            raise ValueError(f"{entity} records cannot be matched on {sorted(set(match) - set(positions))}")
+        checks = [(positions[name], value) for name, value in match.items()]
+        rows = [row for row in rows if all(row[index] == value for index, value in checks)]
+    nested = schema.tables()
+    tables = {name: [nested[name].decode(entry, {}) for entry in entries] for name, entries in tables.items()}
+    decode = schema.decode
+    return [decode(row, tables) for row in rows]
+
+
+def schema_of(entity, layout):
+    schema = __schemas.get((entity, layout))
+    if schema is None:
+        current = SCHEMAS.get(entity)
+        schema = current if current is not None and current.layout() == layout else Schema.from_layout(entity, layout)
+        __schemas[(entity, layout)] = schema
+    return schema
@@ -0,0 +1,33 @@
+"""
+Re-shard the customer accounts of an existing dataset.
+
+Splits customers.pkl (or the current shard files) into the given number of shard files by username
+hash, or merges them back into customers.pkl with 1. App processes sharing the files may keep running;
+they re-read the customers in the new layout on their next call.
+
+    python reshard_customers.py 16
+    python reshard_customers.py 1 --data-dir /srv/adventure_land
+"""
+import argparse
+import data_layer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-shard the customer accounts of an existing dataset.")
+    parser.add_argument("shards", type=int, help="Number of customer shard files (1 for a single customers.pkl)")
+    parser.add_argument("--data-dir", help="Directory holding the data files (DATA_LAYER_PATH or the current directory by default)")
+    parser.add_argument("--backend", default="pickle", choices=("pickle", "binary"))
+    args = parser.parse_args()
+    if args.data_dir:
+        data_layer.BASE_PATH = args.data_dir  # get_filepath reads it on every call
+    layer = data_layer.DataLayer(backend=args.backend)
+    try:
+        moved = layer.reshard_customers(args.shards)
+    except ValueError as e:
+        parser.error(str(e))
+    sizes = [sum(1 for _ in layer.backend.load_shard(index)) for index in range(layer.backend.customer_shards())]
+    print(f"Wrote {moved} customers into {len(sizes)} shard(s): {', '.join(map(str, sizes))}")
+
+
+if __name__ == "__main__":
+    main()
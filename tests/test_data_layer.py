@@ -0,0 +1,52 @@
+import os
+import sys
+import unittest
+from tempfile import TemporaryDirectory
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import data_layer  # noqa: E402
+from booking_engine import BookingEngine  # noqa: E402
+from business_model import Status  # noqa: E402
+
+
+class LogModeOrderSaveTest(unittest.TestCase):
+    """An order placed since the last compaction lives only in the log; a save of its change must survive a restart."""
+
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.base_path = data_layer.BASE_PATH  # get_filepath reads it on every call
+
+    def tearDown(self):
+        data_layer.BASE_PATH = self.base_path
+        self.directory.cleanup()
+
+    def start(self, backend):
+        engine = BookingEngine(data_layer.DataLayer(log_mode=True, backend=backend))
+        engine.start()
+        return engine
+
+    def test_status_change_saved_with_save_all_survives_restart(self):
+        for backend in ("pickle", "binary", "framed", "sqlite"):
+            with self.subTest(backend=backend):
+                data_layer.BASE_PATH = os.path.join(self.directory.name, backend)
+                os.makedirs(data_layer.BASE_PATH)
+                engine = self.start(backend)
+                engine.signup(f"{backend}1", "secret1", f"{backend}@example.com")
+                token = engine.login(f"{backend}1", "secret1")["token"]
+                order_ids = []
+                for _ in range(2):  # The second order stays unchanged, so save_all saves only the first one
+                    engine.add_to_cart(token, "Child Ticket", 1)
+                    order_ids.append(engine.checkout(token, "Credit Card", "123456789012", "12/30", "123")["order_id"])
+                engine.data["orders"].get(order_ids[0]).set_status(Status.Cancelled)
+                engine.data_layer.save_all(engine.data)
+                engine.close()
+
+                engine = self.start(backend)
+                token = engine.login(f"{backend}1", "secret1")["token"]
+                history = {order["order_id"]: order["status"] for order in engine.order_history(token)}
+                engine.close()
+                self.assertEqual(history, {order_ids[0]: Status.Cancelled.name, order_ids[1]: Status.Paid.name})
+
+
+if __name__ == "__main__":
+    unittest.main()
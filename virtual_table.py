@@ -0,0 +1,127 @@
+"""
+Virtualized table widget.
+
+VirtualTable shows any sequence of items (a list, an order history, the daily sales rows) in a
+ttk.Treeview that only ever holds the rows that fit on screen. Scrolling moves a window over the
+sequence and re-fills those few rows, so the widget count stays constant however many items there are.
+"""
+import tkinter as tk
+from tkinter import ttk
+
+
+class Column:
+    """A table column: heading, width, how to display an item and how to sort by it."""
+    def __init__(self, heading, text, sort_key=None, width=150, anchor="w"):
+        self.heading = heading
+        self.text = text  # item -> displayed string
+        self.sort_key = sort_key  # item -> comparable value (None disables sorting on this column)
+        self.width = width
+        self.anchor = anchor
+
+
+class VirtualTable(tk.Frame):
+    def __init__(self, parent, columns, items, height=15, **kwargs):
+        super().__init__(parent, **kwargs)
+        self.columns = columns
+        self.items = items  # Any sequence; rows are formatted only when they scroll into view
+        self.height = height
+        self.offset = 0
+        self.order = None  # Row permutation for the active sort (None keeps the source order)
+        self.sort_column = None
+        self.descending = False
+        self.sort_keys = {}  # column index -> precomputed key per item
+
+        self.tree = ttk.Treeview(self, columns=[str(i) for i in range(len(columns))], show="headings",
+                                 height=height, selectmode="browse")
+        for index, column in enumerate(columns):
+            command = (lambda i=index: self.sort_by(i)) if column.sort_key else ""
+            self.tree.heading(str(index), text=column.heading, command=command)
+            self.tree.column(str(index), width=column.width, anchor=column.anchor, stretch=True)
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.on_scroll)
+        self.tree.grid(row=0, column=0, sticky="nsew")
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+        self.grid_columnconfigure(0, weight=1)
+
+        # A fixed pool of rows that are re-filled as the window moves
+        for row in range(min(height, len(items))):
+            self.tree.insert("", "end", iid=str(row))
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.tree.bind(sequence, self.on_mousewheel)
+        self.tree.bind("<Up>", lambda event: self.on_arrow(-1))
+        self.tree.bind("<Down>", lambda event: self.on_arrow(1))
+        self.tree.bind("<Prior>", lambda event: self.on_key(-height))
+        self.tree.bind("<Next>", lambda event: self.on_key(height))
+        self.render()
+
+    def __len__(self):
+        return len(self.items)
+
+    def item_at(self, position):
+        """Source item shown at a position of the (possibly sorted) table."""
+        return self.items[self.order[position] if self.order is not None else position]
+
+    def selected_item(self):
+        selection = self.tree.selection()
+        if not selection:
+            return None
+        return self.item_at(self.offset + int(selection[0]))
+
+    # Rendering
+    def render(self):
+        visible = min(self.height, len(self.items))
+        for row in range(visible):
+            item = self.item_at(self.offset + row)
+            self.tree.item(str(row), values=[column.text(item) for column in self.columns])
+        if self.items:
+            self.scrollbar.set(self.offset / len(self.items), (self.offset + visible) / len(self.items))
+        else:
+            self.scrollbar.set(0, 1)
+
+    def scroll_to(self, offset):
+        offset = max(0, min(offset, len(self.items) - self.height))
+        if offset != self.offset:
+            self.offset = offset
+            self.render()
+
+    # Scrolling
+    def on_scroll(self, action, amount, unit=None):
+        if action == "moveto":
+            self.scroll_to(int(float(amount) * len(self.items)))
+        elif action == "scroll":
+            step = self.height if unit == "pages" else 1
+            self.scroll_to(self.offset + int(amount) * step)
+
+    def on_mousewheel(self, event):
+        if event.num == 4 or event.delta > 0:
+            self.scroll_to(self.offset - 3)
+        else:
+            self.scroll_to(self.offset + 3)
+        return "break"
+
+    def on_key(self, rows):
+        self.scroll_to(self.offset + rows)
+        return "break"
+
+    def on_arrow(self, rows):
+        # Inside the window the Treeview moves the selection itself; at its edges the data slides instead
+        selection = self.tree.selection()
+        row = int(selection[0]) if selection else 0
+        if 0 <= row + rows < min(self.height, len(self.items)):
+            return None
+        return self.on_key(rows)
+
+    # Sorting
+    def sort_by(self, index):
+        if index not in self.sort_keys:
+            # Keys are computed once per column; later sorts on it only compare the precomputed values
+            key = self.columns[index].sort_key
+            self.sort_keys[index] = [key(item) for item in self.items]
+        self.descending = not self.descending if self.sort_column == index else False
+        self.sort_column = index
+        keys = self.sort_keys[index]
+        self.order = sorted(range(len(self.items)), key=keys.__getitem__, reverse=self.descending)
+        for position, column in enumerate(self.columns):
+            arrow = (" ▼" if self.descending else " ▲") if position == index else ""
+            self.tree.heading(str(position), text=column.heading + arrow)
+        self.offset = 0
+        self.render()